@@ -0,0 +1,132 @@
+"""
+Compares the schema-driven cleaning step with the per-column coercion loop it replaced.
+
+The loop is kept here as a reference implementation. For every size the script
+times the numeric parse alone and the whole clean (parse, compact schema and floor
+ranks), and reports the peak Python heap (tracemalloc) and the peak growth of the
+Arrow memory pool (sampled every millisecond), which tracemalloc does not see. Example:
+
+    python -m benchmarks.clean_parse --sizes 100000,1000000 --chunk-rows 250000
+"""
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pandas as pd
+import pyarrow as pa
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.data_loader import (CLEAN_CHUNK_ROWS, NUMERIC_SOURCE_COLS, NO_VALID_ROWS_MESSAGE, apply_compact_schema,
+                               clean_source_data, parse_source_rows)
+from utils.floor_layout import add_floor_ranks
+
+
+def legacy_parse_source_rows(df_raw):
+    """The replaced parse: one str.replace + pd.to_numeric per numeric column, rejects only counted."""
+    parsed_columns = {}
+    for col in df_raw.columns:
+        values = df_raw[col]
+        if col in NUMERIC_SOURCE_COLS:
+            if not pd.api.types.is_numeric_dtype(values):
+                values = values.astype(str).str.replace(',', '.', regex=False)
+            values = pd.to_numeric(values, errors='coerce')
+        parsed_columns[col] = values
+    df_parsed = pd.DataFrame(parsed_columns, index=df_raw.index)
+    numeric_cols = [col for col in NUMERIC_SOURCE_COLS if col in df_parsed.columns]
+    return df_parsed, df_parsed[numeric_cols].notna().all(axis=1).to_numpy()
+
+
+def legacy_clean(df_raw):
+    df_parsed, valid_mask = legacy_parse_source_rows(df_raw)
+    df_parsed = df_parsed[valid_mask]
+    if df_parsed.empty:
+        return None, NO_VALID_ROWS_MESSAGE
+    return add_floor_ranks(apply_compact_schema(df_parsed)), None
+
+
+def _sample_arrow_peak(stop_event, baseline, peak):
+    pool = pa.default_memory_pool()
+    while not stop_event.wait(0.001):
+        peak[0] = max(peak[0], pool.bytes_allocated() - baseline)
+
+
+def measure_peak_memory(stage_fn):
+    """
+    Runs stage_fn once and returns its peak Python heap and peak Arrow pool growth, in bytes.
+
+    Returns:
+        tuple: (python_peak_bytes, arrow_peak_bytes, result of stage_fn).
+    """
+    # The pool's own max_memory() is a process-wide high-water mark, so the stage's peak is sampled instead
+    stop_event, arrow_peak = threading.Event(), [0]
+    sampler = threading.Thread(target=_sample_arrow_peak,
+                               args=(stop_event, pa.default_memory_pool().bytes_allocated(), arrow_peak))
+    sampler.start()
+    tracemalloc.start()
+    try:
+        result = stage_fn()
+        _, python_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        stop_event.set()
+        sampler.join()
+    return python_peak, arrow_peak[0], result
+
+
+def measure(stage_fn, repeat):
+    """Returns min / median seconds over repeat runs and the peaks of one extra traced run."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage_fn()
+        timings.append(time.perf_counter() - start)
+    python_peak, arrow_peak, _ = measure_peak_memory(stage_fn)
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'python_peak_mb': python_peak / 1e6,
+        'arrow_peak_mb': arrow_peak / 1e6,
+    }
+
+
+def run_size(n_rows, repeat, chunk_rows, seed):
+    df_raw = generate_rent_roll(n_rows, seed=seed)
+    results = {
+        'parse_legacy': measure(lambda: legacy_parse_source_rows(df_raw), repeat),
+        'parse_schema': measure(lambda: parse_source_rows(df_raw), repeat),
+        'clean_legacy': measure(lambda: legacy_clean(df_raw), repeat),
+        'clean_schema': measure(lambda: clean_source_data(df_raw, chunk_rows=chunk_rows), repeat),
+    }
+    legacy_rows = len(legacy_clean(df_raw)[0])
+    df_base, _, reject_report = clean_source_data(df_raw, chunk_rows=chunk_rows)
+    results['rows'] = {'in': n_rows, 'kept_legacy': legacy_rows, 'kept_schema': len(df_base),
+                       'rejected': reject_report['rejected']}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the schema-driven cleaning against the per-column loop.")
+    parser.add_argument('--sizes', default='100000,1000000', help="Comma-separated row counts (default: %(default)s).")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage (default: %(default)s).")
+    parser.add_argument('--chunk-rows', type=int, default=CLEAN_CHUNK_ROWS, help="Rows parsed at a time (default: %(default)s).")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for n_rows in (int(size) for size in args.sizes.split(',') if size.strip()):
+        results[str(n_rows)] = size_results = run_size(n_rows, args.repeat, args.chunk_rows, args.seed)
+        for stage in ('parse', 'clean'):
+            legacy, schema = size_results[f'{stage}_legacy'], size_results[f'{stage}_schema']
+            print(f"{n_rows:>9,} rows {stage:<5}: {legacy['seconds_median']:.2f}s -> {schema['seconds_median']:.2f}s "
+                  f"(x{legacy['seconds_median'] / schema['seconds_median']:.1f})", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
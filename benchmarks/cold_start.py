@@ -0,0 +1,136 @@
+"""
+Measures cold-start latency against local stub endpoints for the VCB rates and the rent roll.
+
+Both stubs answer after a fixed delay, standing in for the VCB and Google Sheets
+round-trips. The script compares loading them one after the other (the old cold
+path), concurrently, and after a CacheWarmer pass (what a user sees once the
+server has pre-warmed). Example:
+
+    python -m benchmarks.cold_start --latency 0.8 --rows 20000
+"""
+import argparse
+import io
+import json
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pandas as pd
+import requests
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.cache_warmer import CacheWarmer, run_concurrently
+from utils.data_loader import clean_base_data
+from utils.data_sources import SOURCE_COLUMNS
+from utils.fx_provider import FxRateProvider
+
+STUB_FX_XML = """<?xml version="1.0" encoding="utf-8"?>
+<ExrateList>
+  <DateTime>{timestamp}</DateTime>
+  <Exrate CurrencyCode="USD" CurrencyName="US DOLLAR" Buy="25,180.00" Transfer="25,210.00" Sell="25,450.00" />
+</ExrateList>"""
+
+
+def start_stub_server(payloads, latency_seconds):
+    """
+    Serves payloads ({path: (content_type, bytes)}) on a local port after latency_seconds.
+
+    Returns:
+        tuple: (server, base_url); call server.shutdown() when done.
+    """
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency_seconds)
+            content_type, body = payloads.get(self.path, ('text/plain', b''))
+            self.send_response(200 if self.path in payloads else 404)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class StubSheetSource:
+    """Reads the rent roll as CSV from the stub server, like GSheetsSource does over the network."""
+
+    def __init__(self, url):
+        self.url = url
+        self.source_id = f"stub:{url}"
+
+    def change_token(self, max_age_seconds=None):
+        return self.source_id
+
+    def read(self):
+        response = requests.get(self.url, timeout=30)
+        response.raise_for_status()
+        return pd.read_csv(io.BytesIO(response.content))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold-start loading against local stub endpoints.")
+    parser.add_argument('--latency', type=float, default=0.5, help="Stub response delay in seconds (default: %(default)s).")
+    parser.add_argument('--rows', type=int, default=5_000, help="Rent roll rows served by the stub (default: %(default)s).")
+    args = parser.parse_args(argv)
+
+    rent_roll_csv = generate_rent_roll(args.rows)[SOURCE_COLUMNS].to_csv(index=False).encode('utf-8')
+    fx_xml = STUB_FX_XML.format(timestamp=datetime.now().strftime("%m/%d/%Y %I:%M:%S %p")).encode('utf-8')
+    server, base_url = start_stub_server({
+        '/fx.xml': ('text/xml', fx_xml),
+        '/sheet.csv': ('text/csv', rent_roll_csv),
+    }, args.latency)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def new_provider():
+            # A fresh cache path per run keeps every provider cold
+            return FxRateProvider(f"{base_url}/fx.xml", cache_path=str(Path(cache_dir) / f"fx_{time.perf_counter_ns()}.json"))
+
+        source = StubSheetSource(f"{base_url}/sheet.csv")
+
+        def load_clean():
+            return clean_base_data(source.read())
+
+        fx_provider = new_provider()
+        results['sequential_s'], _ = timed(lambda: (fx_provider.refresh(), load_clean()))
+
+        fx_provider = new_provider()
+        results['concurrent_s'], _ = timed(lambda: run_concurrently(fx_provider.refresh, load_clean))
+
+        fx_provider = new_provider()
+        warm_state = {}
+
+        def warm():
+            _, (df_base, _) = run_concurrently(fx_provider.refresh, load_clean)
+            warm_state['df_base'] = df_base
+
+        warmer = CacheWarmer(warm, interval_seconds=3600)
+        results['prewarm_s'], _ = timed(warmer.warm_once)
+        # First paint after the pre-warm only reads what the warmer left in memory
+        results['first_paint_after_prewarm_s'], _ = timed(
+            lambda: (fx_provider.get_rate('USD', 'sell'), warm_state['df_base']))
+        results['warmer_error'] = warmer.last_error
+
+    server.shutdown()
+    results.update({'latency_s': args.latency, 'rows': args.rows})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
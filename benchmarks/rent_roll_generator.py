@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from utils.data_loader import CUSTOM_FLOOR_SORT_ORDER
+from utils.data_sources import SOURCE_COLUMNS
+
+# Share of rows given an invalid numeric cell, mimicking hand-edited sheets
+DEFAULT_INVALID_FRACTION = 0.01
+INVALID_CELL_VALUES = np.array(['', 'N/A', '-', 'abc'], dtype=object)
+
+
+def _comma_decimal_strings(values, decimals):
+    """Formats floats the way the sheet exports them, e.g. 1234.5 -> '1234,5'."""
+    return pd.Series(np.round(values, decimals)).map(f"{{:.{decimals}f}}".format).str.replace('.', ',', regex=False).to_numpy(dtype=object)
+
+
+def generate_rent_roll(n_rows, seed=0, invalid_fraction=DEFAULT_INVALID_FRACTION, n_customers=None):
+    """
+    Generates a deterministic synthetic rent roll shaped like the Google Sheet.
+
+    The frame has the 10 source columns, floors from CUSTOM_FLOOR_SORT_ORDER, comma
+    decimal strings for the area and signed-contract USD columns, and a small share
+    of rows with an invalid numeric cell that the cleaning step must drop.
+
+    Args:
+        n_rows (int): Number of contract rows.
+        seed (int): Random seed; the same arguments always give the same frame.
+        invalid_fraction (float): Share of rows given one invalid numeric cell.
+        n_customers (int, optional): Number of distinct tenants (default n_rows // 20, at least 10).
+
+    Returns:
+        pd.DataFrame: The raw frame, as conn.read would return it.
+    """
+    rng = np.random.default_rng(seed)
+    n_customers = n_customers or max(10, n_rows // 20)
+
+    customer_ids = rng.integers(0, n_customers, n_rows)
+    customer_names = np.array([f"Công ty {i:05d}" for i in range(n_customers)], dtype=object)[customer_ids]
+    floors = np.array(CUSTOM_FLOOR_SORT_ORDER, dtype=object)[rng.integers(0, len(CUSTOM_FLOOR_SORT_ORDER), n_rows)]
+    start_years = rng.integers(2018, 2026, n_rows)
+    periods = pd.Series(start_years).map(lambda year: f"01/{year} - 12/{year + 3}").to_numpy(dtype=object)
+
+    sqr = rng.gamma(shape=2.0, scale=120.0, size=n_rows) + 20.0
+    org_fx = np.round(rng.uniform(22500.0, 25500.0, n_rows), 0)
+    org_rental_usd = np.round(rng.uniform(12.0, 40.0, n_rows), 2)
+    org_service_usd = np.round(rng.uniform(4.0, 9.0, n_rows), 2)
+    # A few vacant-rent / free-service contracts, which the metrics ignore for minima and averages
+    org_rental_usd[rng.random(n_rows) < 0.02] = 0.0
+    rental_vnd = np.round(org_rental_usd * org_fx, 0)
+    service_vnd = np.round(org_service_usd * org_fx, 0)
+
+    df_raw = pd.DataFrame({
+        'customer_name': customer_names,
+        'floor': floors,
+        'period': periods,
+        'sqr': _comma_decimal_strings(sqr, 1),
+        'rental_vnd': rental_vnd,
+        'service_vnd': service_vnd,
+        'org_fx': org_fx,
+        'org_rental_usd': _comma_decimal_strings(org_rental_usd, 2),
+        'org_service_usd': _comma_decimal_strings(org_service_usd, 2),
+        'org_total_usd': _comma_decimal_strings(org_rental_usd + org_service_usd, 2),
+    }, columns=SOURCE_COLUMNS)
+
+    n_invalid = int(round(n_rows * invalid_fraction))
+    if n_invalid:
+        invalid_rows = rng.choice(n_rows, size=n_invalid, replace=False)
+        invalid_cols = rng.choice(['sqr', 'org_rental_usd', 'org_total_usd'], size=n_invalid)
+        invalid_values = INVALID_CELL_VALUES[rng.integers(0, len(INVALID_CELL_VALUES), n_invalid)]
+        for col in np.unique(invalid_cols):
+            col_mask = invalid_cols == col
+            df_raw.loc[invalid_rows[col_mask], col] = invalid_values[col_mask]
+    return df_raw
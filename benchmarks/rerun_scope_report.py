@@ -0,0 +1,82 @@
+"""
+Counts how often each stage runs per rerun scope, from a PERF_LOG_PATH JSON-lines log.
+
+Full app runs are logged with scope 'app', with the stages of each fragment nested under
+'fragment:<name>/'; fragment-only reruns (a filter click, an FX scenario submit) are logged
+with scope 'fragment:<name>'. This is a diagnostic for logs of a live server; what the
+fragments execute is checked by tests/test_rerun_scopes.py. Example:
+
+    python -m benchmarks.rerun_scope_report perf.jsonl
+"""
+import argparse
+import json
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# Stages owned by the header (full app run); a fragment rerun must not execute them
+APP_ONLY_STAGES = ('fx', 'load_base', 'load', 'filter_index', 'metrics')
+
+
+def load_runs(log_path):
+    """Reads one run record per non-empty line of the log."""
+    with open(log_path, encoding='utf-8') as log_file:
+        return [json.loads(line) for line in log_file if line.strip()]
+
+
+def count_stages(runs):
+    """
+    Returns the run count and the per-stage execution counts of every scope.
+
+    Returns:
+        dict: scope -> {'runs': int, 'stages': Counter of stage path -> executions}.
+    """
+    report = defaultdict(lambda: {'runs': 0, 'stages': Counter()})
+    for run in runs:
+        scope_report = report[run.get('scope', 'app')]
+        scope_report['runs'] += 1
+        scope_report['stages'].update(stage['stage'] for stage in run['stages'])
+    return dict(report)
+
+
+def fragment_stage_path(run, stage_path):
+    """
+    Returns the stage path relative to the fragment it ran in, or None outside fragments.
+
+    A fragment rerun only executes its fragment; in a full app run the fragment's stages
+    are the ones under 'fragment:<name>/'.
+    """
+    if run.get('scope', 'app').startswith('fragment:'):
+        return stage_path
+    fragment_stage, _, inner_path = stage_path.partition('/')
+    return inner_path if fragment_stage.startswith('fragment:') and inner_path else None
+
+
+def find_scope_leaks(runs):
+    """Lists (run_id, scope, stage) for every app-only stage executed inside a fragment."""
+    leaks = []
+    for run in runs:
+        for stage in run['stages']:
+            inner_path = fragment_stage_path(run, stage['stage'])
+            if inner_path is not None and inner_path.split('/')[0] in APP_ONLY_STAGES:
+                leaks.append((run.get('run_id'), run.get('scope', 'app'), stage['stage']))
+    return leaks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize stage executions per rerun scope from a perf log.")
+    parser.add_argument('log_path', help="JSON-lines log written with PERF_LOG_PATH.")
+    args = parser.parse_args(argv)
+
+    runs = load_runs(Path(args.log_path))
+    for scope, scope_report in sorted(count_stages(runs).items()):
+        print(f"{scope}: {scope_report['runs']} run(s)")
+        for stage, executions in sorted(scope_report['stages'].items()):
+            print(f"  {stage:<28}{executions:>6}")
+
+    for run_id, scope, stage in find_scope_leaks(runs):
+        print(f"Run {run_id} ({scope}) executed app-only stage '{stage}'", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
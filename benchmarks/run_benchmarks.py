@@ -0,0 +1,263 @@
+"""
+Benchmarks the dashboard pipeline on synthetic rent rolls.
+
+Runs without Streamlit secrets or network access. Example:
+
+    python -m benchmarks.run_benchmarks --sizes 1000,100000 --output bench.json
+    python -m benchmarks.run_benchmarks --sizes 1000 --baseline bench.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import altair as alt
+import numpy as np
+import pandas as pd
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.data_loader import apply_fx_rate, clean_base_data, compute_data_fingerprint
+from utils.delta_sync import IncrementalRentRoll
+from utils.detail_price import (build_client_grid_options, build_group_tree, build_server_grid_options, build_server_page,
+                                build_tree_rows)
+from utils.fx_sensitivity import build_rate_grid, compute_fx_sensitivity
+from utils.filter_index import build_filter_index, filter_rows
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT
+from utils.metrics_engine import compute_portfolio_metrics
+from utils.price_chart import calculate_metrics_values, create_advanced_price_chart, unpruned_chart_spec_size
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+# Chart and grid payloads are serialized in full; above this they take minutes and GBs
+DEFAULT_MAX_RENDER_ROWS = 100_000
+BENCH_FX_RATE = 25450.0
+# 601 rates, 24,000 to 30,000 in steps of 10
+BENCH_FX_SCENARIO_RATES = build_rate_grid(24000, 30000, 10)
+# Rows edited between two snapshots in the delta benchmark, about a day of lease changes
+BENCH_DELTA_ROWS = 10
+
+
+def measure(stage_fn, repeat):
+    """
+    Times stage_fn over `repeat` runs, then measures its peak traced memory in one extra run.
+
+    Returns:
+        tuple: (stats dict, result of the last run).
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage_fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    stage_fn()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'peak_mb': peak_bytes / 1e6,
+    }
+    return stats, result
+
+
+def run_size(n_rows, repeat, max_render_rows, seed):
+    """Runs every stage on a rent roll of n_rows and returns the per-stage results."""
+    df_raw = generate_rent_roll(n_rows, seed=seed)
+    results = {}
+
+    results['fingerprint'], data_fingerprint = measure(lambda: compute_data_fingerprint(df_raw), repeat)
+    results['clean'], (df_base, _) = measure(lambda: clean_base_data(df_raw), repeat)
+    results['clean']['rows_out'] = len(df_base)
+    results['floor_rank'], _ = measure(lambda: DEFAULT_FLOOR_LAYOUT.rank(df_base['floor']), repeat)
+    results['clean_delta'], _ = measure(_delta_update_fn(df_raw, seed), repeat)
+    results['clean_delta']['rows_changed'] = BENCH_DELTA_ROWS
+    results['reprice'], df_priced = measure(lambda: apply_fx_rate(df_base, BENCH_FX_RATE), repeat)
+    results['session_memory'] = session_memory(df_raw, df_base, df_priced)
+    results['metrics_headline'], _ = measure(lambda: calculate_metrics_values(df_priced), repeat)
+    results['metrics_breakdown'], _ = measure(lambda: compute_portfolio_metrics(df_priced), repeat)
+    results['fx_sensitivity'], _ = measure(lambda: compute_fx_sensitivity(df_base, BENCH_FX_SCENARIO_RATES), repeat)
+    results['fx_sensitivity']['rates'] = len(BENCH_FX_SCENARIO_RATES)
+
+    results['filter_index'], filter_index = measure(
+        lambda: build_filter_index(df_base, DEFAULT_FLOOR_LAYOUT), repeat)
+    selected_customers = filter_index['customer_options'][:3]
+    selected_floors = filter_index['floor_options'][:2]
+    results['filter'], df_filtered = measure(
+        lambda: filter_rows(df_priced, filter_index, selected_customers, selected_floors), repeat)
+    results['filter']['rows_out'] = len(df_filtered)
+
+    if n_rows > max_render_rows:
+        skipped = {'skipped': f"n_rows > max_render_rows ({max_render_rows})"}
+        results.update({'chart_build': skipped, 'chart_filter_change': skipped, 'grid_client': skipped})
+        # The aggregated chart ships one bar per floor x rent band, so it stays small at any size
+        alt.data_transformers.disable_max_rows()
+        results['chart_aggregated'], aggregated_spec = measure(
+            lambda: create_advanced_price_chart(df_priced, selected_customers, selected_floors, False, False,
+                                                DEFAULT_FLOOR_LAYOUT, chart_mode='aggregated').to_json(), repeat)
+        results['chart_aggregated']['spec_bytes'] = len(aggregated_spec.encode('utf-8'))
+        # The server page and the group tree only send the visible rows, so they stay cheap at any size
+        results['grid_server_page'], server_payload = measure(lambda: _server_page_payload(df_priced), repeat)
+        results['grid_server_page']['payload_bytes'] = len(server_payload.encode('utf-8'))
+        _measure_group_tree(results, df_priced, repeat)
+        return results
+
+    alt.data_transformers.disable_max_rows()
+    chart_runs = itertools.count()
+
+    def build_cold_chart():
+        # A fresh data_version per run defeats the base chart memo, i.e. a cold build
+        chart = create_advanced_price_chart(df_priced, filter_index['customer_options'], filter_index['floor_options'],
+                                            True, True, DEFAULT_FLOOR_LAYOUT,
+                                            data_version=f"{data_fingerprint}-cold-{next(chart_runs)}")
+        return chart.to_json()
+
+    def build_filtered_chart():
+        chart = create_advanced_price_chart(df_priced, selected_customers, selected_floors, False, False,
+                                            DEFAULT_FLOOR_LAYOUT, data_version=f"{data_fingerprint}-warm")
+        return chart.to_json()
+
+    results['chart_build'], chart_spec = measure(build_cold_chart, repeat)
+    results['chart_build']['spec_bytes'] = len(chart_spec.encode('utf-8'))
+    # Before pruning the spec embedded every column of every contract; a bare chart of the frame shows that size
+    results['chart_build']['unpruned_spec_bytes'] = unpruned_chart_spec_size(df_priced)
+    build_filtered_chart()
+    results['chart_filter_change'], _ = measure(build_filtered_chart, repeat)
+
+    def build_aggregated_chart():
+        chart = create_advanced_price_chart(df_priced, selected_customers, selected_floors, False, False,
+                                            DEFAULT_FLOOR_LAYOUT, data_version=data_fingerprint,
+                                            chart_mode='aggregated')
+        return chart.to_json()
+
+    results['chart_aggregated'], aggregated_spec = measure(build_aggregated_chart, repeat)
+    results['chart_aggregated']['spec_bytes'] = len(aggregated_spec.encode('utf-8'))
+
+    def client_grid_payload():
+        aggrid_display_df, _ = build_client_grid_options(df_priced, DEFAULT_FLOOR_LAYOUT)
+        return aggrid_display_df.to_json(orient='records')
+
+    results['grid_client'], client_payload = measure(client_grid_payload, repeat)
+    results['grid_client']['payload_bytes'] = len(client_payload.encode('utf-8'))
+    results['grid_server_page'], server_payload = measure(lambda: _server_page_payload(df_priced), repeat)
+    results['grid_server_page']['payload_bytes'] = len(server_payload.encode('utf-8'))
+    _measure_group_tree(results, df_priced, repeat)
+    return results
+
+
+def _measure_group_tree(results, df_priced, repeat):
+    """Times the cached group tree build and the per-render rows (collapsed, then first floor and customer open)."""
+    results['grid_tree_build'], group_tree = measure(lambda: build_group_tree(df_priced, DEFAULT_FLOOR_LAYOUT), repeat)
+    first_customer = group_tree['customers'].iloc[0]
+    expanded = {f"floor:{first_customer['floor']}", f"customer:{first_customer['floor']}/{first_customer['customer_name']}"}
+    for stage, stage_expanded in (('grid_tree_collapsed', set()), ('grid_tree_expanded', expanded)):
+        results[stage], tree_payload = measure(
+            lambda: build_tree_rows(group_tree, df_priced, stage_expanded).to_json(orient='records'), repeat)
+        results[stage]['payload_bytes'] = len(tree_payload.encode('utf-8'))
+
+
+def session_memory(df_raw, df_base, df_priced):
+    """
+    Reports the memory a session's cached frames hold, against the raw sheet frame.
+
+    The repriced frame shares every column but the USD prices with the base frame,
+    so only those are counted for it.
+    """
+    raw_bytes = int(df_raw.memory_usage(deep=True, index=True).sum())
+    base_bytes = int(df_base.memory_usage(deep=True, index=True).sum())
+    usd_cols = [col for col in df_priced.columns if col not in df_base.columns]
+    priced_extra_bytes = int(df_priced[usd_cols].memory_usage(deep=True, index=False).sum())
+    return {
+        'raw_mb': raw_bytes / 1e6,
+        'base_mb': base_bytes / 1e6,
+        'priced_extra_mb': priced_extra_bytes / 1e6,
+        'bytes_per_row': (base_bytes + priced_extra_bytes) / max(len(df_base), 1),
+    }
+
+
+def _delta_update_fn(df_raw, seed):
+    """
+    Returns a callable that applies the next of two alternating snapshots to a primed
+    IncrementalRentRoll; they differ in the rent of BENCH_DELTA_ROWS contracts.
+    """
+    df_edited = df_raw.copy()
+    edited_rows = np.random.default_rng(seed).choice(len(df_raw), min(BENCH_DELTA_ROWS, len(df_raw)), replace=False)
+    rent_col = df_edited.columns.get_loc('rental_vnd')
+    df_edited.iloc[edited_rows, rent_col] = pd.to_numeric(df_edited['rental_vnd'].iloc[edited_rows], errors='coerce') * 1.05
+    rent_roll = IncrementalRentRoll()
+    rent_roll.update(df_raw)
+    snapshots = itertools.cycle([df_edited, df_raw])
+    return lambda: rent_roll.update(next(snapshots))
+
+
+def _server_page_payload(df_priced):
+    page_df, _, _, _ = build_server_page(df_priced, DEFAULT_FLOOR_LAYOUT, page_number=2,
+                                         sort_field='rental_usd', ascending=False)
+    build_server_grid_options(page_df)
+    return page_df.to_json(orient='records')
+
+
+def compare_to_baseline(current, baseline):
+    """Prints the median time ratio (current / baseline) of every stage present in both runs."""
+    print(f"{'rows':>10}  {'stage':<22}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+    for size, stages in current['results'].items():
+        baseline_stages = baseline.get('results', {}).get(size, {})
+        for stage, stats in stages.items():
+            base_stats = baseline_stages.get(stage, {})
+            if 'seconds_median' not in stats or 'seconds_median' not in base_stats:
+                continue
+            ratio = stats['seconds_median'] / base_stats['seconds_median'] if base_stats['seconds_median'] else float('nan')
+            print(f"{size:>10}  {stage:<22}{base_stats['seconds_median']:>12.4f}{stats['seconds_median']:>12.4f}{ratio:>8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ETC price dashboard pipeline on synthetic data.")
+    parser.add_argument('--sizes', default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated row counts (default: %(default)s).")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage (default: %(default)s).")
+    parser.add_argument('--max-render-rows', type=int, default=DEFAULT_MAX_RENDER_ROWS,
+                        help="Skip full chart/grid serialization above this size (default: %(default)s).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON results to this file (default: stdout).")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'altair': alt.__version__,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+    for n_rows in sizes:
+        print(f"Benchmarking {n_rows:,} rows...", file=sys.stderr)
+        report['results'][str(n_rows)] = run_size(n_rows, args.repeat, args.max_render_rows, args.seed)
+
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(report_json, encoding='utf-8')
+    elif not args.baseline:
+        print(report_json)
+
+    if args.baseline:
+        compare_to_baseline(report, json.loads(Path(args.baseline).read_text(encoding='utf-8')))
+
+
+if __name__ == '__main__':
+    main()
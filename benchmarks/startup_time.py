@@ -0,0 +1,112 @@
+"""
+Measures headless startup: importing the core modules and running the headline CLI.
+
+Every measurement runs in a fresh interpreter, so module caches from earlier runs do
+not hide import costs. The run fails (exit status 1) if importing the core modules
+loads a UI library, or if --max-import-seconds is given and exceeded. Example:
+
+    python -m benchmarks.startup_time --rows 100000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.rent_roll_generator import generate_rent_roll
+
+# Modules headless code imports; none of them may load UI_MODULES at import time
+CORE_MODULES = ['utils.pipeline', 'utils.data_loader', 'utils.data_sources', 'utils.fx_provider',
+                'utils.metrics_engine', 'utils.delta_sync', 'utils.fx_sensitivity', 'utils.bulk_export',
+                'utils.history_store', 'utils.floor_layout', 'utils.detail_price', 'utils.price_chart']
+UI_MODULES = ['streamlit', 'altair', 'st_aggrid', 'streamlit_gsheets']
+BENCH_FX_RATE = 25450.0
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for module_name in {modules!r}:
+    __import__(module_name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded_ui_modules': [m for m in {ui_modules!r} if m in sys.modules]}}))
+"""
+
+
+def _run_python(args, repeat):
+    """Runs `python <args>` from the repo root repeat times; returns (wall seconds per run, last stdout)."""
+    env = {**os.environ, 'PYTHONPATH': str(REPO_ROOT)}
+    timings, stdout = [], ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, *args], cwd=REPO_ROOT, env=env,
+                                   capture_output=True, text=True, check=True)
+        timings.append(time.perf_counter() - start)
+        stdout = completed.stdout
+    return timings, stdout
+
+
+def measure_import(modules, repeat):
+    """Times importing modules in a fresh interpreter and lists the UI modules they pulled in."""
+    probe = IMPORT_PROBE.format(modules=modules, ui_modules=UI_MODULES)
+    wall_timings, stdout = _run_python(['-c', probe], repeat)
+    probe_result = json.loads(stdout)
+    return {
+        'wall_seconds_median': statistics.median(wall_timings),
+        'import_seconds_last': probe_result['seconds'],
+        'loaded_ui_modules': probe_result['loaded_ui_modules'],
+    }
+
+
+def measure_cli(n_rows, repeat, seed):
+    """Times the headline CLI end to end on a synthetic rent roll written to Parquet."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        parquet_path = os.path.join(tmp_dir, 'rent_roll.parquet')
+        generate_rent_roll(n_rows, seed=seed).astype(str).to_parquet(parquet_path, index=False)
+        wall_timings, stdout = _run_python(['-m', 'utils.pipeline', '--source', 'parquet', '--path', parquet_path,
+                                            '--fx-rate', str(BENCH_FX_RATE), '--json'], repeat)
+    return {
+        'rows': n_rows,
+        'wall_seconds_min': min(wall_timings),
+        'wall_seconds_median': statistics.median(wall_timings),
+        'headline': json.loads(stdout),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark headless import and CLI startup time.")
+    parser.add_argument('--rows', type=int, default=10_000, help="Rent roll size for the CLI run (default: %(default)s).")
+    parser.add_argument('--repeat', type=int, default=3, help="Fresh interpreters per measurement (default: %(default)s).")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-import-seconds', type=float,
+                        help="Exit with status 1 if importing the core modules takes longer than this.")
+    args = parser.parse_args(argv)
+
+    report = {
+        'python': sys.version.split()[0],
+        'interpreter': measure_import([], args.repeat),
+        'core_import': measure_import(CORE_MODULES, args.repeat),
+        # For reference: what every headless run paid when the logic lived next to the UI
+        'ui_import': measure_import(UI_MODULES[:3], args.repeat),
+        'cli': measure_cli(args.rows, args.repeat, args.seed),
+    }
+    print(json.dumps(report, indent=2))
+
+    core_import = report['core_import']
+    if core_import['loaded_ui_modules']:
+        print(f"Core modules loaded UI libraries: {core_import['loaded_ui_modules']}", file=sys.stderr)
+        sys.exit(1)
+    if args.max_import_seconds and core_import['import_seconds_last'] > args.max_import_seconds:
+        print(f"Core import took {core_import['import_seconds_last']:.3f}s "
+              f"(budget {args.max_import_seconds:g}s)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
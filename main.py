@@ -1,13 +1,29 @@
+import os
+import tempfile
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 import streamlit as st
 import pandas as pd
 from streamlit.components.v1 import html # For JS/CSS integration
-from streamlit_gsheets import GSheetsConnection # For Google Sheets
-import requests
-import xml.etree.ElementTree as ET
-from datetime import datetime
 # Import functions from other modules
-from utils.price_chart import calculate_metrics_values, create_advanced_price_chart
-from utils.detail_price import display_ag_grid_table
+from utils.price_chart import (chart_spec_size, create_advanced_price_chart, create_fx_sensitivity_chart,
+                               create_trend_chart, resolve_chart_mode, unpruned_chart_spec_size)
+from utils.detail_price import TREE_ROW_THRESHOLD, build_group_tree, display_ag_grid_table, rename_map_aggrid
+from utils.data_loader import apply_fx_rate
+from utils.data_sources import create_data_source
+from utils.delta_sync import CONTRACT_KEY_COLS, IncrementalRentRoll
+from utils.cache_warmer import CacheWarmer, run_concurrently
+from utils.bulk_export import EXPORT_FORMATS, export_reports, zip_reports
+from utils.filter_index import build_filter_index, filter_rows
+from utils.floor_layout import FloorLayout
+from utils.metrics_engine import METRIC_COLUMN_LABELS, TOTAL_GROUP_LABEL, compute_metrics_table, headline_metrics
+from utils.fx_sensitivity import build_rate_grid, compute_fx_sensitivity
+from utils.fx_provider import DEFAULT_FX_CACHE_PATH, DEFAULT_FX_URL, FxRateProvider, format_fx_age
+from utils.snapshot_store import DEFAULT_SNAPSHOT_DIR, SnapshotStore
+from utils.history_store import DEFAULT_HISTORY_DIR, HistoryStore, org_fx_divergence
+from utils.pipeline import FALLBACK_FX_RATE, make_data_version, resolve_fx_rate, validate_fx_rate
+from utils.perf_trace import PerfTrace, activate_trace, current_trace, is_trace_active, note_cache_miss
 
 # --- Page configuration ---
 st.set_page_config(layout="wide", page_title="ETC Price Dashboard", initial_sidebar_state="expanded")
@@ -15,95 +31,555 @@ st.cache_data(ttl=3600)
 CORRECT_USERNAME = st.secrets["user_name"]
 CORRECT_PASSWORD = st.secrets["pass"]
 # --- Define global constants ---
-GSHEET_URL = st.secrets["URL"]
-CUSTOM_FLOOR_SORT_ORDER = ["27", "26", "25", "24", "23", "22", "21", "20", "19", "18",
-                           "17", "16", "15", "14", "12", "11", "10", "09", "08", "07",
-                           "06", "05", "03", "02", "01", "G"]
-FX_LINK = "https://portal.vietcombank.com.vn/Usercontrols/TVPortal.TyGia/pXML.aspx"
-@st.cache_data(ttl=3600)
-def fx_getter(fx_url):
+GSHEET_URL = st.secrets.get("URL")
+# Nguồn dữ liệu: "gsheets" (mặc định), "parquet" hoặc "sqlite" với DATA_PATH / DATA_TABLE
+DATA_SOURCE_TYPE = st.secrets.get("DATA_SOURCE", "gsheets")
+DATA_PATH = st.secrets.get("DATA_PATH", GSHEET_URL)
+DATA_TABLE = st.secrets.get("DATA_TABLE")
+# Thứ tự tầng của tòa nhà: danh sách tầng hoặc đường dẫn file JSON (mặc định DEFAULT_FLOOR_ORDER)
+FLOOR_LAYOUT = FloorLayout.from_config(st.secrets.get("FLOOR_LAYOUT"))
+# Tên hiển thị cho các cột của bảng kịch bản tỷ giá
+FX_SENSITIVITY_COLUMN_LABELS = {
+    'rate': 'Tỷ giá',
+    'rental_avg': 'Giá thuê TB',
+    'service_avg': 'Phí DV TB',
+    'total_avg': 'Tổng cộng TB',
+    'org_total_avg': 'Tổng cộng TB ký HĐ',
+    'total_vs_org_pct': 'Chênh lệch so với ký HĐ',
+    'area_share_below_org': 'Tỷ lệ DT thấp hơn ký HĐ',
+    'rate_vs_org_fx_pct': 'Tỷ giá so với tỷ giá ký HĐ',
+}
+# Nhãn hiển thị -> chế độ của create_advanced_price_chart ('auto' gộp theo khoảng giá khi có nhiều HĐ)
+CHART_MODE_OPTIONS = {
+    'Tự động': 'auto',
+    'Chi tiết từng HĐ': 'detail',
+    'Gộp theo khoảng giá': 'aggregated',
+}
+# Giới hạn số mức tỷ giá của một kịch bản để giữ thời gian tính và bộ nhớ ổn định
+MAX_FX_SCENARIO_RATES = 1000
+FX_LINK = st.secrets.get("FX_URL", DEFAULT_FX_URL)
+FX_CACHE_PATH = st.secrets.get("FX_CACHE_PATH", DEFAULT_FX_CACHE_PATH)
+# Snapshot dữ liệu đã xử lý trên đĩa để server khởi động lại không phải đọc lại nguồn; chuỗi rỗng để tắt
+SNAPSHOT_DIR = st.secrets.get("SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR)
+# Lịch sử bảng giá theo ngày (một snapshot mỗi ngày) cho biểu đồ xu hướng; chuỗi rỗng để tắt
+HISTORY_DIR = st.secrets.get("HISTORY_DIR", DEFAULT_HISTORY_DIR)
+# Tần suất của biểu đồ xu hướng: nhãn hiển thị -> frequency của HistoryStore.query_metrics
+HISTORY_FREQUENCY_OPTIONS = {'Theo tháng': 'monthly', 'Theo ngày': 'daily'}
+# Số ngày mặc định của bảng tỷ giá ký HĐ theo thời gian (đọc từng HĐ nên giữ khoảng ngắn)
+HISTORY_CONTRACT_DAYS = 90
+# Theo dõi hiệu năng: bảng điều khiển chỉ dành cho admin_users, log JSON lines ghi vào PERF_LOG_PATH (nếu có)
+ADMIN_USERS = list(st.secrets.get("admin_users", []))
+PERF_LOG_PATH = st.secrets.get("PERF_LOG_PATH")
+# Làm nóng cache: kiểm tra mỗi CACHE_WARM_INTERVAL_SECONDS, tải lại tỷ giá / sheet khi còn
+# chưa tới *_REFRESH_MARGIN_SECONDS trước khi hết hạn; ngừng khi không ai dùng app trong
+# CACHE_WARM_IDLE_SECONDS (bằng chu kỳ đọc sheet), nên server rảnh đọc sheet thêm nhiều nhất một lần
+CACHE_WARM_INTERVAL_SECONDS = 15
+CACHE_WARM_IDLE_SECONDS = 600
+FX_REFRESH_MARGIN_SECONDS = 300
+SOURCE_REFRESH_MARGIN_SECONDS = 15
+# Phiên nguội chưa có tỷ giá nào: chờ tối đa chừng này giây (song song với việc đọc sheet)
+FX_COLD_START_WAIT_SECONDS = 5
+
+@st.cache_resource(show_spinner=False)
+def get_fx_provider(fx_url):
+    """Khởi tạo bộ cung cấp tỷ giá dùng chung cho mọi phiên (cache trên đĩa + làm mới nền)."""
+    return FxRateProvider(fx_url, cache_path=FX_CACHE_PATH, max_age_seconds=3600)
+
+def fx_getter(fx_url, wait_seconds=0):
     """
-    Truy cập API tỷ giá của Vietcombank, lấy tỷ giá bán USD và thời gian cập nhật.
+    Lấy tỷ giá bán USD của Vietcombank mà không chờ mạng.
+
+    Tỷ giá gần nhất được trả về ngay từ cache (bộ nhớ hoặc đĩa); khi đã cũ,
+    việc tải lại được thực hiện ở luồng nền. Chỉ khi chưa từng có tỷ giá nào
+    (khởi động nguội) mới chờ lần tải nền tối đa wait_seconds giây.
 
     Returns:
-        tuple: Một tuple chứa (fx_rate, fx_time) nếu thành công,
-               (None, None) nếu có lỗi.
+        tuple: Một tuple chứa (fx_rate, fx_time, fx_age_seconds) nếu có tỷ giá,
+               (None, None, None) nếu chưa từng lấy được tỷ giá.
     """
-    try:
-        response = requests.get(fx_url, timeout=10)
-        response.raise_for_status()
+    # Không chờ lại nếu lần tải trước đã lỗi, để sự cố của VCB không làm chậm mọi lần chạy
+    fx_provider = get_fx_provider(fx_url)
+    fx_rate, fx_time, fx_age_seconds, fx_error = resolve_fx_rate(fx_provider, wait_seconds)
+    # Mỗi lần tải lỗi chỉ được báo một lần trong phiên, không lặp lại ở mọi lần chạy lại
+    if fx_error and st.session_state.get("fx_error_failed_at") != fx_provider.last_failed_at:
+        st.session_state.fx_error_failed_at = fx_provider.last_failed_at
+        st.toast(fx_error, icon="⚠️")
+    return fx_rate, fx_time, fx_age_seconds
 
-        root = ET.fromstring(response.content)
-        
-        # Lấy thời gian cập nhật
-        datetime_element = root.find('DateTime')
-        fx_time_str = datetime_element.text if datetime_element is not None else ""
-        datetime_object = datetime.strptime(fx_time_str, "%m/%d/%Y %I:%M:%S %p")
-        fx_time = datetime_object.strftime("%d/%m/%Y")
-
-        # Lấy tỷ giá USD
-        for exrate in root.findall('Exrate'):
-            if exrate.get('CurrencyCode') == 'USD':
-                fx_rate_str = exrate.get('Sell')
-                fx_rate = float(fx_rate_str.replace(',', ''))
-                return fx_rate, fx_time
-        
-        return None, fx_time # Không tìm thấy USD
+@st.cache_resource(show_spinner=False)
+def get_data_source(source_type, location, table_name):
+    """Khởi tạo nguồn dữ liệu (Google Sheets, Parquet hoặc SQLite) một lần cho mỗi cấu hình."""
+    connection = None
+    if source_type == "gsheets":
+        # Chỉ nạp gói kết nối Google Sheets khi thực sự dùng nguồn này
+        from streamlit_gsheets import GSheetsConnection
+        connection = st.connection("gsheets", type=GSheetsConnection)
+    return create_data_source(source_type, location, table_name=table_name, connection=connection)
 
-    except requests.exceptions.RequestException as e:
-        st.error(f"Lỗi khi truy cập URL tỷ giá: {e}")
-    except (ET.ParseError, ValueError, AttributeError) as e:
-        st.error(f"Lỗi khi xử lý dữ liệu tỷ giá: {e}")
-    
-    return None, None
+@st.cache_resource(show_spinner=False)
+def get_snapshot_store():
+    """Kho snapshot trên đĩa dùng chung cho mọi phiên (None nếu SNAPSHOT_DIR rỗng)."""
+    return SnapshotStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+
+@st.cache_resource(show_spinner=False)
+def get_history_store():
+    """Kho lịch sử bảng giá theo ngày dùng chung cho mọi phiên (None nếu HISTORY_DIR rỗng)."""
+    return HistoryStore(HISTORY_DIR) if HISTORY_DIR else None
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def get_history_trend(history_version, scope, groups, start, end, metric, frequency):
+    """Chuỗi thời gian của một chỉ số, cache theo phiên bản của kho lịch sử."""
+    note_cache_miss()
+    return get_history_store().query_metrics(scope, groups=groups, start=start, end=end,
+                                             columns=[metric], frequency=frequency)
 
-def load_and_process_gsheet_data(gsheet_url, fx_rate_to_apply):
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_history_contract_fx(history_version, customers, start, end):
+    """Tỷ giá ký HĐ so với tỷ giá thị trường của từng HĐ theo ngày, cache theo phiên bản của kho lịch sử."""
+    note_cache_miss()
+    rows = get_history_store().query_rows(start=start, end=end, customers=customers,
+                                          columns=['period', 'org_fx', 'fx_rate'])
+    return org_fx_divergence(rows)
+
+@st.cache_resource(show_spinner=False)
+def get_rent_roll(source_id):
     """
-    Tải dữ liệu từ Google Sheet và xử lý nó bằng tỷ giá được cung cấp.
+    Giữ ảnh chụp gần nhất của nguồn dữ liệu để các lần tải sau chỉ xử lý những dòng đã thay đổi.
+
+    Khi server vừa khởi động, trạng thái được khôi phục từ snapshot trên đĩa (nếu có).
     """
-    if fx_rate_to_apply is None or fx_rate_to_apply <= 0:
-        return None, "Lỗi: Tỷ giá không hợp lệ. Vui lòng cung cấp một tỷ giá dương."
-        
-    try:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        df_main_raw = conn.read(spreadsheet=gsheet_url, usecols=list(range(1, 11)), ttl=600)
+    rent_roll = IncrementalRentRoll(floor_layout=FLOOR_LAYOUT)
+    snapshot_store = get_snapshot_store()
+    snapshot = snapshot_store.load(source_id) if snapshot_store else None
+    if snapshot is not None:
+        rent_roll.restore_snapshot(*snapshot)
+    return rent_roll
 
-        if df_main_raw.empty:
-            return None, "Lỗi: Không đọc được dữ liệu, sheet có thể rỗng hoặc URL không đúng."
+def save_snapshot(source_id):
+    """Ghi trạng thái hiện tại của nguồn ra snapshot trên đĩa nếu nó khác snapshot đang lưu."""
+    snapshot_store = get_snapshot_store()
+    rent_roll = get_rent_roll(source_id)
+    if snapshot_store is None or rent_roll.needs_revalidation:
+        return
+    saved = snapshot_store.read_metadata(source_id)
+    snapshot_version = rent_roll.snapshot_version()
+    if saved is not None and saved['metadata'].get('version') == snapshot_version:
+        return
+    snapshot = rent_roll.to_snapshot()
+    if snapshot is not None:
+        frames, metadata = snapshot
+        snapshot_store.save(source_id, frames, {**metadata, 'version': snapshot_version})
 
-        # Áp dụng tỷ giá để tính toán các cột USD
-        df_main_raw['rental_usd'] = round(df_main_raw['rental_vnd'] / fx_rate_to_apply, 2)
-        df_main_raw['service_usd'] = round(df_main_raw['service_vnd'] / fx_rate_to_apply, 2)
-        df_main_raw['total_usd'] = df_main_raw['rental_usd'] + df_main_raw['service_usd']
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_source_data(_data_source, source_id, change_token):
+    """
+    Đọc dữ liệu thô từ nguồn, tính dấu vân tay (fingerprint) nội dung và làm sạch nó.
 
-        df_processed = df_main_raw.copy()
-        
-        # Chuyển đổi các cột số liệu
-        numeric_cols = ['sqr', 'rental_vnd', 'service_vnd', 'org_fx', 'org_rental_usd', 
-                        'org_service_usd', 'org_total_usd', 'rental_usd', 'service_usd', 'total_usd']
-        
-        for col in numeric_cols:
-            if col in df_processed.columns:
-                if df_processed[col].dtype == 'object':
-                    df_processed[col] = df_processed[col].astype(str).str.replace(',', '.', regex=False)
-                df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce')
-        
-        # Loại bỏ các hàng có dữ liệu số không hợp lệ
-        cols_to_check_for_nan = [col for col in numeric_cols if col in df_processed.columns]
-        df_processed.dropna(subset=cols_to_check_for_nan, how='any', inplace=True)
+    Cache được làm mới theo change_token của nguồn (mtime file hoặc hash nội dung)
+    thay vì theo một TTL cố định. Chỉ các dòng thêm mới / sửa so với lần đọc trước
+    được làm sạch lại (xem IncrementalRentRoll); dữ liệu thô được giải phóng ngay sau đó.
+
+    Returns:
+        tuple: (df_base, data_fingerprint, message).
+    """
+    note_cache_miss()
+    rent_roll = get_rent_roll(source_id)
+    if rent_roll.change_token == change_token and rent_roll.df_base is not None:
+        # Nguồn chưa đổi so với snapshot đã khôi phục: không cần đọc lại
+        return rent_roll.current()
+    df_raw = _data_source.read()
+    with current_trace().stage("clean_delta") as stage_record:
+        df_base, data_fingerprint, status_message = rent_roll.update(df_raw, change_token)
+        if rent_roll.last_delta is not None:
+            stage_record.update({key: rent_roll.last_delta[key] for key in ('inserted', 'updated', 'deleted', 'full_rebuild')})
+    return df_base, data_fingerprint, status_message
 
-        if df_processed.empty:
-            return None, "Cảnh báo: Không tìm thấy dữ liệu hợp lệ sau khi làm sạch."
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_repriced_data(_df_base, data_fingerprint, fx_rate):
+    """Tính lại các cột USD theo tỷ giá; giữ lại các tỷ giá được dùng gần nhất."""
+    note_cache_miss()
+    return apply_fx_rate(_df_base, fx_rate)
 
-        if 'floor' in df_processed.columns:
-            df_processed['floor_selector_val'] = df_processed['floor'].astype(str)
-        else:
-            return None, "Lỗi: Cột 'floor' không tìm thấy."
-        
-        return df_processed, "Dữ liệu đã được tải và xử lý thành công."
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_filter_index(_df_base, data_fingerprint):
+    """Dựng danh sách lựa chọn và chỉ mục đảo cho bộ lọc khách hàng/tầng, một lần cho mỗi phiên bản dữ liệu."""
+    note_cache_miss()
+    return build_filter_index(_df_base, FLOOR_LAYOUT)
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_portfolio_metrics(_df_main, source_id, data_fingerprint, fx_rate):
+    """
+    Tính các chỉ số tổng, theo tầng và theo khách hàng một lần cho mỗi phiên bản dữ liệu và tỷ giá.
 
+    Sau một lần tải chỉ đổi vài dòng, chỉ các tầng / khách hàng bị ảnh hưởng được tính lại.
+    """
+    note_cache_miss()
+    return get_rent_roll(source_id).portfolio_metrics(_df_main, data_fingerprint, fx_rate)
+
+@st.cache_resource(max_entries=64, show_spinner=False)
+def get_selection_metrics(_df_filtered, data_version, selected_customers, selected_floors):
+    """Tính các chỉ số cho lựa chọn hiện tại của bộ lọc."""
+    note_cache_miss()
+    return compute_metrics_table(_df_filtered).iloc[0]
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def get_group_tree(_df_filtered, data_version, selected_customers, selected_floors):
+    """Dựng cây tầng -> khách hàng -> hợp đồng (kèm tổng diện tích, giá bình quân) của bảng chi tiết cho lựa chọn hiện tại."""
+    note_cache_miss()
+    return build_group_tree(_df_filtered, FLOOR_LAYOUT)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def get_unpruned_chart_spec_size(_df_main, data_version):
+    """Kích thước spec biểu đồ nếu chưa cắt cột dữ liệu (để so sánh trong bảng hiệu năng); tính một lần cho mỗi phiên bản dữ liệu."""
+    note_cache_miss()
+    return unpruned_chart_spec_size(_df_main)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_fx_sensitivity(_df_base, data_fingerprint, rates):
+    """Tính giá USD bình quân theo tầng và toàn tòa nhà cho cả dải tỷ giá; không phụ thuộc tỷ giá đang chọn."""
+    note_cache_miss()
+    return compute_fx_sensitivity(_df_base, rates)
+
+def load_base_data(data_source, max_age_seconds=None, revalidate=False):
+    """
+    Đọc và làm sạch dữ liệu nguồn (không phụ thuộc tỷ giá), cache theo change_token của nguồn.
+
+    Sau khi server khởi động lại, dữ liệu khôi phục từ snapshot được dùng ngay mà không
+    hỏi nguồn, cho tới khi một lần gọi với revalidate=True (luồng làm nóng cache) kiểm
+    tra lại nguồn.
+
+    Returns:
+        tuple: (df_base, data_fingerprint, message); df_base là None khi có lỗi.
+    """
+    try:
+        perf_trace = current_trace()
+        rent_roll = get_rent_roll(data_source.source_id)
+        if rent_roll.needs_revalidation and not revalidate:
+            with perf_trace.stage("snapshot") as stage_record:
+                df_base, data_fingerprint, status_message = rent_roll.current()
+                stage_record['rows'] = len(df_base)
+            return df_base, data_fingerprint, status_message
+        with perf_trace.stage("source_token"):
+            change_token = data_source.change_token(max_age_seconds)
+        with perf_trace.stage("read", cached=True) as stage_record:
+            df_base, data_fingerprint, status_message = load_source_data(data_source, data_source.source_id, change_token)
+            stage_record['rows'] = 0 if df_base is None else len(df_base)
+        if df_base is not None:
+            rent_roll.needs_revalidation = False
+        return df_base, data_fingerprint, status_message
     except Exception as e:
-        return None, f"Đã xảy ra lỗi khi kết nối hoặc xử lý file: {e}"
+        return None, None, f"Đã xảy ra lỗi khi kết nối hoặc xử lý file: {e}"
+
+def load_and_process_gsheet_data(data_source, fx_rate_to_apply, base_data=None):
+    """
+    Tải dữ liệu từ nguồn dữ liệu (mặc định là Google Sheet) và xử lý nó bằng tỷ giá được cung cấp.
+
+    Dữ liệu đã làm sạch được cache theo nội dung sheet, nên khi chỉ đổi tỷ giá
+    thì chỉ các cột USD được tính lại. base_data là kết quả load_base_data đã có
+    sẵn (ví dụ đã đọc song song với việc lấy tỷ giá); nếu None thì đọc từ nguồn.
+
+    Returns:
+        tuple: (df_processed, data_version, message); data_version định danh cặp
+               (nội dung sheet, tỷ giá) và dùng làm khóa cache cho các bước sau.
+    """
+    fx_error = validate_fx_rate(fx_rate_to_apply)
+    if fx_error:
+        return None, None, fx_error
+
+    df_base, data_fingerprint, status_message = base_data or load_base_data(data_source)
+    if df_base is None:
+        return None, None, status_message
+    try:
+        fx_rate = float(fx_rate_to_apply)
+        with current_trace().stage("reprice", cached=True):
+            df_processed = get_repriced_data(df_base, data_fingerprint, fx_rate)
+        return df_processed, make_data_version(data_fingerprint, fx_rate), status_message
+
+    except Exception as e:
+        return None, None, f"Đã xảy ra lỗi khi kết nối hoặc xử lý file: {e}"
+
+def warm_shared_caches():
+    """
+    Làm nóng các cache dùng chung: tỷ giá và dữ liệu nguồn được tải song song,
+    sau đó dữ liệu theo tỷ giá VCB, chỉ mục bộ lọc và chỉ số tổng được tính sẵn.
+
+    Tỷ giá và sheet được tải lại khi chỉ còn một khoảng ngắn trước khi hết hạn,
+    để không yêu cầu nào của người dùng phải chờ mạng.
+    """
+    fx_provider = get_fx_provider(FX_LINK)
+    data_source = get_data_source(DATA_SOURCE_TYPE, DATA_PATH, DATA_TABLE)
+
+    def refresh_fx():
+        if fx_provider.is_stale(margin_seconds=FX_REFRESH_MARGIN_SECONDS) and not fx_provider.is_backing_off():
+            fx_provider.refresh()
+
+    source_max_age = max(getattr(data_source, 'poll_seconds', 0) - SOURCE_REFRESH_MARGIN_SECONDS, 0)
+    _, (df_base, data_fingerprint, status_message) = run_concurrently(
+        refresh_fx, lambda: load_base_data(data_source, max_age_seconds=source_max_age, revalidate=True))
+    if df_base is None:
+        raise RuntimeError(status_message)
+
+    get_filter_index(df_base, data_fingerprint)
+    fx_rate = fx_provider.get_rate('USD', 'sell')[0]
+    if fx_rate:
+        df_main = get_repriced_data(df_base, data_fingerprint, float(fx_rate))
+        portfolio_metrics = get_portfolio_metrics(df_main, data_source.source_id, data_fingerprint, float(fx_rate))
+    # Lưu snapshot sau khi chỉ số đã được tính, để lần khởi động sau không phải đọc lại nguồn
+    save_snapshot(data_source.source_id)
+    history_store = get_history_store()
+    if fx_rate and history_store is not None:
+        # Snapshot của ngày hôm nay chỉ được ghi lại khi dữ liệu hoặc tỷ giá VCB thay đổi
+        history_store.append_snapshot(df_main, float(fx_rate), portfolio_metrics=portfolio_metrics,
+                                      version=make_data_version(data_fingerprint, fx_rate))
+
+@st.cache_resource(show_spinner=False)
+def get_cache_warmer():
+    """
+    Khởi động luồng làm nóng cache một lần cho mỗi tiến trình server, từ lần chạy script đầu tiên.
+
+    `streamlit run` không có hook lúc server khởi động (script chỉ chạy khi có phiên), nên
+    lần tải nguội bắt đầu ở trang đăng nhập của người vào đầu tiên và chạy trong lúc họ đăng nhập;
+    ai đăng nhập nhanh hơn thời gian tải vẫn phải chờ phần còn lại.
+    """
+    return CacheWarmer(warm_shared_caches, interval_seconds=CACHE_WARM_INTERVAL_SECONDS,
+                       idle_after_seconds=CACHE_WARM_IDLE_SECONDS).start()
+
+def display_rejected_rows(source_id, data_fingerprint):
+    """Liệt kê các dòng bị loại khi làm sạch lần tải gần nhất (toàn bộ sheet, hoặc chỉ các dòng thay đổi) và lý do."""
+    delta = get_rent_roll(source_id).last_delta
+    if delta is None or delta['to_fingerprint'] != data_fingerprint or not delta['reject_report']['rejected']:
+        return
+    report = delta['reject_report']
+    scope = "dữ liệu" if delta['full_rebuild'] else "các dòng thay đổi"
+    with st.expander(f"⚠️ {report['rejected']:,} / {report['rows']:,} dòng {scope} không hợp lệ và đã bị loại"):
+        st.dataframe(report['by_reason'], hide_index=True, use_container_width=True,
+                     column_config={'column': 'Cột', 'reason': 'Lý do', 'rows': 'Số dòng'})
+        if report['rejected'] > len(report['rejected_rows']):
+            st.caption(f"Chỉ liệt kê {len(report['rejected_rows']):,} dòng đầu tiên.")
+        st.dataframe(report['rejected_rows'].assign(row=report['rejected_rows']['row'] + 1), hide_index=True,
+                     use_container_width=True, column_config={'row': 'Dòng dữ liệu số', 'reason': 'Lý do'})
+
+def display_data_changes(source_id, data_fingerprint):
+    """Hiển thị các hợp đồng được thêm, sửa hoặc xóa trong lần tải dữ liệu gần nhất."""
+    delta = get_rent_roll(source_id).last_delta
+    if delta is None or delta['full_rebuild'] or delta['to_fingerprint'] != data_fingerprint:
+        return
+    detected_at = pd.Timestamp.fromtimestamp(delta['detected_at']).strftime('%H:%M %d/%m/%Y')
+    summary = (f"{delta['inserted']:,} HĐ thêm mới, {delta['updated']:,} HĐ cập nhật, "
+               f"{delta['deleted']:,} HĐ đã xóa")
+    with st.expander(f"🔄 Thay đổi trong lần cập nhật dữ liệu lúc {detected_at}: {summary}"):
+        st.dataframe(
+            delta['changes'],
+            hide_index=True,
+            use_container_width=True,
+            column_config={'change': 'Thay đổi', **{col: rename_map_aggrid[col] for col in CONTRACT_KEY_COLS}},
+        )
+
+def display_metrics_breakdown(portfolio_metrics, selection_metrics, floor_options):
+    """Hiển thị chỉ số của lựa chọn hiện tại và bảng chỉ số theo tầng / theo khách hàng."""
+    with st.expander("📈 Chỉ số chi tiết theo bộ lọc, tầng và khách hàng"):
+        s_col1, s_col2, s_col3, s_col4 = st.columns(4)
+        s_col1.metric(label="Số HĐ đang chọn", value=f"{selection_metrics['contracts']:,.0f}")
+        s_col2.metric(label="Diện tích đang chọn (m²)", value=f"{selection_metrics['area']:,.0f}")
+        s_col3.metric(label="Giá thuê TB đang chọn (USD)", value=f"${selection_metrics['rental_avg']:,.2f}")
+        s_col4.metric(label="Phí DV TB đang chọn (USD)", value=f"${selection_metrics['service_avg']:,.2f}")
+
+        floor_tab, customer_tab = st.tabs(["Theo tầng", "Theo khách hàng"])
+        with floor_tab:
+            by_floor = portfolio_metrics['by_floor'].reindex(floor_options)
+            st.dataframe(by_floor[list(METRIC_COLUMN_LABELS)].rename(columns=METRIC_COLUMN_LABELS), use_container_width=True)
+        with customer_tab:
+            by_customer = portfolio_metrics['by_customer']
+            st.dataframe(by_customer[list(METRIC_COLUMN_LABELS)].rename(columns=METRIC_COLUMN_LABELS), use_container_width=True)
+
+@st.fragment
+def display_fx_sensitivity(df_main, data_fingerprint, current_fx_rate, floor_options):
+    """Hiển thị kịch bản tỷ giá: giá USD bình quân theo một dải tỷ giá, so với giá ký HĐ."""
+    with fragment_perf_trace("fx_sensitivity"), st.expander("💱 Kịch bản tỷ giá"):
+        with st.form("fx_sensitivity_form", border=False):
+            start_col, stop_col, step_col = st.columns(3)
+            start_rate = start_col.number_input("Tỷ giá từ", min_value=1000.0, value=24000.0, step=100.0, format="%.0f")
+            stop_rate = stop_col.number_input("Tỷ giá đến", min_value=1000.0, value=27000.0, step=100.0, format="%.0f")
+            rate_step = step_col.number_input("Bước", min_value=1.0, value=50.0, step=10.0, format="%.0f")
+            st.form_submit_button("Tính kịch bản")
+        try:
+            rates = build_rate_grid(start_rate, stop_rate, rate_step)
+        except ValueError as e:
+            st.error(str(e))
+            return
+        if len(rates) > MAX_FX_SCENARIO_RATES:
+            st.error(f"Tối đa {MAX_FX_SCENARIO_RATES} mức tỷ giá mỗi kịch bản; hãy tăng bước hoặc thu hẹp khoảng.")
+            return
+
+        with current_trace().stage("fx_sensitivity", cached=True, rates=len(rates)):
+            df_sensitivity = get_fx_sensitivity(df_main, data_fingerprint, tuple(rates.tolist()))
+
+        group_label = st.selectbox("Xem theo", options=[TOTAL_GROUP_LABEL] + list(floor_options), key="fx_sensitivity_group")
+        st.altair_chart(create_fx_sensitivity_chart(df_sensitivity, current_fx_rate, group_label,
+                                                    group_col='floor'), use_container_width=True)
+
+        df_group = df_sensitivity[df_sensitivity['floor'] == group_label].drop(columns='floor')
+        st.dataframe(
+            df_group.rename(columns=FX_SENSITIVITY_COLUMN_LABELS),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                FX_SENSITIVITY_COLUMN_LABELS['rate']: st.column_config.NumberColumn(format="%.0f"),
+                **{FX_SENSITIVITY_COLUMN_LABELS[col]: st.column_config.NumberColumn(format="$%.2f")
+                   for col in ('rental_avg', 'service_avg', 'total_avg', 'org_total_avg')},
+                **{FX_SENSITIVITY_COLUMN_LABELS[col]: st.column_config.NumberColumn(format="percent")
+                   for col in ('total_vs_org_pct', 'area_share_below_org', 'rate_vs_org_fx_pct')},
+            },
+        )
+
+@st.fragment
+def display_history_trends(floor_options, customer_options):
+    """Hiển thị xu hướng các chỉ số giá theo thời gian từ lịch sử bảng giá (mỗi ngày một snapshot)."""
+    history_store = get_history_store()
+    if history_store is None:
+        return
+    with fragment_perf_trace("history") as perf_trace, st.expander("📅 Xu hướng theo thời gian"):
+        history_version = history_store.version()
+        snapshot_dates = history_store.snapshot_dates() if history_version is not None else []
+        if not snapshot_dates:
+            st.info("Chưa có lịch sử: mỗi ngày một snapshot bảng giá được lưu khi dữ liệu được làm mới.")
+            return
+        first_date, last_date = snapshot_dates[0].date(), snapshot_dates[-1].date()
+        st.caption(f"{len(snapshot_dates):,} snapshot từ {first_date:%d/%m/%Y} đến {last_date:%d/%m/%Y}; "
+                   "giá USD tính theo tỷ giá VCB của ngày snapshot.")
+
+        trend_tab, contract_fx_tab = st.tabs(["Chỉ số theo thời gian", "Tỷ giá ký HĐ so với thị trường"])
+        with trend_tab:
+            scope_col, metric_col, frequency_col = st.columns(3)
+            scope_label = scope_col.radio("Xem theo", options=["Toàn tòa nhà", "Tầng", "Khách hàng"],
+                                          horizontal=True, key="history_scope")
+            metric = metric_col.selectbox("Chỉ số", options=list(METRIC_COLUMN_LABELS), index=3,
+                                          format_func=METRIC_COLUMN_LABELS.get, key="history_metric")
+            frequency_label = frequency_col.radio("Tần suất", options=list(HISTORY_FREQUENCY_OPTIONS),
+                                                  horizontal=True, key="history_frequency")
+            date_range = st.date_input("Khoảng thời gian", value=(first_date, last_date), min_value=first_date,
+                                       max_value=last_date, format="DD/MM/YYYY", key="history_date_range")
+            start, end = (date_range[0], date_range[-1]) if date_range else (first_date, last_date)
+
+            if scope_label == "Toàn tòa nhà":
+                scope, groups = 'total', None
+            else:
+                scope, options = ('by_floor', floor_options) if scope_label == "Tầng" else ('by_customer', customer_options)
+                groups = tuple(st.multiselect(f"Chọn {scope_label.lower()} (tối đa 10)", options=options,
+                                              default=list(options[:3]), max_selections=10,
+                                              key=f"history_groups_{scope}"))
+            if groups == ():
+                st.info(f"Chọn ít nhất một {scope_label.lower()} để xem xu hướng.")
+            else:
+                with perf_trace.stage("history_trend", cached=True) as stage_record:
+                    df_trend = get_history_trend(history_version, scope, groups, start, end, metric,
+                                                 HISTORY_FREQUENCY_OPTIONS[frequency_label])
+                    stage_record['rows'] = len(df_trend)
+                if df_trend.empty:
+                    st.info("Không có snapshot nào trong khoảng thời gian đã chọn.")
+                else:
+                    st.altair_chart(create_trend_chart(df_trend, metric, METRIC_COLUMN_LABELS[metric], scope_label),
+                                    use_container_width=True)
+
+        with contract_fx_tab:
+            customers = st.multiselect("Chọn khách hàng", options=customer_options, max_selections=10,
+                                       key="history_fx_customers")
+            if not customers:
+                st.caption(f"Chọn khách hàng để xem tỷ giá ký HĐ so với tỷ giá VCB trong {HISTORY_CONTRACT_DAYS} ngày gần nhất.")
+                return
+            fx_start = max(first_date, last_date - pd.Timedelta(days=HISTORY_CONTRACT_DAYS))
+            with perf_trace.stage("history_contract_fx", cached=True) as stage_record:
+                df_contract_fx = get_history_contract_fx(history_version, tuple(customers), fx_start, last_date)
+                stage_record['rows'] = len(df_contract_fx)
+            st.dataframe(
+                df_contract_fx,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    'snapshot_date': st.column_config.DateColumn('Ngày', format="DD/MM/YYYY"),
+                    **{col: rename_map_aggrid[col] for col in CONTRACT_KEY_COLS},
+                    'org_fx': st.column_config.NumberColumn(rename_map_aggrid['org_fx'], format="%.0f"),
+                    'fx_rate': st.column_config.NumberColumn('Tỷ giá VCB', format="%.0f"),
+                    'fx_vs_org_pct': st.column_config.NumberColumn('Tỷ giá VCB so với ký HĐ', format="percent"),
+                },
+            )
+
+@st.fragment
+def display_bulk_export_panel(df_main, fx_rate):
+    """Cho admin xuất báo cáo theo từng khách hàng, từng tầng và tổng quan danh mục thành một file zip."""
+    with fragment_perf_trace("bulk_export") as perf_trace, st.sidebar.expander("📦 Xuất báo cáo hàng loạt"):
+        export_formats = st.multiselect("Định dạng", options=list(EXPORT_FORMATS), default=['xlsx'], key="bulk_export_formats")
+        if st.button("Tạo báo cáo", key="bulk_export_button", disabled=not export_formats):
+            with st.spinner("Đang xuất báo cáo..."), tempfile.TemporaryDirectory() as export_dir, \
+                    perf_trace.stage("bulk_export", rows=len(df_main)) as stage_record:
+                try:
+                    written = export_reports(df_main, export_dir, formats=export_formats, floor_layout=FLOOR_LAYOUT)
+                    zip_name = f"bao_cao_gia_thue_{pd.Timestamp.now():%Y%m%d}_{fx_rate:.0f}.zip"
+                    zip_path = zip_reports(written, export_dir, os.path.join(export_dir, zip_name))
+                    with open(zip_path, 'rb') as zip_file:
+                        st.session_state.bulk_export_zip = (zip_name, zip_file.read(), len(written))
+                except BrokenProcessPool:
+                    # Một tiến trình con bị dừng đột ngột, thường do hết bộ nhớ
+                    st.error("Tiến trình xuất báo cáo bị dừng đột ngột (có thể do thiếu bộ nhớ). Vui lòng thử lại.")
+                    return
+                except OSError as e:
+                    st.error(f"Không ghi được file báo cáo: {e}")
+                    return
+                except (RuntimeError, ValueError) as e:
+                    st.error(str(e))
+                    return
+                stage_record['files'] = len(written)
+        if st.session_state.get("bulk_export_zip"):
+            zip_name, zip_bytes, file_count = st.session_state.bulk_export_zip
+            st.caption(f"{file_count} file — {len(zip_bytes) / 1e6:,.1f} MB")
+            st.download_button("Tải file zip", data=zip_bytes, file_name=zip_name, mime="application/zip",
+                               key="bulk_export_download")
+
+def display_perf_panel(perf_trace):
+    """Hiển thị thời gian từng bước của lần chạy vừa rồi trong sidebar (chỉ cho admin)."""
+    with st.sidebar.expander(f"⏱️ Hiệu năng lần chạy này ({perf_trace.scope})", expanded=True):
+        st.caption(f"Tổng: {perf_trace.total_ms:,.1f} ms — run {perf_trace.run_id}")
+        cache_warmer = get_cache_warmer()
+        if cache_warmer.last_run_at is not None:
+            st.caption(f"Làm nóng cache: {cache_warmer.runs} lần, lần cuối {cache_warmer.last_duration_seconds:,.2f} s"
+                       + (f" — lỗi: {cache_warmer.last_error}" if cache_warmer.last_error else ""))
+        st.dataframe(pd.DataFrame(perf_trace.records), hide_index=True, use_container_width=True)
+
+def start_perf_trace(scope="app"):
+    """
+    Bật theo dõi hiệu năng khi admin bật bảng điều khiển hoặc khi có PERF_LOG_PATH.
+
+    Nút bật/tắt chỉ được vẽ trong lần chạy toàn app; lần chạy lại của fragment đọc trạng thái của nó từ session_state.
+    """
+    is_admin = st.session_state.get("username") in ADMIN_USERS
+    if is_admin and scope == "app":
+        st.sidebar.toggle("Hiển thị hiệu năng", key="perf_panel_toggle")
+    show_panel = is_admin and st.session_state.get("perf_panel_toggle", False)
+    if "perf_session_id" not in st.session_state:
+        st.session_state.perf_session_id = uuid.uuid4().hex[:12]
+    perf_trace = PerfTrace(enabled=show_panel or bool(PERF_LOG_PATH), log_path=PERF_LOG_PATH,
+                           session_id=st.session_state.perf_session_id, scope=scope)
+    return activate_trace(perf_trace)
+
+@contextmanager
+def fragment_perf_trace(fragment_name):
+    """
+    Dùng trace của lần chạy toàn app nếu đang có (các stage của fragment nằm dưới 'fragment:<tên>');
+    khi chỉ fragment chạy lại thì mở một trace riêng cho vùng đó.
+    """
+    if is_trace_active():
+        perf_trace = current_trace()
+        with perf_trace.stage(f"fragment:{fragment_name}"):
+            yield perf_trace
+        return
+    perf_trace = start_perf_trace(scope=f"fragment:{fragment_name}")
+    try:
+        yield perf_trace
+    finally:
+        perf_trace.finish()
+        activate_trace(None)
+    if st.session_state.get("perf_panel_toggle"):
+        display_perf_panel(perf_trace)
 
 def display_login_form():
     """Hiển thị form đăng nhập và xử lý xác thực."""
@@ -115,6 +591,7 @@ def display_login_form():
         if username == CORRECT_USERNAME and password == CORRECT_PASSWORD:
             st.session_state.authenticated = True
             st.session_state.login_error = False
+            st.session_state.username = username
             st.rerun()
         else:
             st.session_state.authenticated = False
@@ -125,11 +602,19 @@ def display_login_form():
 
 def run_dashboard_content():
     """Chạy nội dung chính của dashboard sau khi đã xác thực."""
-    
+    perf_trace = current_trace()
+    data_source = get_data_source(DATA_SOURCE_TYPE, DATA_PATH, DATA_TABLE)
+    fx_provider = get_fx_provider(FX_LINK)
+
     # --- Bước 1: Lấy tỷ giá từ API làm giá trị mặc định và tham chiếu ---
-    api_fx_rate, update_time = fx_getter(FX_LINK)
+    # Khi tỷ giá đã cũ hoặc chưa có, get_rate() bắt đầu tải ở luồng nền; sheet được đọc trong lúc đó
+    fx_provider.get_rate('USD', 'sell')
+    with perf_trace.stage("load_base"):
+        base_data = load_base_data(data_source)
+    with perf_trace.stage("fx"):
+        api_fx_rate, update_time, fx_age_seconds = fx_getter(FX_LINK, wait_seconds=FX_COLD_START_WAIT_SECONDS)
     if api_fx_rate is None:
-        api_fx_rate = 25450.0  # Giá trị dự phòng nếu API lỗi
+        api_fx_rate = FALLBACK_FX_RATE  # Giá trị dự phòng nếu API lỗi
         update_time = "N/A"
         st.warning(f"Không thể lấy tỷ giá từ VCB. Đang sử dụng tỷ giá mặc định: {api_fx_rate:,.0f}")
 
@@ -142,6 +627,7 @@ def run_dashboard_content():
     
     # *** THAY ĐỔI: Hiển thị tỷ giá tham chiếu từ API trong m_col4r1 ***
     m_col4r1.metric(label="Tỷ Giá bán USD (VND/USD)", help=f"Tỷ giá được cập nhật lúc: {update_time}", value=f"{api_fx_rate:,.0f}")
+    m_col4r1.caption(f"Lấy từ VCB: {format_fx_age(fx_age_seconds)}")
 
     # Widget cho người dùng nhập tỷ giá để tính toán
     with m_col4r2:
@@ -156,16 +642,27 @@ def run_dashboard_content():
             format="%.0f"
         )
 
-    # --- Bước 3: Tải và xử lý dữ liệu với tỷ giá do người dùng nhập ---
-    df_main, gsheet_status_message = load_and_process_gsheet_data(GSHEET_URL, user_fx_rate)
+    # --- Bước 3: Áp tỷ giá do người dùng nhập lên dữ liệu đã đọc ---
+    with perf_trace.stage("load"):
+        df_main, data_version, gsheet_status_message = load_and_process_gsheet_data(data_source, user_fx_rate, base_data)
 
     # --- Xử lý trạng thái tải dữ liệu ---
     if df_main is None or df_main.empty:
         st.error(gsheet_status_message)
         st.stop()
+    display_data_changes(data_source.source_id, data_version.split("@")[0])
+    display_rejected_rows(data_source.source_id, data_version.split("@")[0])
+    # Phần trước '@' của data_version là fingerprint nội dung, không phụ thuộc tỷ giá
+    with perf_trace.stage("filter_index", cached=True):
+        filter_index = get_filter_index(df_main, data_version.split("@")[0])
+    unknown_floors = FLOOR_LAYOUT.unknown_floors(filter_index['floor_options'])
+    if unknown_floors:
+        st.caption(f"Tầng chưa có trong thứ tự tầng (xếp theo số tầng ước đoán): {', '.join(unknown_floors)}")
 
     # --- Bước 4: Tính toán và hiển thị các chỉ số dựa trên dữ liệu đã được xử lý bằng user_fx_rate ---
-    h_rental_price, h_service_price, avg_w_rental, l_rental_price, l_service_price, avg_w_service = calculate_metrics_values(df_main)
+    with perf_trace.stage("metrics", cached=True):
+        portfolio_metrics = get_portfolio_metrics(df_main, data_source.source_id, data_version.split("@")[0], float(user_fx_rate))
+    h_rental_price, h_service_price, avg_w_rental, l_rental_price, l_service_price, avg_w_service = headline_metrics(portfolio_metrics['total'])
     
     m_col1r1.metric(label="Giá thuê Cao Nhất (USD)", value=f"${h_rental_price:,.2f}")
     m_col2r1.metric(label="Giá thuê TB theo Diện Tích (USD)", help="(Giá thuê x diện tích) / tổng diện tích", value=f"${avg_w_rental:,.2f}")
@@ -175,67 +672,117 @@ def run_dashboard_content():
     m_col2r2.metric(label="Phí DV TB theo Diện Tích (USD)", value=f"${avg_w_service:,.2f}")
     m_col3r2.metric(label="Phí DV Thấp Nhất (USD)", value=f"${l_service_price:,.2f}")
     
-    # --- Bước 5: Bộ lọc và hiển thị biểu đồ, bảng ---
-    st.header("Bộ Lọc Dữ Liệu")
-    filter_container = st.container()
-    with filter_container:
-            customer_filter_col, floor_filter_col = st.columns(2)
-
-            with customer_filter_col:
-                customer_options_unique = sorted(df_main['customer_name'].astype(str).unique().tolist())
-                selected_customers_multiselect = st.multiselect(
-                    'Chọn Khách Hàng:',
-                    options=customer_options_unique,
-                    default=[], 
-                    key="customer_multiselect_filter"
-                )
-                is_all_customers_view_active = not selected_customers_multiselect
-                final_selected_customers_for_predicate = customer_options_unique if is_all_customers_view_active else selected_customers_multiselect
-
-            with floor_filter_col:
-                floor_options_unique = sorted(df_main['floor_selector_val'].unique().tolist(), key=lambda x: CUSTOM_FLOOR_SORT_ORDER.index(x) if x in CUSTOM_FLOOR_SORT_ORDER else float('inf'))
-                selected_floors_multiselect = st.multiselect(
-                    'Chọn Tầng:',
-                    options=floor_options_unique,
-                    default=[], 
-                    key="floor_multiselect_filter"
-                )
-                is_all_floors_view_active = not selected_floors_multiselect
-                final_selected_floors_for_predicate = floor_options_unique if is_all_floors_view_active else selected_floors_multiselect
-
-    # Lọc DataFrame dựa trên lựa chọn
-    df_filtered_for_table_and_chart = df_main.copy()
-    if not is_all_customers_view_active:
-        df_filtered_for_table_and_chart = df_filtered_for_table_and_chart[df_filtered_for_table_and_chart['customer_name'].astype(str).isin(final_selected_customers_for_predicate)]
-    if not is_all_floors_view_active:
-            df_filtered_for_table_and_chart = df_filtered_for_table_and_chart[df_filtered_for_table_and_chart['floor_selector_val'].isin(final_selected_floors_for_predicate)]
+    if st.session_state.get("username") in ADMIN_USERS:
+        display_bulk_export_panel(df_main, user_fx_rate)
 
-    st.markdown("---")
-    data_display_container = st.container()
-    with data_display_container:
-        chart_col, table_col = st.columns([2, 3])
-
-        with chart_col:
-            st.subheader("Biểu Đồ Phân Bổ Diện Tích và Giá Thuê theo Tầng")
-            altair_chart_object = create_advanced_price_chart(
-                df_main.copy(),
-                final_selected_customers_for_predicate,
-                final_selected_floors_for_predicate,
-                is_all_customers_view_active,
-                is_all_floors_view_active,
-                CUSTOM_FLOOR_SORT_ORDER
-            )
-            st.altair_chart(altair_chart_object, use_container_width=True)
+    # --- Bước 5: Bộ lọc, biểu đồ, bảng và kịch bản tỷ giá chạy lại riêng khi input của chúng thay đổi ---
+    display_dashboard_body(df_main, data_version, filter_index, portfolio_metrics, user_fx_rate)
+    display_fx_sensitivity(df_main, data_version.split("@")[0], user_fx_rate, filter_index['floor_options'])
+    display_history_trends(filter_index['floor_options'], filter_index['customer_options'])
+
+@st.fragment
+def display_dashboard_body(df_main, data_version, filter_index, portfolio_metrics, user_fx_rate):
+    """
+    Vùng bộ lọc + biểu đồ + bảng.
+
+    Là một fragment: khi bộ lọc thay đổi chỉ vùng này chạy lại, với dữ liệu, chỉ mục bộ lọc và chỉ số
+    của lần chạy toàn app gần nhất; tỷ giá, tải dữ liệu và chỉ số tổng không bị tính lại.
+    """
+    with fragment_perf_trace("body") as perf_trace:
+        st.header("Bộ Lọc Dữ Liệu")
+        filter_container = st.container()
+        with filter_container:
+                customer_filter_col, floor_filter_col = st.columns(2)
 
+                with customer_filter_col:
+                    customer_options_unique = filter_index['customer_options']
+                    selected_customers_multiselect = st.multiselect(
+                        'Chọn Khách Hàng:',
+                        options=customer_options_unique,
+                        default=[], 
+                        key="customer_multiselect_filter"
+                    )
+                    is_all_customers_view_active = not selected_customers_multiselect
+                    final_selected_customers_for_predicate = customer_options_unique if is_all_customers_view_active else selected_customers_multiselect
 
-        with table_col:
-            st.subheader("Bảng Chi Tiết Giá Thuê và Phí Dịch Vụ")
-            st.text("Tỷ giá áp dụng: " + f"{user_fx_rate:,.0f} VND/USD")
-            display_ag_grid_table(df_filtered_for_table_and_chart, CUSTOM_FLOOR_SORT_ORDER, st)
-        if df_filtered_for_table_and_chart.empty and (not is_all_customers_view_active or not is_all_floors_view_active) :
-                st.info("Không có dữ liệu nào khớp với các lựa chọn trong bộ lọc.")
-        elif df_main is None and gsheet_status_message is None: 
-            st.info("Đang chờ tải dữ liệu...")
+                with floor_filter_col:
+                    floor_options_unique = filter_index['floor_options']
+                    selected_floors_multiselect = st.multiselect(
+                        'Chọn Tầng:',
+                        options=floor_options_unique,
+                        default=[], 
+                        key="floor_multiselect_filter"
+                    )
+                    is_all_floors_view_active = not selected_floors_multiselect
+                    final_selected_floors_for_predicate = floor_options_unique if is_all_floors_view_active else selected_floors_multiselect
+
+        # Lọc DataFrame dựa trên lựa chọn
+        with perf_trace.stage("filter") as stage_record:
+            df_filtered_for_table_and_chart = filter_rows(df_main, filter_index,
+                                                          selected_customers_multiselect,
+                                                          selected_floors_multiselect)
+            stage_record['rows'] = len(df_filtered_for_table_and_chart)
+        with perf_trace.stage("selection_metrics", cached=True):
+            selection_metrics = get_selection_metrics(df_filtered_for_table_and_chart, data_version,
+                                                      tuple(selected_customers_multiselect),
+                                                      tuple(selected_floors_multiselect))
+        display_metrics_breakdown(portfolio_metrics, selection_metrics, filter_index['floor_options'])
+
+        st.markdown("---")
+        data_display_container = st.container()
+        with data_display_container:
+            chart_col, table_col = st.columns([2, 3])
+
+            with chart_col:
+                st.subheader("Biểu Đồ Phân Bổ Diện Tích và Giá Thuê theo Tầng")
+                chart_mode_label = st.radio("Chế độ biểu đồ", options=list(CHART_MODE_OPTIONS), horizontal=True,
+                                            key="chart_mode_radio", label_visibility="collapsed")
+                chart_mode = resolve_chart_mode(df_main, CHART_MODE_OPTIONS[chart_mode_label])
+                if chart_mode == 'aggregated':
+                    st.caption("Mỗi thanh là một khoảng giá thuê trên một tầng; rê chuột để xem số HĐ và giá bình quân.")
+                with perf_trace.stage("chart", chart_mode=chart_mode) as stage_record:
+                    altair_chart_object = create_advanced_price_chart(
+                        df_main,
+                        final_selected_customers_for_predicate,
+                        final_selected_floors_for_predicate,
+                        is_all_customers_view_active,
+                        is_all_floors_view_active,
+                        FLOOR_LAYOUT,
+                        data_version=data_version,
+                        chart_mode=chart_mode
+                    )
+                    st.altair_chart(altair_chart_object, use_container_width=True)
+                if perf_trace.enabled:
+                    stage_record['payload_bytes'] = chart_spec_size(altair_chart_object)
+                    # Chỉ khi bảng hiệu năng đang mở: tuần tự hóa cả bảng dữ liệu tốn kém ở quy mô lớn
+                    if st.session_state.get("perf_panel_toggle"):
+                        stage_record['unpruned_payload_bytes'] = get_unpruned_chart_spec_size(df_main, data_version)
+
+
+            with table_col:
+                st.subheader("Bảng Chi Tiết Giá Thuê và Phí Dịch Vụ")
+                st.text("Tỷ giá áp dụng: " + f"{user_fx_rate:,.0f} VND/USD")
+                row_model, group_tree = 'client', None
+                # Bảng nhỏ dùng nhóm của AgGrid; bảng lớn chọn giữa cây tầng / khách hàng tính sẵn
+                # và bảng phân trang (sắp xếp, tìm khách hàng trên server)
+                if len(df_filtered_for_table_and_chart) > TREE_ROW_THRESHOLD:
+                    row_model = st.radio("Kiểu bảng", options=['tree', 'server'], horizontal=True,
+                                         format_func=lambda model: "Cây tầng / khách hàng" if model == 'tree'
+                                         else "Phân trang (sắp xếp, tìm kiếm)",
+                                         key="price_detail_row_model")
+                if row_model == 'tree':
+                    with perf_trace.stage("group_tree", cached=True):
+                        group_tree = get_group_tree(df_filtered_for_table_and_chart, data_version,
+                                                    tuple(selected_customers_multiselect),
+                                                    tuple(selected_floors_multiselect))
+                with perf_trace.stage("grid") as stage_record:
+                    grid_payload_df = display_ag_grid_table(df_filtered_for_table_and_chart, FLOOR_LAYOUT, st,
+                                                            row_model=row_model, group_tree=group_tree)
+                if perf_trace.enabled and grid_payload_df is not None:
+                    stage_record['rows'] = len(grid_payload_df)
+                    stage_record['payload_bytes'] = len(grid_payload_df.to_json(orient='records').encode('utf-8'))
+            if df_filtered_for_table_and_chart.empty and (not is_all_customers_view_active or not is_all_floors_view_active) :
+                    st.info("Không có dữ liệu nào khớp với các lựa chọn trong bộ lọc.")
 
 def run_app():
     """Khởi tạo và chạy ứng dụng Streamlit."""
@@ -244,6 +791,9 @@ def run_app():
     if "login_error" not in st.session_state:
         st.session_state.login_error = False
 
+    # Luồng làm nóng cache khởi động ngay từ trang đăng nhập, trước khi ai đó vào dashboard
+    get_cache_warmer().touch()
+
     if not st.session_state.authenticated:
         display_login_form()
     else:
@@ -253,7 +803,14 @@ def run_app():
                 del st.session_state[key]
             st.rerun()
         
-        run_dashboard_content()
+        perf_trace = start_perf_trace()
+        try:
+            run_dashboard_content()
+        finally:
+            perf_trace.finish()
+            activate_trace(None)
+        if st.session_state.get("perf_panel_toggle"):
+            display_perf_panel(perf_trace)
 
 if __name__ == "__main__":
     run_app()
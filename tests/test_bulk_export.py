@@ -0,0 +1,30 @@
+"""Per-floor and per-customer reports built group by group match the full detail table."""
+import os
+
+import pandas as pd
+
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.bulk_export import build_export_frame, export_reports
+from utils.data_loader import apply_fx_rate, clean_base_data
+from utils.detail_price import rename_map_aggrid
+
+
+def read_reports(folder):
+    frames = [pd.read_csv(os.path.join(folder, name), encoding='utf-8-sig', dtype={rename_map_aggrid['floor']: str})
+              for name in sorted(os.listdir(folder))]
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_group_reports_cover_the_detail_table(tmp_path):
+    df_priced = apply_fx_rate(clean_base_data(generate_rent_roll(2_000, seed=3, n_customers=40))[0], 25450.0)
+    written = export_reports(df_priced, str(tmp_path), formats=('csv',), max_workers=1)
+    assert len(written) == 3 + df_priced['floor'].nunique() + df_priced['customer_name'].nunique()
+
+    df_export = build_export_frame(df_priced)
+    sort_cols = list(df_export.columns)
+    for folder in ('theo_tang', 'theo_khach_hang'):
+        df_reports = read_reports(tmp_path / folder)
+        pd.testing.assert_frame_equal(
+            df_reports.sort_values(sort_cols, ignore_index=True),
+            df_export.astype({rename_map_aggrid['floor']: str}).sort_values(sort_cols, ignore_index=True),
+            check_dtype=False)
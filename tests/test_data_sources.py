@@ -0,0 +1,44 @@
+"""GSheetsSource polling against a stand-in for the Streamlit GSheets connection."""
+import time
+
+import pandas as pd
+
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.data_sources import GSHEETS_POLL_SECONDS, GSheetsSource
+
+
+class SheetConnection:
+    """Serves the current sheet content through a ttl cache, like conn.read; records every read and fetch."""
+
+    def __init__(self, df_sheet):
+        self.df_sheet = df_sheet
+        self.read_ttls = []
+        self.fetches = 0
+        self._cached = None
+
+    def read(self, spreadsheet, usecols, ttl):
+        self.read_ttls.append(ttl)
+        if self._cached is None or time.monotonic() - self._cached[0] >= ttl:
+            self.fetches += 1
+            self._cached = (time.monotonic(), self.df_sheet.copy())
+        return self._cached[1].copy()
+
+
+def test_sheet_is_fetched_once_per_poll_and_again_for_the_warmer():
+    df_first = generate_rent_roll(50, seed=1)
+    connection = SheetConnection(df_first)
+    data_source = GSheetsSource(connection, "https://sheet")
+    first_token = data_source.change_token()
+
+    connection.df_sheet = generate_rent_roll(50, seed=2)
+    # Within the poll interval user requests reuse the last read, or the connection's cache of it
+    assert data_source.change_token() == first_token
+    pd.testing.assert_frame_equal(data_source.read(), df_first)
+    pd.testing.assert_frame_equal(data_source.read(), df_first)
+    assert connection.fetches == 1
+
+    # The warmer asks for a fresher sheet shortly before expiry and must see the new content
+    assert data_source.change_token(max_age_seconds=0) != first_token
+    pd.testing.assert_frame_equal(data_source.read(), connection.df_sheet)
+    assert connection.fetches == 2
+    assert connection.read_ttls == [GSHEETS_POLL_SECONDS, GSHEETS_POLL_SECONDS, 0]
@@ -0,0 +1,57 @@
+"""An IncrementalRentRoll delta gives the same frame and portfolio metrics as a full rebuild of the new snapshot."""
+import pandas as pd
+
+import utils.delta_sync
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.data_loader import apply_fx_rate, clean_base_data
+from utils.delta_sync import CONTRACT_KEY_COLS, IncrementalRentRoll
+from utils.metrics_engine import compute_portfolio_metrics
+
+FX_RATE = 25450.0
+# Only the new snapshot has contracts on this floor
+NEW_FLOOR = '26'
+
+
+def test_delta_with_every_change_type_matches_a_full_rebuild(monkeypatch):
+    df_full = generate_rent_roll(2_000, seed=4, n_customers=60, invalid_fraction=0)
+    df_previous = df_full[df_full['floor'] != NEW_FLOOR].reset_index(drop=True)
+
+    # One update and one delete of contracts with a unique key, and one insert on a floor
+    # the previous snapshot did not have
+    unique_rows = df_previous.index[~df_previous.duplicated(CONTRACT_KEY_COLS, keep=False)]
+    updated_row, deleted_row = unique_rows[10], unique_rows[20]
+    df_snapshot = df_previous.copy()
+    df_snapshot.loc[updated_row, 'rental_vnd'] = df_snapshot.loc[updated_row, 'rental_vnd'] * 1.1
+    df_snapshot = df_snapshot.drop(index=deleted_row)
+    new_contract = df_full[df_full['floor'] == NEW_FLOOR].iloc[[0]].assign(customer_name="Công ty mới")
+    df_snapshot = pd.concat([df_snapshot, new_contract], ignore_index=True)
+
+    rent_roll = IncrementalRentRoll()
+    df_base, data_fingerprint, _ = rent_roll.update(df_previous)
+    rent_roll.portfolio_metrics(apply_fx_rate(df_base, FX_RATE), data_fingerprint, FX_RATE)
+
+    metric_updates = []
+    original_update = utils.delta_sync.update_portfolio_metrics
+
+    def recording_update(previous_metrics, df_input, changed_floors, changed_customers):
+        metric_updates.append((changed_floors, changed_customers))
+        return original_update(previous_metrics, df_input, changed_floors, changed_customers)
+
+    monkeypatch.setattr(utils.delta_sync, 'update_portfolio_metrics', recording_update)
+    df_base, data_fingerprint, _ = rent_roll.update(df_snapshot)
+    metrics = rent_roll.portfolio_metrics(apply_fx_rate(df_base, FX_RATE), data_fingerprint, FX_RATE)
+
+    delta = rent_roll.last_delta
+    assert not delta['full_rebuild']
+    assert (delta['inserted'], delta['updated'], delta['deleted']) == (1, 1, 1)
+    assert NEW_FLOOR in delta['changed_floors'] and "Công ty mới" in delta['changed_customers']
+    # The metrics came from the incremental update, for the touched floors and customers only
+    ((changed_floors, changed_customers),) = metric_updates
+    assert len(changed_floors) <= 3 and len(changed_customers) <= 3
+
+    df_expected, _ = clean_base_data(df_snapshot)
+    pd.testing.assert_frame_equal(df_base, df_expected, check_categorical=False)
+    expected_metrics = compute_portfolio_metrics(apply_fx_rate(df_expected, FX_RATE))
+    pd.testing.assert_series_equal(metrics['total'], expected_metrics['total'])
+    for scope in ('by_floor', 'by_customer'):
+        pd.testing.assert_frame_equal(metrics[scope], expected_metrics[scope], check_categorical=False)
@@ -0,0 +1,61 @@
+"""Server-side pages of the detail table: all pages together are the searched frame in floor, then sort order."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.data_loader import apply_fx_rate, clean_base_data
+from utils.detail_price import build_server_page, rename_map_aggrid
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT, floor_ranks
+
+PAGE_SIZE = 25
+
+
+@pytest.fixture(scope='module')
+def df_priced():
+    return apply_fx_rate(clean_base_data(generate_rent_roll(1_000, seed=5, n_customers=30))[0], 25450.0)
+
+
+def is_group_row(page_df):
+    return page_df['__group_row'].astype(bool)
+
+
+def test_pages_hold_the_searched_rows_in_floor_then_sort_order(df_priced):
+    page_args = dict(sort_field='rental_usd', ascending=False, search_text="công TY 0001")
+    _, total_rows, total_pages, _ = build_server_page(df_priced, DEFAULT_FLOOR_LAYOUT, 1, PAGE_SIZE, **page_args)
+    pages = [build_server_page(df_priced, DEFAULT_FLOOR_LAYOUT, page_number, PAGE_SIZE, **page_args)[0]
+             for page_number in range(1, total_pages + 1)]
+
+    df_expected = df_priced[df_priced['customer_name'].astype(str).str.contains("công ty 0001", case=False)]
+    df_expected = df_expected.iloc[np.lexsort((-df_expected['rental_usd'].to_numpy(),
+                                               floor_ranks(df_expected, DEFAULT_FLOOR_LAYOUT)))]
+    assert 0 < total_rows == len(df_expected) < len(df_priced)
+    assert total_pages == -(-total_rows // PAGE_SIZE)
+    assert all((~is_group_row(page)).sum() == PAGE_SIZE for page in pages[:-1])
+
+    contract_rows = pd.concat([page[~is_group_row(page)] for page in pages], ignore_index=True)
+    for col in ('customer_name', 'floor', 'rental_usd'):
+        assert contract_rows[rename_map_aggrid[col]].tolist() == df_expected[col].astype(
+            str if col != 'rental_usd' else float).tolist(), col
+
+
+def test_group_headers_sum_the_whole_floor(df_priced):
+    page_df, *_ = build_server_page(df_priced, DEFAULT_FLOOR_LAYOUT, page_number=3, page_size=PAGE_SIZE)
+    floor_keys = df_priced['floor'].astype(str)
+    floor_area = df_priced['sqr'].groupby(floor_keys).sum()
+    floor_count = floor_keys.value_counts()
+
+    headers = page_df[is_group_row(page_df)]
+    floor_col, customer_col, area_col = (rename_map_aggrid[col] for col in ('floor', 'customer_name', 'sqr'))
+    # One header per floor on the page, right before that floor's rows
+    assert headers[floor_col].tolist() == list(dict.fromkeys(page_df[floor_col]))
+    assert (page_df[floor_col].ne(page_df[floor_col].shift()) == is_group_row(page_df)).all()
+    for _, header in headers.iterrows():
+        assert header[area_col] == pytest.approx(floor_area[header[floor_col]], rel=1e-5)
+        assert header[customer_col] == f"Tầng {header[floor_col]} ({floor_count[header[floor_col]]} HĐ)"
+
+
+def test_page_number_is_clamped(df_priced):
+    _, total_rows, total_pages, page_number = build_server_page(df_priced, DEFAULT_FLOOR_LAYOUT, 10**6, PAGE_SIZE)
+    assert total_rows == len(df_priced) and page_number == total_pages
+    assert build_server_page(df_priced, DEFAULT_FLOOR_LAYOUT, 0, PAGE_SIZE)[3] == 1
@@ -0,0 +1,75 @@
+"""FxRateProvider against a local stub of the VCB endpoint, and its backoff against a port nothing listens on."""
+import pytest
+
+from benchmarks.cold_start import STUB_FX_XML, start_stub_server
+from utils.fx_provider import FxRateProvider, parse_vcb_rates
+
+UNREACHABLE_FX_URL = "http://127.0.0.1:9/fx.xml"
+STUB_FX_TIMESTAMP = "10/16/2026 08:30:00 AM"
+
+
+@pytest.fixture
+def fx_provider(tmp_path):
+    return FxRateProvider(UNREACHABLE_FX_URL, cache_path=str(tmp_path / "fx_rates.json"), timeout=2,
+                          retry_base_seconds=30, retry_max_seconds=100)
+
+
+@pytest.fixture
+def vcb_stub():
+    """Serves the fixture rate XML until the payloads are cleared; then every request gets a 404."""
+    payloads = {'/fx.xml': ('text/xml', STUB_FX_XML.format(timestamp=STUB_FX_TIMESTAMP).encode('utf-8'))}
+    server, base_url = start_stub_server(payloads, latency_seconds=0)
+    yield payloads, f"{base_url}/fx.xml"
+    server.shutdown()
+
+
+def test_stub_rates_round_trip_the_disk_cache_and_outlive_a_failing_source(vcb_stub, tmp_path):
+    payloads, fx_url = vcb_stub
+    cache_path = str(tmp_path / "fx_rates.json")
+    rates, fx_time = parse_vcb_rates(payloads['/fx.xml'][1])
+    assert rates['USD'] == (25180.0, 25210.0, 25450.0)
+    assert fx_time == "16/10/2026"
+
+    fx_provider = FxRateProvider(fx_url, cache_path=cache_path, timeout=2)
+    assert fx_provider.refresh()
+    assert fx_provider.get_rate('USD', 'transfer')[:2] == (25210.0, "16/10/2026")
+    assert fx_provider.get_rate('USD', 'sell')[:2] == (25450.0, "16/10/2026")
+
+    # A restarted server starts from the disk cache without fetching; a cache of another URL is ignored
+    payloads.clear()
+    restarted = FxRateProvider(fx_url, cache_path=cache_path, timeout=2)
+    assert not restarted.is_stale()
+    assert restarted.get_rate('USD', 'sell')[:2] == (25450.0, "16/10/2026")
+    assert FxRateProvider(f"{fx_url}?other", cache_path=cache_path).is_stale()
+
+    # Once stale, the cached rate is still served while the refresh against the failing stub fails
+    stale = FxRateProvider(fx_url, cache_path=cache_path, max_age_seconds=0, timeout=2)
+    assert stale.get_rate('USD', 'sell')[0] == 25450.0
+    assert stale.wait_for_refresh(5)
+    assert stale.failures == 1 and "404" in stale.last_error
+    assert stale.get_rate('USD', 'sell')[:2] == (25450.0, "16/10/2026")
+    assert FxRateProvider(fx_url, cache_path=cache_path).get_rate('USD', 'sell')[0] == 25450.0
+
+
+def test_failed_fetches_back_off_with_growing_delay(fx_provider):
+    assert not fx_provider.refresh()
+    assert fx_provider.last_error and fx_provider.is_backing_off()
+    delays = [fx_provider.retry_delay()]
+    for _ in range(3):
+        fx_provider.refresh()
+        delays.append(fx_provider.retry_delay())
+    assert delays == [30, 60, 100, 100]
+
+
+def test_get_rate_does_not_refresh_while_backing_off(fx_provider, monkeypatch):
+    fx_provider.refresh()
+    started = []
+    monkeypatch.setattr(fx_provider, 'refresh_async', lambda: started.append(True))
+
+    assert fx_provider.get_rate('USD', 'sell') == (None, None, None)
+    assert not started
+
+    # Once the delay has passed, the next call retries
+    fx_provider.last_failed_at -= fx_provider.retry_delay()
+    fx_provider.get_rate('USD', 'sell')
+    assert started == [True]
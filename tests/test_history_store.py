@@ -0,0 +1,95 @@
+"""Dated snapshots written to the HistoryStore read back per month, per day and as monthly rollups."""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.data_loader import apply_fx_rate, clean_base_data
+from utils.history_store import HistoryStore, org_fx_divergence
+
+# Snapshot date -> VND/USD rate, appended out of order within October
+SNAPSHOT_RATES = {'2026-08-30': 25100.0, '2026-08-31': 25150.0, '2026-09-15': 25300.0,
+                  '2026-10-16': 25450.0, '2026-10-01': 25400.0}
+
+
+@pytest.fixture(scope='module')
+def df_base():
+    df_base = clean_base_data(generate_rent_roll(400, seed=11, n_customers=25))[0]
+    # Contracts without a signed rate have no divergence
+    df_base.loc[df_base.index[:5], 'org_fx'] = 0
+    return df_base
+
+
+@pytest.fixture
+def history_store(df_base, tmp_path):
+    history_store = HistoryStore(str(tmp_path / "history"))
+    for snapshot_date, fx_rate in SNAPSHOT_RATES.items():
+        assert history_store.append_snapshot(apply_fx_rate(df_base, fx_rate), fx_rate, snapshot_date=snapshot_date,
+                                             version=f"v@{fx_rate:g}")
+    return history_store
+
+
+def test_snapshot_rows_round_trip(history_store, df_base):
+    assert history_store.months() == ['2026-08', '2026-09', '2026-10']
+    assert [f"{date:%Y-%m-%d}" for date in history_store.snapshot_dates()] == sorted(SNAPSHOT_RATES)
+    # The same version of a day is not written again
+    assert not history_store.append_snapshot(df_base, 25300.0, snapshot_date='2026-09-15', version="v@25300")
+
+    rows = history_store.query_rows(start='2026-09-15', end='2026-09-15')
+    df_priced = apply_fx_rate(df_base, 25300.0)
+    expected = pd.DataFrame({col: df_priced[col].astype(str if col in ('floor', 'customer_name') else 'float64')
+                             for col in ('floor', 'customer_name', 'sqr', 'rental_usd', 'service_usd')})
+    sort_cols = list(expected.columns)
+    pd.testing.assert_frame_equal(rows[sort_cols].sort_values(sort_cols, ignore_index=True),
+                                  expected.sort_values(sort_cols, ignore_index=True))
+    assert (rows['fx_rate'] == 25300.0).all()
+
+
+def test_queries_only_open_the_requested_month_partitions(history_store):
+    # Clobbered files of a later month would fail any scan that opened them (the dataset
+    # schema is taken from the first file, so that one stays readable)
+    partition = os.path.join(history_store.directory, 'rows', "month=2026-10")
+    for name in os.listdir(partition):
+        with open(os.path.join(partition, name), 'wb') as clobbered:
+            clobbered.write(b"not parquet")
+    with pytest.raises(pa.ArrowInvalid):
+        history_store.query_rows(start='2026-10-01')
+
+    rows = history_store.query_rows(start='2026-09-01', end='2026-09-30', columns=['rental_usd'])
+    assert set(rows['snapshot_date']) == {pd.Timestamp('2026-09-15')}
+    assert list(rows.columns) == ['snapshot_date', 'floor', 'customer_name', 'rental_usd']
+
+    floor = rows['floor'].iloc[0]
+    floor_rows = history_store.query_rows(start='2026-09-01', end='2026-09-30', floors=[floor])
+    assert len(floor_rows) == (rows['floor'] == floor).sum() and set(floor_rows['floor']) == {floor}
+
+
+def test_monthly_rollup_holds_each_months_last_snapshot(history_store):
+    daily = history_store.query_metrics('total', frequency='daily')
+    assert len(daily) == len(SNAPSHOT_RATES)
+
+    monthly = history_store.query_metrics('total', frequency='monthly')
+    assert list(monthly['month']) == ['2026-08', '2026-09', '2026-10']
+    last_dates = pd.to_datetime(['2026-08-31', '2026-09-15', '2026-10-16'])
+    assert list(monthly['snapshot_date']) == list(last_dates)
+    metric_cols = [col for col in daily.columns if col not in ('snapshot_date', 'group', 'scope')]
+    pd.testing.assert_frame_equal(monthly[metric_cols],
+                                  daily[daily['snapshot_date'].isin(last_dates)][metric_cols].reset_index(drop=True))
+
+    # A month range reads the rollup rows of those months only
+    september = history_store.query_metrics('by_floor', start='2026-09-01', end='2026-09-30', frequency='monthly')
+    assert set(september['month']) == {'2026-09'} and september['group'].is_unique
+
+    # Rebuilding from the per-month metrics gives the same rollup
+    history_store.rebuild_monthly_rollups()
+    pd.testing.assert_frame_equal(history_store.query_metrics('total', frequency='monthly'), monthly)
+
+
+def test_org_fx_divergence_against_the_signed_rate(history_store):
+    rows = org_fx_divergence(history_store.query_rows(start='2026-10-16', end='2026-10-16'))
+    signed = rows['org_fx'] > 0
+    assert (~signed).sum() == 5 and rows.loc[~signed, 'fx_vs_org_pct'].isna().all()
+    np.testing.assert_allclose(rows.loc[signed, 'fx_vs_org_pct'], 25450.0 / rows.loc[signed, 'org_fx'] - 1)
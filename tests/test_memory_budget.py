@@ -0,0 +1,54 @@
+"""
+Memory budget of loading a rent roll: Parquet read -> clean -> compact schema, and what a session keeps cached.
+
+The peaks are the Python heap seen by tracemalloc plus the growth of the Arrow memory
+pool (Parquet buffers and string columns live there), sampled while the load runs.
+"""
+import pytest
+
+from benchmarks.clean_parse import measure_peak_memory
+from benchmarks.rent_roll_generator import generate_rent_roll
+from benchmarks.run_benchmarks import BENCH_FX_RATE, session_memory
+from utils.data_loader import apply_fx_rate, clean_base_data
+from utils.data_sources import ParquetSource
+
+BUDGET_ROWS = 100_000
+# Peak Python heap + peak Arrow pool growth of one load, per source row (about 460 now)
+LOAD_PEAK_BYTES_PER_ROW = 640
+# Cached base frame + repriced USD columns of a session, per kept row (about 60 now, ~130 for the raw frame)
+CACHED_BYTES_PER_ROW = 80
+
+
+@pytest.fixture(scope='module')
+def parquet_source(tmp_path_factory):
+    data_path = tmp_path_factory.mktemp("memory") / "rent_roll.parquet"
+    generate_rent_roll(BUDGET_ROWS, seed=0).to_parquet(data_path)
+    return ParquetSource(str(data_path))
+
+
+def load_base(data_source):
+    df_base, status_message = clean_base_data(data_source.read())
+    assert df_base is not None, status_message
+    return df_base
+
+
+def test_load_clean_compact_peak_stays_within_budget(parquet_source):
+    # A first load outside the measurement, so one-off imports and pool growth are not counted
+    load_base(parquet_source)
+
+    python_peak, arrow_peak, df_base = measure_peak_memory(lambda: load_base(parquet_source))
+
+    peak_bytes_per_row = (python_peak + arrow_peak) / BUDGET_ROWS
+    assert peak_bytes_per_row <= LOAD_PEAK_BYTES_PER_ROW, (
+        f"load peaked at {peak_bytes_per_row:,.0f} bytes/row (Python {python_peak / 1e6:,.1f} MB, "
+        f"Arrow {arrow_peak / 1e6:,.1f} MB), budget {LOAD_PEAK_BYTES_PER_ROW}")
+    assert len(df_base) > 0.95 * BUDGET_ROWS
+
+
+def test_cached_session_frames_stay_within_budget(parquet_source):
+    df_raw = parquet_source.read()
+    df_base, _ = clean_base_data(df_raw)
+    df_priced = apply_fx_rate(df_base, BENCH_FX_RATE)
+
+    memory = session_memory(df_raw, df_base, df_priced)
+    assert memory['bytes_per_row'] <= CACHED_BYTES_PER_ROW, memory
@@ -0,0 +1,206 @@
+"""
+Runs main.py under streamlit.testing.v1.AppTest on a Parquet source and checks what the dashboard body fragment executes.
+
+AppTest replays every widget change as a full app run. The work a fragment-only rerun
+would repeat is the work done inside display_dashboard_body: its stages are the ones the
+perf log nests under 'fragment:body/', and its cached-function executions are counted by
+a note_cache_miss that looks for that function on the call stack (every cached function
+in main.py calls note_cache_miss first thing).
+"""
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import utils.perf_trace
+from benchmarks.rent_roll_generator import generate_rent_roll
+from benchmarks.rerun_scope_report import find_scope_leaks
+from utils.detail_price import DEFAULT_PAGE_SIZE
+
+APP_PATH = str(Path(__file__).resolve().parents[1] / "main.py")
+TEST_FX_URL = "http://127.0.0.1:9/fx.xml"
+VCB_SELL_RATE = 25450.0
+USER_FX_RATE = 26000.0
+# Function of the dashboard body fragment, and the prefix of its stages in a full app run
+BODY_FRAGMENT_FUNCTION = 'display_dashboard_body'
+BODY_STAGE_PREFIX = 'fragment:body/'
+# Cached functions of the header; the body fragment must never execute them
+APP_ONLY_CACHED_FUNCTIONS = ('load_source_data', 'get_repriced_data', 'get_filter_index')
+
+
+def executing_scope(frame):
+    """'body' if the frame runs inside the body fragment, else the scope of the thread's trace (None off-script)."""
+    while frame is not None:
+        if frame.f_code.co_name == BODY_FRAGMENT_FUNCTION:
+            return 'body'
+        frame = frame.f_back
+    return utils.perf_trace.current_trace().scope if utils.perf_trace.is_trace_active() else None
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    data_path = tmp_path / "rent_roll.parquet"
+    generate_rent_roll(3_000, seed=7).to_parquet(data_path)
+    fx_cache_path = tmp_path / "fx_rates.json"
+    # A fresh on-disk rate, so neither the app nor the cache warmer goes to the network
+    fx_cache_path.write_text(json.dumps({
+        'source': TEST_FX_URL,
+        'fetched_at': time.time(),
+        'fx_time': time.strftime("%d/%m/%Y"),
+        'rates': {'USD': [VCB_SELL_RATE - 270.0, VCB_SELL_RATE - 240.0, VCB_SELL_RATE]},
+    }), encoding="utf-8")
+
+    executions = Counter()
+    original_note_cache_miss = utils.perf_trace.note_cache_miss
+
+    def counting_note_cache_miss():
+        # The calling frame is the cached function
+        caller = sys._getframe(1)
+        executions[(executing_scope(caller), caller.f_code.co_name)] += 1
+        original_note_cache_miss()
+
+    monkeypatch.setattr(utils.perf_trace, 'note_cache_miss', counting_note_cache_miss)
+    st.cache_resource.clear()
+
+    app_test = AppTest.from_file(APP_PATH, default_timeout=60)
+    app_test.secrets.update({
+        'user_name': "tester",
+        'pass': "secret",
+        'DATA_SOURCE': "parquet",
+        'DATA_PATH': str(data_path),
+        'FX_URL': TEST_FX_URL,
+        'FX_CACHE_PATH': str(fx_cache_path),
+        'SNAPSHOT_DIR': "",
+        'HISTORY_DIR': "",
+        'PERF_LOG_PATH': str(tmp_path / "perf.jsonl"),
+    })
+    app_test.session_state['authenticated'] = True
+    app_test.session_state['username'] = "tester"
+    app_test.executions = executions
+    app_test.perf_log_path = tmp_path / "perf.jsonl"
+    yield app_test
+    st.cache_resource.clear()
+
+
+def read_new_run(app_test):
+    """Returns the one app run logged since the previous call."""
+    with open(app_test.perf_log_path, encoding='utf-8') as log_file:
+        runs = [json.loads(line) for line in log_file if line.strip()]
+    (run,) = runs[getattr(app_test, 'runs_seen', 0):]
+    app_test.runs_seen = len(runs)
+    assert run['scope'] == 'app'
+    assert not find_scope_leaks([run]), find_scope_leaks([run])
+    return run
+
+
+def take_executions(app_test):
+    """Returns the cached-function executions counted since the previous call, keyed by (scope, function)."""
+    executions = Counter(app_test.executions)
+    app_test.executions.clear()
+    return executions
+
+
+def body_stage_counts(run):
+    return Counter(stage['stage'][len(BODY_STAGE_PREFIX):] for stage in run['stages']
+                   if stage['stage'].startswith(BODY_STAGE_PREFIX))
+
+
+def stages_by_path(run):
+    return {stage['stage']: stage for stage in run['stages']}
+
+
+def assert_body_ran_once_without_header_work(run, executions):
+    stages = body_stage_counts(run)
+    assert stages['filter'] == 1 and stages['selection_metrics'] == 1
+    assert stages['chart'] == 1 and stages['grid'] == 1
+    for function_name in APP_ONLY_CACHED_FUNCTIONS:
+        assert executions[('body', function_name)] == 0, executions
+
+
+def test_body_fragment_only_filters_and_fx_change_only_reprices(app):
+    app.run()
+    assert not app.exception
+    first_run = read_new_run(app)
+    stages = stages_by_path(first_run)
+    # The cache warmer thread may have loaded the source already, so the read can be a hit either way
+    assert 'load_base/read' in stages and 'load/reprice' in stages
+    # Above TREE_ROW_THRESHOLD the unfiltered table is the group tree; the filtered ones below use AgGrid grouping
+    assert body_stage_counts(first_run)['group_tree'] == 1
+    all_rows = stages[BODY_STAGE_PREFIX + 'filter']['rows']
+    assert_body_ran_once_without_header_work(first_run, take_executions(app))
+
+    customer = app.multiselect(key="customer_multiselect_filter").options[0]
+    app.multiselect(key="customer_multiselect_filter").set_value([customer]).run()
+    assert not app.exception
+    filter_run = read_new_run(app)
+    stages = stages_by_path(filter_run)
+    # The header is served from cache; only the body works on the new selection
+    for stage_path in ('load_base/read', 'load/reprice', 'filter_index', 'metrics'):
+        assert stages[stage_path]['cache_hit'] is True, stage_path
+    assert stages[BODY_STAGE_PREFIX + 'filter']['rows'] < all_rows
+    executions = take_executions(app)
+    assert_body_ran_once_without_header_work(filter_run, executions)
+    assert executions[('body', 'get_selection_metrics')] == 1
+    assert not [key for key in executions if key[0] == 'app'], executions
+
+    app.number_input(key="fx_rate_input").set_value(USER_FX_RATE).run()
+    assert not app.exception
+    fx_run = read_new_run(app)
+    stages = stages_by_path(fx_run)
+    assert stages['load_base/read']['cache_hit'] is True
+    assert stages['load/reprice']['cache_hit'] is False
+    assert stages['filter_index']['cache_hit'] is True
+    assert stages[BODY_STAGE_PREFIX + 'filter']['rows'] < all_rows
+    executions = take_executions(app)
+    assert_body_ran_once_without_header_work(fx_run, executions)
+    assert executions[('app', 'get_repriced_data')] == 1
+    assert executions[('app', 'load_source_data')] == 0
+    assert executions[('app', 'get_filter_index')] == 0
+    assert app.text[0].value == f"Tỷ giá áp dụng: {USER_FX_RATE:,.0f} VND/USD"
+
+    app.multiselect(key="floor_multiselect_filter").set_value([app.multiselect(key="floor_multiselect_filter").options[0]])
+    app.run()
+    assert not app.exception
+    floor_run = read_new_run(app)
+    executions = take_executions(app)
+    assert_body_ran_once_without_header_work(floor_run, executions)
+    assert not [key for key in executions if key[0] == 'app' and key[1] in APP_ONLY_CACHED_FUNCTIONS], executions
+
+
+def test_large_table_switches_to_the_paged_grid(app):
+    app.run()
+    read_new_run(app)
+    app.radio(key="price_detail_row_model").set_value('server').run()
+    assert not app.exception
+    page_run = read_new_run(app)
+    assert 'group_tree' not in body_stage_counts(page_run)
+    assert any(caption.value.startswith("Trang 1/") for caption in app.caption)
+
+    app.number_input(key="price_detail_grid_page").set_value(2)
+    app.text_input(key="price_detail_grid_search").set_value("công ty").run()
+    assert not app.exception
+    search_run = read_new_run(app)
+    # One page of contracts plus a header per floor on it, whatever the table size
+    assert stages_by_path(search_run)[BODY_STAGE_PREFIX + 'grid']['rows'] <= 2 * DEFAULT_PAGE_SIZE
+    assert any(caption.value.startswith("Trang 2/") for caption in app.caption)
+
+
+def test_perf_panel_compares_the_chart_spec_with_its_unpruned_size(app):
+    app.secrets['admin_users'] = ["tester"]
+    app.session_state['perf_panel_toggle'] = True
+    app.run()
+    assert not app.exception
+    chart_stage = stages_by_path(read_new_run(app))[BODY_STAGE_PREFIX + 'chart']
+    assert chart_stage['unpruned_payload_bytes'] > chart_stage['payload_bytes']
+    panel_tables = [element.value for element in app.sidebar.dataframe]
+    assert any('unpruned_payload_bytes' in table.columns for table in panel_tables)
+
+    # Runs that are only logged (PERF_LOG_PATH) skip the costly unpruned serialization
+    app.toggle(key="perf_panel_toggle").set_value(False).run()
+    chart_stage = stages_by_path(read_new_run(app))[BODY_STAGE_PREFIX + 'chart']
+    assert 'payload_bytes' in chart_stage and 'unpruned_payload_bytes' not in chart_stage
@@ -0,0 +1,76 @@
+"""SnapshotStore saves swap the sidecar atomically and clean up superseded files after the grace period."""
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.rent_roll_generator import generate_rent_roll
+from utils.snapshot_store import ORPHAN_GRACE_SECONDS, SnapshotStore
+
+SOURCE_ID = "parquet:/data/rent_roll.parquet"
+OTHER_SOURCE_ID = "parquet:/data/other.parquet"
+
+
+def snapshot_frames(seed):
+    df_raw = generate_rent_roll(200, seed=seed)
+    return {'base': df_raw, 'customers': df_raw[['customer_name']].drop_duplicates(ignore_index=True)}
+
+
+def age_files(directory, seconds):
+    """Moves the mtime of every file in directory back by seconds."""
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        mtime = os.path.getmtime(path) - seconds
+        os.utime(path, (mtime, mtime))
+
+
+def test_failed_sidecar_swap_keeps_the_previous_snapshot(tmp_path, monkeypatch):
+    snapshot_store = SnapshotStore(str(tmp_path))
+    first_frames = snapshot_frames(seed=1)
+    snapshot_store.save(SOURCE_ID, first_frames, {'fingerprint': "first"})
+
+    # A writer that dies after its data files are in place, but before the sidecar swap
+    original_replace = os.replace
+
+    def replace_all_but_sidecars(src, dst):
+        if dst.endswith('.json'):
+            raise OSError("disk full")
+        return original_replace(src, dst)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, 'replace', replace_all_but_sidecars)
+        with pytest.raises(OSError):
+            snapshot_store.save(SOURCE_ID, snapshot_frames(seed=2), {'fingerprint': "second"})
+
+    frames, metadata = snapshot_store.load(SOURCE_ID)
+    assert metadata == {'fingerprint': "first"}
+    for name, frame in first_frames.items():
+        pd.testing.assert_frame_equal(frames[name], frame)
+
+    second_frames = snapshot_frames(seed=3)
+    snapshot_store.save(SOURCE_ID, second_frames, {'fingerprint': "third"})
+    frames, metadata = snapshot_store.load(SOURCE_ID)
+    assert metadata == {'fingerprint': "third"}
+    pd.testing.assert_frame_equal(frames['base'], second_frames['base'])
+
+
+def test_superseded_files_are_removed_after_the_grace_period(tmp_path):
+    snapshot_store = SnapshotStore(str(tmp_path))
+    snapshot_store.save(OTHER_SOURCE_ID, snapshot_frames(seed=0), {})
+    snapshot_store.save(SOURCE_ID, snapshot_frames(seed=1), {})
+    first_files = set(snapshot_store.read_metadata(SOURCE_ID)['files'].values())
+    # The leftover of an interrupted save
+    source_key = next(iter(first_files)).split('-', 1)[0]
+    (tmp_path / f".{source_key}-0-deadbeef-base.parquet.tmp").write_bytes(b"partial")
+
+    # Within the grace period a replica may still open the superseded files
+    snapshot_store.save(SOURCE_ID, snapshot_frames(seed=2), {})
+    assert first_files <= set(os.listdir(tmp_path))
+
+    age_files(tmp_path, ORPHAN_GRACE_SECONDS + 1)
+    snapshot_store.save(SOURCE_ID, snapshot_frames(seed=3), {})
+    current_files = set(snapshot_store.read_metadata(SOURCE_ID)['files'].values())
+    other_files = set(snapshot_store.read_metadata(OTHER_SOURCE_ID)['files'].values())
+    remaining = {name for name in os.listdir(tmp_path) if name.endswith('.parquet') or name.endswith('.tmp')}
+    assert remaining == current_files | other_files
+    assert snapshot_store.load(OTHER_SOURCE_ID) is not None
@@ -0,0 +1,250 @@
+"""
+Bulk export of per-customer and per-floor price reports plus a portfolio summary.
+
+Headless usage (Parquet or SQLite sources; Google Sheets needs the Streamlit connection):
+
+    python -m utils.bulk_export --source parquet --path rent_roll.parquet --output-dir exports --formats csv,xlsx
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from utils.data_loader import COMPACT_SCHEMA
+from utils.detail_price import cols_for_aggrid, rename_map_aggrid
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT, FloorLayout, floor_ranks, floors_in_rank_order
+from utils.metrics_engine import METRIC_COLUMN_LABELS, compute_portfolio_metrics
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+# Rows written per batch; files are streamed to disk batch by batch
+DEFAULT_CHUNK_ROWS = 5_000
+# Decimals each numeric column is written with, so float32 storage does not leak into the files
+EXPORT_DECIMALS = {col: spec[1] for col, spec in COMPACT_SCHEMA.items() if isinstance(spec, tuple)}
+EXPORT_DECIMALS.update({'rental_usd': 2, 'service_usd': 2, 'total_usd': 2})
+_UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+
+def export_row_order(df_priced, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """Returns the positions of df_priced's rows in report order: by floor, then customer."""
+    sort_keys = pd.DataFrame({
+        'floor_rank': floor_ranks(df_priced, floor_layout),
+        'customer_name': df_priced['customer_name'].astype(str).to_numpy(),
+    })
+    return sort_keys.sort_values(['floor_rank', 'customer_name'], kind='stable').index.to_numpy()
+
+
+def build_export_frame(df_priced, floor_layout=DEFAULT_FLOOR_LAYOUT, positions=None):
+    """
+    Returns the detail table as shown in the grid: grid columns, numbers rounded and
+    headers renamed with rename_map_aggrid.
+
+    positions selects the rows to build, in that order; by default every row, sorted
+    by floor then customer (export_row_order).
+    """
+    if positions is None:
+        positions = export_row_order(df_priced, floor_layout)
+    export_cols = [col for col in cols_for_aggrid if col in df_priced.columns]
+    df_export = pd.DataFrame({
+        col: (df_priced[col].to_numpy(dtype=np.float64)[positions].round(EXPORT_DECIMALS[col])
+              if col in EXPORT_DECIMALS else df_priced[col].take(positions).astype(str).to_numpy())
+        for col in export_cols
+    })
+    return df_export.rename(columns=rename_map_aggrid)
+
+
+def _group_positions(df_priced, group_col, order):
+    """Yields (label, row positions in report order) per value of group_col, in order of first appearance."""
+    values = df_priced[group_col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = values.cat.codes.to_numpy()[order], values.cat.categories.astype(str)
+    else:
+        codes, labels = pd.factorize(values.astype(str).to_numpy()[order])
+    for code, group_order in pd.Series(codes).groupby(codes, sort=False).indices.items():
+        yield ('nan' if code < 0 else labels[code]), order[group_order]
+
+
+def build_summary_sheets(df_priced, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """Returns the portfolio summary tables ({sheet name: frame}) with display headers."""
+    portfolio_metrics = compute_portfolio_metrics(df_priced)
+    floor_order = floors_in_rank_order(df_priced, floor_layout)
+    sheets = {
+        'Tổng quan': portfolio_metrics['total'].to_frame().T.rename_axis('Phạm vi'),
+        'Theo tầng': portfolio_metrics['by_floor'].reindex(floor_order).rename_axis(rename_map_aggrid['floor']),
+        'Theo khách hàng': portfolio_metrics['by_customer'].rename_axis(rename_map_aggrid['customer_name']),
+    }
+    return {
+        name: metrics[list(METRIC_COLUMN_LABELS)].astype(np.float64).round(2).rename(columns=METRIC_COLUMN_LABELS).reset_index()
+        for name, metrics in sheets.items()
+    }
+
+
+def safe_filename(name, used_names=None):
+    """Makes name usable as a file name on every OS; appends a counter if it is already in used_names."""
+    stem = _UNSAFE_FILENAME_CHARS.sub('_', str(name)).strip(' .')[:100] or 'khong_ten'
+    if used_names is None:
+        return stem
+    candidate, counter = stem, 2
+    while candidate.lower() in used_names:
+        candidate = f"{stem}_{counter}"
+        counter += 1
+    used_names.add(candidate.lower())
+    return candidate
+
+
+def _chunks(frame, chunk_rows):
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def _write_csv(frame, path, chunk_rows):
+    # utf-8-sig so Excel opens the Vietnamese headers correctly
+    with open(path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        frame.iloc[:0].to_csv(csv_file, index=False)
+        for chunk in _chunks(frame, chunk_rows):
+            chunk.to_csv(csv_file, index=False, header=False)
+
+
+def _write_xlsx(sheets, path, chunk_rows):
+    try:
+        import xlsxwriter
+    except ImportError as e:
+        raise RuntimeError("Cần cài gói 'xlsxwriter' để xuất file Excel.") from e
+
+    # constant_memory flushes each row to disk as soon as the next one starts
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    try:
+        header_format = workbook.add_format({'bold': True, 'bg_color': '#f0f2f6'})
+        for sheet_name, frame in sheets.items():
+            worksheet = workbook.add_worksheet(sheet_name[:31])
+            worksheet.set_column(0, max(len(frame.columns) - 1, 0), 18)
+            worksheet.write_row(0, 0, [str(col) for col in frame.columns], header_format)
+            row_number = 1
+            for chunk in _chunks(frame, chunk_rows):
+                values = chunk.astype(object).where(chunk.notna(), None)
+                for row in values.itertuples(index=False, name=None):
+                    worksheet.write_row(row_number, 0, row)
+                    row_number += 1
+            worksheet.freeze_panes(1, 0)
+    finally:
+        workbook.close()
+
+
+def write_report(sheets, path_stem, formats, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Writes one report: a workbook with one sheet per table for 'xlsx', one CSV per table for 'csv'.
+
+    Returns:
+        list: The written file paths.
+    """
+    written = []
+    if 'xlsx' in formats:
+        _write_xlsx(sheets, f"{path_stem}.xlsx", chunk_rows)
+        written.append(f"{path_stem}.xlsx")
+    if 'csv' in formats:
+        for sheet_name, frame in sheets.items():
+            csv_path = f"{path_stem}.csv" if len(sheets) == 1 else f"{path_stem}_{safe_filename(sheet_name)}.csv"
+            _write_csv(frame, csv_path, chunk_rows)
+            written.append(csv_path)
+    return written
+
+
+def _report_tasks(df_priced, output_dir, floor_layout):
+    """
+    Yields (sheets, path_stem) per report. Only the row order is computed up front; each
+    group's export frame is built from its rows when its task is submitted.
+    """
+    yield build_summary_sheets(df_priced, floor_layout), os.path.join(output_dir, "tong_quan_danh_muc")
+
+    order = export_row_order(df_priced, floor_layout)
+    for group_col, folder in (('floor', 'theo_tang'), ('customer_name', 'theo_khach_hang')):
+        group_dir = os.path.join(output_dir, folder)
+        os.makedirs(group_dir, exist_ok=True)
+        used_names = set()
+        for group_label, positions in _group_positions(df_priced, group_col, order):
+            sheet_name = 'Tầng ' + str(group_label) if group_col == 'floor' else 'Chi tiết'
+            yield ({sheet_name: build_export_frame(df_priced, floor_layout, positions)},
+                   os.path.join(group_dir, safe_filename(group_label, used_names)))
+
+
+def export_reports(df_priced, output_dir, formats=('xlsx',), floor_layout=DEFAULT_FLOOR_LAYOUT,
+                   max_workers=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Exports a report per floor and per customer plus the portfolio summary.
+
+    Reports are written in parallel by a process pool (spawned, since the Streamlit
+    server is multithreaded). The full detail table is never built: each group's
+    frame is built from its rows when its task is queued, and at most two tasks per
+    worker are queued at a time, so only a few group frames exist at once.
+
+    Args:
+        df_priced (pd.DataFrame): The cleaned frame with USD prices (apply_fx_rate output).
+        output_dir (str): Directory to write into; created if missing.
+        formats (iterable): Any of EXPORT_FORMATS.
+        floor_layout (FloorLayout): Floor order of the detail and summary tables.
+        max_workers (int, optional): Worker processes; 1 writes in this process.
+        chunk_rows (int): Rows written per batch.
+
+    Returns:
+        list: The written file paths.
+    """
+    formats = tuple(formats)
+    unknown_formats = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if not formats or unknown_formats:
+        raise ValueError(f"Định dạng xuất không hợp lệ: {unknown_formats or formats}. Hỗ trợ: {', '.join(EXPORT_FORMATS)}.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    tasks = _report_tasks(df_priced, output_dir, floor_layout)
+    if max_workers == 1:
+        return [path for sheets, path_stem in tasks for path in write_report(sheets, path_stem, formats, chunk_rows)]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    written, pending = [], set()
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for sheets, path_stem in tasks:
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                written.extend(path for future in done for path in future.result())
+            pending.add(pool.submit(write_report, sheets, path_stem, formats, chunk_rows))
+        for future in wait(pending).done:
+            written.extend(future.result())
+    return sorted(written)
+
+
+def zip_reports(file_paths, output_dir, zip_path):
+    """Zips the exported files, keeping their paths relative to output_dir."""
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+        for file_path in file_paths:
+            zip_file.write(file_path, os.path.relpath(file_path, output_dir))
+    return zip_path
+
+
+def main(argv=None):
+    from utils.pipeline import add_source_arguments, load_from_arguments
+
+    parser = argparse.ArgumentParser(description="Export per-customer and per-floor price reports.")
+    add_source_arguments(parser)
+    parser.add_argument('--output-dir', default='exports')
+    parser.add_argument('--formats', default='xlsx', help=f"Comma-separated, any of: {', '.join(EXPORT_FORMATS)}.")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count).")
+    parser.add_argument('--zip', help="Also zip every exported file into this path.")
+    args = parser.parse_args(argv)
+
+    df_priced, fx_rate = load_from_arguments(args)
+    start = time.perf_counter()
+    written = export_reports(df_priced, args.output_dir,
+                             formats=[fmt.strip() for fmt in args.formats.split(',') if fmt.strip()],
+                             floor_layout=FloorLayout.from_config(args.floor_layout), max_workers=args.workers)
+    if args.zip:
+        zip_reports(written, args.output_dir, args.zip)
+    print(f"{len(written)} file(s) from {len(df_priced):,} contracts at {fx_rate:,.0f} VND/USD "
+          f"in {time.perf_counter() - start:.1f}s -> {args.output_dir}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
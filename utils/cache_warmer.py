@@ -0,0 +1,81 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_concurrently(*tasks):
+    """
+    Runs the given callables on a thread pool and waits for all of them.
+
+    Returns:
+        list: The results, in the order of the tasks. The first exception raised
+              by a task is re-raised once every task has finished.
+    """
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="warm") as pool:
+        futures = [pool.submit(task) for task in tasks]
+    return [future.result() for future in futures]
+
+
+class CacheWarmer:
+    """
+    Background thread that keeps the shared caches warm.
+
+    warm_fn runs once right after start() and then every interval_seconds, as long as
+    the app was used (touch()) within idle_after_seconds, so an idle server stops
+    polling its sources. warm_fn decides itself what is close enough to expiry to
+    refresh; errors are kept in last_error and never stop the thread.
+    """
+
+    def __init__(self, warm_fn, interval_seconds=15, idle_after_seconds=1800, name="cache-warmer"):
+        self.warm_fn = warm_fn
+        self.interval_seconds = interval_seconds
+        self.idle_after_seconds = idle_after_seconds
+        self.name = name
+        self.runs = 0
+        self.last_run_at = None
+        self.last_duration_seconds = None
+        self.last_error = None
+        self._last_used_at = time.monotonic()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the warmer thread unless it is already running."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def touch(self):
+        """Records app activity, keeping the scheduled refreshes going."""
+        self._last_used_at = time.monotonic()
+
+    def is_idle(self):
+        return time.monotonic() - self._last_used_at >= self.idle_after_seconds
+
+    def warm_once(self):
+        """Runs warm_fn once in the calling thread; returns True on success."""
+        start = time.perf_counter()
+        try:
+            self.warm_fn()
+            self.last_error = None
+            return True
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            self.runs += 1
+            self.last_run_at = time.time()
+            self.last_duration_seconds = time.perf_counter() - start
+
+    def _run(self):
+        self.warm_once()
+        while not self._stop_event.wait(self.interval_seconds):
+            if not self.is_idle():
+                self.warm_once()
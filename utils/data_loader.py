@@ -0,0 +1,337 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import union_categoricals
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT, DEFAULT_FLOOR_ORDER, add_floor_ranks
+
+# Display order of the default building's floors (top floor first), see utils.floor_layout
+CUSTOM_FLOOR_SORT_ORDER = DEFAULT_FLOOR_ORDER
+# Declarative schema of the source sheet. 'kind' is 'text' or 'number'; a 'required'
+# column rejects rows with an empty cell; numbers in text cells use 'decimal' as the
+# decimal point and must lie in ['min', 'max'] (either bound may be omitted)
+SOURCE_SCHEMA = {
+    'customer_name': {'kind': 'text', 'required': True},
+    'floor': {'kind': 'text', 'required': True},
+    'period': {'kind': 'text', 'required': False},
+    'sqr': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+    'rental_vnd': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+    'service_vnd': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+    'org_fx': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+    'org_rental_usd': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+    'org_service_usd': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+    'org_total_usd': {'kind': 'number', 'required': True, 'decimal': ',', 'min': 0},
+}
+# Source columns that must be numeric before any price is derived from them
+NUMERIC_SOURCE_COLS = [col for col, rule in SOURCE_SCHEMA.items() if rule['kind'] == 'number']
+# Rows parsed at a time, bounding the temporary text and number buffers of large sheets
+CLEAN_CHUNK_ROWS = 250_000
+# Rejected rows listed in a cleaning report; the counts are always exact
+MAX_LISTED_REJECTS = 1000
+REJECT_MISSING = 'Trống'
+REJECT_INVALID = 'Không phải số'
+REJECT_OUT_OF_RANGE = 'Ngoài khoảng cho phép'
+# Reason of each reject code (0 = accepted)
+_REJECT_REASONS = np.array(['', REJECT_MISSING, REJECT_INVALID, REJECT_OUT_OF_RANGE], dtype=object)
+_NUMBER_PATTERN = r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$'
+# In-memory schema of the cleaned frame: text keys as categoricals, numerics as
+# (dtype, decimals) where float32 is used only if it preserves that many decimals
+COMPACT_SCHEMA = {
+    'customer_name': 'category',
+    'floor': 'category',
+    'period': 'category',
+    'sqr': ('float32', 2),
+    'rental_vnd': ('float32', 0),
+    'service_vnd': ('float32', 0),
+    'org_fx': ('float32', 0),
+    'org_rental_usd': ('float32', 2),
+    'org_service_usd': ('float32', 2),
+    'org_total_usd': ('float32', 2),
+}
+CLEAN_OK_MESSAGE = "Dữ liệu đã được tải và xử lý thành công."
+NO_VALID_ROWS_MESSAGE = "Cảnh báo: Không tìm thấy dữ liệu hợp lệ sau khi làm sạch."
+
+
+def compute_row_hashes(df_input):
+    """Returns a 64-bit content hash per row of df_input (the index is ignored)."""
+    return pd.util.hash_pandas_object(df_input, index=False).to_numpy()
+
+
+def compute_data_fingerprint(df_input, row_hashes=None):
+    """
+    Computes a short content hash for a raw sheet snapshot.
+
+    Two reads of an unchanged sheet produce the same fingerprint, so it can be used
+    as a cache key for everything derived from the sheet. row_hashes may be passed
+    when compute_row_hashes was already run on df_input.
+    """
+    if row_hashes is None:
+        row_hashes = compute_row_hashes(df_input)
+    digest = hashlib.sha1(row_hashes.tobytes())
+    digest.update("|".join(map(str, df_input.columns)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _downcast_float(values, decimals):
+    """Returns values as float32 if that keeps them equal at `decimals` places, else unchanged."""
+    values_32 = values.astype(np.float32)
+    if np.array_equal(np.round(values_32.astype(np.float64), decimals), np.round(values, decimals)):
+        return values_32
+    return values
+
+
+def apply_compact_schema(df_input):
+    """
+    Converts a cleaned frame to the compact in-memory schema (see COMPACT_SCHEMA).
+
+    Text keys become string categoricals and numeric columns are stored as float32
+    when every value survives the round-trip at the column's precision. Columns not
+    in the schema are kept as they are; the index is reset to a RangeIndex.
+    """
+    columns = {}
+    for col in df_input.columns:
+        column_type = COMPACT_SCHEMA.get(col)
+        values = df_input[col]
+        if column_type == 'category':
+            columns[col] = pd.Categorical(values.astype(str))
+        elif column_type is not None:
+            columns[col] = _downcast_float(values.to_numpy(dtype=np.float64), column_type[1])
+        else:
+            columns[col] = values.to_numpy()
+    return pd.DataFrame(columns)
+
+
+def concat_compact_frames(frames):
+    """
+    Concatenates frames in the compact schema without leaving it.
+
+    Categorical columns are merged on the union of their (sorted) categories instead
+    of falling back to object, and float columns that mix float32 and float64 are
+    downcast again where the column's precision allows. The index is reset.
+    """
+    frames = [frame for frame in frames if frame is not None]
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    columns = {}
+    for col in frames[0].columns:
+        parts = [frame[col] for frame in frames]
+        column_type = COMPACT_SCHEMA.get(col)
+        if column_type == 'category':
+            columns[col] = union_categoricals([part.array for part in parts], sort_categories=True)
+        elif column_type is not None:
+            values = np.concatenate([part.to_numpy() for part in parts])
+            columns[col] = values if values.dtype == np.float32 else _downcast_float(values.astype(np.float64), column_type[1])
+        else:
+            columns[col] = pd.concat(parts, ignore_index=True).to_numpy()
+    return pd.DataFrame(columns)
+
+
+def _parse_text_numbers(text_columns, decimal):
+    """
+    Parses the text cells of several columns in one pass over a single Arrow array.
+
+    Cells are trimmed and `decimal` is read as the decimal point; anything that is then
+    not a plain or scientific decimal number is invalid (thousands separators included).
+
+    Returns:
+        tuple: (numbers, invalid), lists with a float64 / bool array per column;
+               empty cells are NaN and not invalid.
+    """
+    text = pc.utf8_trim_whitespace(pa.chunked_array(
+        [pa.array(values.astype('string[pyarrow]'), type=pa.large_string()) for values in text_columns],
+        type=pa.large_string()))
+    if decimal != '.':
+        text = pc.replace_substring(text, decimal, '.')
+    is_number = pc.fill_null(pc.match_substring_regex(text, _NUMBER_PATTERN), False)
+    numbers = pc.cast(pc.if_else(is_number, text, None), pa.float64()).to_numpy(zero_copy_only=False)
+    is_empty = pc.fill_null(pc.equal(text, ''), True).to_numpy(zero_copy_only=False)
+    invalid = ~(is_number.to_numpy(zero_copy_only=False) | is_empty)
+    bounds = np.cumsum([0] + [len(values) for values in text_columns])
+    return ([numbers[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])],
+            [invalid[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])])
+
+
+def _reject_codes(df_raw, parsed_numbers, invalid_numbers, schema):
+    """Returns {column: int8 array} of _REJECT_REASONS codes (0 = accepted) for the checked columns of df_raw."""
+    codes = {}
+    for col, rule in schema.items():
+        if col not in df_raw.columns:
+            continue
+        if rule['kind'] == 'number':
+            numbers = parsed_numbers[col]
+            missing = np.isnan(numbers) & ~invalid_numbers.get(col, False)
+            out_of_range = np.zeros(len(numbers), dtype=bool)
+            if rule.get('min') is not None:
+                out_of_range |= numbers < rule['min']
+            if rule.get('max') is not None:
+                out_of_range |= numbers > rule['max']
+            code = np.where(invalid_numbers.get(col, False), 2, np.where(out_of_range, 3, 0))
+        else:
+            values = df_raw[col]
+            missing = (values.isna() | values.astype('string[pyarrow]').str.strip().eq('')).to_numpy(dtype=bool)
+            code = np.zeros(len(values), dtype=np.int8)
+        if rule.get('required'):
+            code = np.where(missing, 1, code)
+        if code.any():
+            codes[col] = code.astype(np.int8)
+    return codes
+
+
+def parse_source_rows(df_raw, schema=SOURCE_SCHEMA):
+    """
+    Validates df_raw against schema and parses its numeric columns.
+
+    All text cells of the numeric columns sharing a decimal separator are parsed in
+    one vectorized pass; columns that are already numeric are taken as they are.
+
+    Returns:
+        tuple: (df_parsed, valid_mask, issues); valid_mask is False for rejected rows
+               and issues lists every rejected cell with its 'row' (index label of
+               df_raw), 'column', 'reason' and raw 'value'. df_parsed keeps the index
+               of df_raw.
+    """
+    numeric_cols = [col for col, rule in schema.items() if rule['kind'] == 'number' and col in df_raw.columns]
+    parsed_numbers, invalid_numbers = {}, {}
+    text_cols = {}
+    for col in numeric_cols:
+        values = df_raw[col]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            parsed_numbers[col] = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            text_cols.setdefault(schema[col].get('decimal', '.'), []).append(col)
+    for decimal, cols in text_cols.items():
+        numbers, invalid = _parse_text_numbers([df_raw[col] for col in cols], decimal)
+        parsed_numbers.update(zip(cols, numbers))
+        invalid_numbers.update(zip(cols, invalid))
+
+    # Parse into new columns instead of copying the whole raw frame first
+    df_parsed = pd.DataFrame({col: parsed_numbers.get(col, df_raw[col]) for col in df_raw.columns}, index=df_raw.index)
+
+    codes = _reject_codes(df_raw, parsed_numbers, invalid_numbers, schema)
+    valid_mask = np.ones(len(df_raw), dtype=bool)
+    issue_parts = []
+    for col, code in codes.items():
+        valid_mask &= code == 0
+        positions = np.flatnonzero(code)
+        issue_parts.append(pd.DataFrame({
+            'row': df_raw.index[positions],
+            'column': col,
+            'reason': _REJECT_REASONS[code[positions]],
+            'value': df_raw[col].iloc[positions].astype(str).to_numpy(dtype=object),
+        }))
+    issues = pd.concat(issue_parts, ignore_index=True) if issue_parts else pd.DataFrame(columns=['row', 'column', 'reason', 'value'])
+    return df_parsed, valid_mask, issues
+
+
+def clean_source_rows(df_raw, schema=SOURCE_SCHEMA, chunk_rows=CLEAN_CHUNK_ROWS):
+    """
+    Parses df_raw chunk by chunk and keeps its valid rows in the compact schema.
+
+    Only one chunk's parse buffers exist at a time; the compact chunks are merged
+    with concat_compact_frames.
+
+    Returns:
+        tuple: (df_compact, valid_mask, issues) as from parse_source_rows, with
+               df_compact holding the valid rows (possibly none) in source order.
+    """
+    compact_chunks, valid_masks, issue_parts = [], [], []
+    for start in range(0, max(len(df_raw), 1), chunk_rows):
+        df_parsed, valid_mask, issues = parse_source_rows(df_raw.iloc[start:start + chunk_rows], schema)
+        if valid_mask.any() or not compact_chunks:
+            compact_chunks.append(apply_compact_schema(df_parsed[valid_mask]))
+        valid_masks.append(valid_mask)
+        issue_parts.append(issues)
+    # The empty placeholder chunk is dropped once a chunk with rows exists
+    compact_chunks = [chunk for chunk in compact_chunks if len(chunk)] or compact_chunks[:1]
+    return (concat_compact_frames(compact_chunks), np.concatenate(valid_masks),
+            pd.concat(issue_parts, ignore_index=True))
+
+
+def summarize_rejects(issues, n_rows, max_listed=MAX_LISTED_REJECTS):
+    """
+    Builds the rejected-rows report of a cleaning run from parse_source_rows issues.
+
+    Returns:
+        dict: 'rows' (rows checked), 'rejected' (rows dropped), 'by_reason'
+              (pd.DataFrame of 'column', 'reason', 'rows') and 'rejected_rows'
+              (pd.DataFrame of 'row' and 'reason', one line per dropped row naming
+              every failed cell; at most max_listed rows, the counts are exact).
+    """
+    by_reason = (issues.groupby(['column', 'reason'], sort=False).size().rename('rows').reset_index()
+                 if len(issues) else pd.DataFrame(columns=['column', 'reason', 'rows']))
+    rejected = issues['row'].nunique() if len(issues) else 0
+    listed_rows = pd.unique(issues['row'].to_numpy())[:max_listed] if len(issues) else []
+    listed = issues[issues['row'].isin(listed_rows)]
+    details = listed['column'] + ': ' + listed['reason'] + np.where(
+        listed['reason'] == REJECT_MISSING, '', ' (' + listed['value'].str.slice(0, 40) + ')')
+    rejected_rows = (details.groupby(listed['row'].to_numpy(), sort=True).agg('; '.join)
+                     .rename_axis('row').rename('reason').reset_index()
+                     if len(listed) else pd.DataFrame(columns=['row', 'reason']))
+    return {'rows': n_rows, 'rejected': int(rejected), 'by_reason': by_reason, 'rejected_rows': rejected_rows}
+
+
+def clean_source_data(df_raw, floor_layout=DEFAULT_FLOOR_LAYOUT, chunk_rows=CLEAN_CHUNK_ROWS):
+    """
+    Cleans the raw sheet into an FX-independent base frame and reports the rejected rows.
+
+    Rows are validated against SOURCE_SCHEMA (required cells, numbers with comma
+    decimals, value ranges) in chunks of chunk_rows; rejected rows are dropped and
+    the rest is stored in the compact schema, with each row's floor rank in
+    floor_layout (column FLOOR_RANK_COL). USD prices are not computed here, see
+    apply_fx_rate.
+
+    Args:
+        df_raw (pd.DataFrame): The frame as read from the sheet.
+        floor_layout (FloorLayout): Floor display order of the building.
+        chunk_rows (int): Rows parsed at a time.
+
+    Returns:
+        tuple: (df_base, message, reject_report); df_base is None if nothing valid
+               remains and reject_report (see summarize_rejects) is None if df_raw
+               could not be checked at all.
+    """
+    if df_raw is None or df_raw.empty:
+        return None, "Lỗi: Không đọc được dữ liệu, sheet có thể rỗng hoặc URL không đúng.", None
+    if 'floor' not in df_raw.columns:
+        return None, "Lỗi: Cột 'floor' không tìm thấy.", None
+
+    df_compact, _, issues = clean_source_rows(df_raw, chunk_rows=chunk_rows)
+    reject_report = summarize_rejects(issues, len(df_raw))
+    if df_compact.empty:
+        return None, NO_VALID_ROWS_MESSAGE, reject_report
+    return add_floor_ranks(df_compact, floor_layout), CLEAN_OK_MESSAGE, reject_report
+
+
+def clean_base_data(df_raw, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """
+    Cleans the raw sheet into an FX-independent base frame (see clean_source_data).
+
+    Returns:
+        tuple: (df_base, message); df_base is None if nothing valid remains.
+    """
+    df_base, status_message, _ = clean_source_data(df_raw, floor_layout)
+    return df_base, status_message
+
+
+def apply_fx_rate(df_base, fx_rate):
+    """
+    Reprices a cleaned base frame at the given FX rate.
+
+    Only the USD columns are computed; every other column is shared with df_base
+    through a shallow copy, so df_base itself is left untouched.
+
+    Args:
+        df_base (pd.DataFrame): Output of clean_base_data.
+        fx_rate (float): VND per USD rate to apply.
+
+    Returns:
+        pd.DataFrame: df_base plus 'rental_usd', 'service_usd' and 'total_usd'.
+    """
+    df_priced = df_base.copy(deep=False)
+    rental_usd = np.round(df_base['rental_vnd'].to_numpy(dtype='float64') / fx_rate, 2)
+    service_usd = np.round(df_base['service_vnd'].to_numpy(dtype='float64') / fx_rate, 2)
+    df_priced['rental_usd'] = rental_usd
+    df_priced['service_usd'] = service_usd
+    df_priced['total_usd'] = rental_usd + service_usd
+    return df_priced
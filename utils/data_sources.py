@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from utils.data_loader import compute_data_fingerprint
+
+# The 10 source columns of the rent roll, in sheet order (column 0 of the sheet is skipped)
+SOURCE_COLUMNS = ['customer_name', 'floor', 'period', 'sqr', 'rental_vnd', 'service_vnd',
+                  'org_fx', 'org_rental_usd', 'org_service_usd', 'org_total_usd']
+GSHEET_USECOLS = list(range(1, 11))
+# Seconds between reads of the sheet, as long as the original app cached it (conn.read ttl=600)
+GSHEETS_POLL_SECONDS = 600
+
+
+def _file_change_token(*paths):
+    """Builds a change token from the mtime and size of the given files (missing files are skipped)."""
+    parts = []
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            continue
+        parts.append(f"{stat_result.st_mtime_ns}-{stat_result.st_size}")
+    if not parts:
+        raise FileNotFoundError(f"Không tìm thấy file dữ liệu: {paths[0]}")
+    return ":".join(parts)
+
+
+def _select_source_columns(df_input):
+    """Keeps the known source columns when present, otherwise returns the frame unchanged."""
+    present_cols = [col for col in SOURCE_COLUMNS if col in df_input.columns]
+    return df_input[present_cols] if present_cols else df_input
+
+
+class GSheetsSource:
+    """
+    Google Sheets backend (the original behavior).
+
+    Sheets exposes no cheap revision id through the connection, so the change token
+    is a content hash of the sheet, re-read at most once every poll_seconds. The frame
+    read for the token is handed to the next read() and then released. A background
+    warmer can pass a shorter max_age_seconds to re-read the sheet before the poll
+    interval runs out, so no user request pays for the read. Reads go through the
+    connection's cache with the same max age as the poll, so a refresh never gets a
+    frame older than it asked for and a repeated read within the interval is free.
+    """
+
+    def __init__(self, connection, spreadsheet_url, poll_seconds=GSHEETS_POLL_SECONDS):
+        self.connection = connection
+        self.spreadsheet_url = spreadsheet_url
+        self.poll_seconds = poll_seconds
+        self.source_id = f"gsheets:{spreadsheet_url}"
+        self._lock = threading.Lock()
+        self._frame = None
+        self._token = None
+        self._checked_at = 0.0
+
+    def _refresh(self, max_age_seconds=None):
+        now = time.monotonic()
+        max_age_seconds = self.poll_seconds if max_age_seconds is None else max_age_seconds
+        if self._token is None or now - self._checked_at >= max_age_seconds:
+            df_raw = self.connection.read(spreadsheet=self.spreadsheet_url, usecols=GSHEET_USECOLS,
+                                         ttl=max_age_seconds)
+            self._frame = df_raw
+            self._token = compute_data_fingerprint(df_raw)
+            self._checked_at = now
+
+    def change_token(self, max_age_seconds=None):
+        with self._lock:
+            self._refresh(max_age_seconds)
+            return self._token
+
+    def read(self):
+        with self._lock:
+            self._refresh()
+            if self._frame is None:
+                # Already handed out since the last poll; read again rather than keep a copy around
+                self._checked_at = 0.0
+                self._refresh()
+            df_raw, self._frame = self._frame, None
+            return df_raw
+
+
+class ParquetSource:
+    """Local Parquet file backend; the change token is the file mtime and size."""
+
+    def __init__(self, path):
+        self.path = path
+        self.source_id = f"parquet:{os.path.abspath(path)}"
+
+    def change_token(self, max_age_seconds=None):
+        return _file_change_token(self.path)
+
+    def read(self):
+        return _select_source_columns(pd.read_parquet(self.path))
+
+
+class SQLiteSource:
+    """
+    Local SQLite table backend.
+
+    The change token covers the database file and its WAL, so commits made in WAL
+    mode are picked up before a checkpoint.
+    """
+
+    def __init__(self, path, table_name):
+        self.path = path
+        self.table_name = table_name
+        self.source_id = f"sqlite:{os.path.abspath(path)}:{table_name}"
+
+    def change_token(self, max_age_seconds=None):
+        return _file_change_token(self.path, f"{self.path}-wal")
+
+    def read(self):
+        with sqlite3.connect(f"file:{self.path}?mode=ro", uri=True) as sqlite_conn:
+            quoted_table = '"' + self.table_name.replace('"', '""') + '"'
+            df_raw = pd.read_sql_query(f"SELECT * FROM {quoted_table}", sqlite_conn)
+        return _select_source_columns(df_raw)
+
+
+def create_data_source(source_type, location, table_name=None, connection=None):
+    """
+    Creates the data source backend for the given configuration.
+
+    Args:
+        source_type (str): 'gsheets', 'parquet' or 'sqlite'.
+        location (str): Sheet URL or local file path.
+        table_name (str, optional): Table to read for the 'sqlite' backend.
+        connection (optional): The Streamlit GSheets connection for the 'gsheets' backend.
+
+    Returns:
+        An object with a `source_id` attribute and `read()` / `change_token(max_age_seconds=None)`
+        methods; max_age_seconds only affects polled sources (Google Sheets).
+    """
+    source_type = (source_type or 'gsheets').lower()
+    if source_type == 'gsheets':
+        if connection is None:
+            raise ValueError("Nguồn 'gsheets' cần một kết nối Google Sheets.")
+        return GSheetsSource(connection, location)
+    if source_type == 'parquet':
+        return ParquetSource(location)
+    if source_type == 'sqlite':
+        return SQLiteSource(location, table_name or 'rent_roll')
+    raise ValueError(f"Loại nguồn dữ liệu không được hỗ trợ: {source_type}")
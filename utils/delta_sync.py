@@ -0,0 +1,286 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from utils.data_loader import (CLEAN_OK_MESSAGE, NO_VALID_ROWS_MESSAGE, clean_base_data, clean_source_rows,
+                               compute_data_fingerprint, compute_row_hashes, concat_compact_frames, summarize_rejects)
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT, FLOOR_RANK_COL, add_floor_ranks
+from utils.metrics_engine import (compute_portfolio_metrics, portfolio_metrics_from_frame, portfolio_metrics_to_frame,
+                                  update_portfolio_metrics)
+
+# A contract is identified by tenant, floor and lease period; repeated keys are told apart by their order
+CONTRACT_KEY_COLS = ['customer_name', 'floor', 'period']
+CHANGE_INSERTED = 'Thêm mới'
+CHANGE_UPDATED = 'Cập nhật'
+CHANGE_DELETED = 'Đã xóa'
+# Changed contracts listed in a delta; the counts are always exact
+MAX_LISTED_CHANGES = 1000
+
+
+def contract_key_columns(df_raw):
+    """Returns the CONTRACT_KEY_COLS of a raw snapshot as string categoricals."""
+    return pd.DataFrame({col: pd.Categorical(df_raw[col].astype(str)) for col in CONTRACT_KEY_COLS})
+
+
+def compute_contract_keys(key_frame):
+    """
+    Returns a 64-bit key per row of key_frame (contract_key_columns output).
+
+    Rows sharing the same customer, floor and period get their occurrence number
+    mixed in, so every key of a snapshot is unique.
+    """
+    base_keys = compute_row_hashes(key_frame[CONTRACT_KEY_COLS])
+    occurrence = pd.Series(base_keys).groupby(base_keys, sort=False).cumcount().to_numpy()
+    return compute_row_hashes(pd.DataFrame({'key': base_keys, 'occurrence': occurrence}))
+
+
+def _list_changes(key_frame, positions, change_type):
+    listed = key_frame.iloc[positions[:MAX_LISTED_CHANGES]].astype(str)
+    listed.insert(0, 'change', change_type)
+    return listed
+
+
+class IncrementalRentRoll:
+    """
+    Keeps the last sheet snapshot of one data source and applies new snapshots as row deltas.
+
+    Each row is matched to the previous snapshot by its contract key and compared by
+    its content hash. Only inserted and updated rows are parsed and cleaned; unchanged
+    rows are taken over from the previous cleaned frame and deleted rows dropped.
+    Portfolio metrics are likewise updated for the floors and customers a delta
+    touched, per FX rate, instead of being recomputed over the whole frame.
+
+    Floor ranks (FLOOR_RANK_COL) are recomputed over the whole new frame, as a new
+    floor can shift the ranks of the others; that is a lookup per category plus one
+    gather. A snapshot whose columns differ from the previous one is rebuilt in full. The
+    state can be saved with to_snapshot() and restored after a restart with
+    restore_snapshot(); needs_revalidation then stays True until the caller has
+    checked the source again.
+    """
+
+    def __init__(self, max_metric_entries=16, floor_layout=DEFAULT_FLOOR_LAYOUT):
+        self.max_metric_entries = max_metric_entries
+        self.floor_layout = floor_layout
+        self.df_base = None
+        self.data_fingerprint = None
+        self.status_message = None
+        self.last_delta = None
+        self.change_token = None
+        self.needs_revalidation = False
+        self._lock = threading.Lock()
+        self._columns = None
+        self._key_index = None
+        self._row_hashes = None
+        self._key_frame = None
+        self._base_positions = None
+        self._metrics = {}
+
+    def current(self):
+        """Returns (df_base, data_fingerprint, message) of the current snapshot."""
+        with self._lock:
+            return self.df_base, self.data_fingerprint, self.status_message
+
+    def update(self, df_raw, change_token=None):
+        """
+        Applies a new raw snapshot; change_token is the source token it was read at.
+
+        Returns:
+            tuple: (df_base, data_fingerprint, message) like a full clean_base_data run;
+                   df_base is None if nothing valid remains. The change summary of the
+                   snapshot is kept in last_delta (see _apply_delta).
+        """
+        with self._lock:
+            if df_raw is None or df_raw.empty or 'floor' not in df_raw.columns:
+                df_base, status_message = clean_base_data(df_raw, self.floor_layout)
+                self._reset()
+                return df_base, None, status_message
+
+            row_hashes = compute_row_hashes(df_raw)
+            data_fingerprint = compute_data_fingerprint(df_raw, row_hashes)
+            if data_fingerprint != self.data_fingerprint or self._key_index is None:
+                self._apply_delta(df_raw, row_hashes, data_fingerprint)
+            self.change_token = change_token
+            self.needs_revalidation = False
+            return self.df_base, self.data_fingerprint, self.status_message
+
+    def _reset(self):
+        self.df_base = self.data_fingerprint = self.status_message = self.change_token = None
+        self._columns = self._key_index = self._row_hashes = self._key_frame = self._base_positions = None
+
+    def _apply_delta(self, df_raw, row_hashes, data_fingerprint):
+        """
+        Builds the new cleaned frame from the previous one plus the changed rows.
+
+        Sets last_delta to a dict with 'inserted', 'updated', 'deleted', 'unchanged' and
+        'rejected' (changed rows dropped by cleaning) counts, 'reject_report' (the
+        summarize_rejects report of the parsed rows), 'changes' (the changed
+        contracts, at most MAX_LISTED_CHANGES per change type), 'changed_floors' /
+        'changed_customers',
+        'full_rebuild', 'from_fingerprint', 'to_fingerprint' and 'detected_at'.
+        """
+        key_frame = contract_key_columns(df_raw)
+        keys = compute_contract_keys(key_frame)
+        key_index = pd.Index(keys)
+        full_rebuild = (self._key_index is None or list(df_raw.columns) != self._columns
+                        or not key_index.is_unique)
+
+        n_rows = len(df_raw)
+        base_positions = np.full(n_rows, -1, dtype=np.intp)
+        if full_rebuild:
+            previous_base = None
+            matched = unchanged = np.zeros(n_rows, dtype=bool)
+        else:
+            previous_base = self.df_base.drop(columns=FLOOR_RANK_COL)
+            previous_rows = self._key_index.get_indexer(keys)
+            matched = previous_rows >= 0
+            unchanged = matched & (self._row_hashes[previous_rows] == row_hashes)
+            base_positions[unchanged] = self._base_positions[previous_rows[unchanged]]
+        changed_positions = np.flatnonzero(~unchanged)
+
+        # Parse and clean only the inserted and updated rows
+        df_changed, valid_mask, issues = clean_source_rows(df_raw.iloc[changed_positions])
+        offset = 0 if previous_base is None else len(previous_base)
+        base_positions[changed_positions] = np.where(valid_mask, np.cumsum(valid_mask) - 1 + offset, -1)
+
+        kept = base_positions >= 0
+        if kept.any():
+            df_combined = concat_compact_frames([previous_base, df_changed])
+            df_base = df_combined.take(base_positions[kept]).reset_index(drop=True)
+            for col in df_base.columns:
+                if isinstance(df_base[col].dtype, pd.CategoricalDtype):
+                    df_base[col] = df_base[col].cat.remove_unused_categories()
+            add_floor_ranks(df_base, self.floor_layout)
+            status_message = CLEAN_OK_MESSAGE
+        else:
+            df_base, status_message = None, NO_VALID_ROWS_MESSAGE
+
+        deleted_positions = np.empty(0, dtype=np.intp)
+        if not full_rebuild:
+            still_present = np.zeros(len(self._key_index), dtype=bool)
+            still_present[previous_rows[matched]] = True
+            deleted_positions = np.flatnonzero(~still_present)
+        inserted_positions = np.flatnonzero(~matched)
+        updated_positions = np.flatnonzero(matched & ~unchanged)
+
+        changes = pd.DataFrame(columns=['change'] + CONTRACT_KEY_COLS)
+        changed_floors, changed_customers = frozenset(), frozenset()
+        if not full_rebuild:
+            changes = pd.concat([_list_changes(key_frame, inserted_positions, CHANGE_INSERTED),
+                                 _list_changes(key_frame, updated_positions, CHANGE_UPDATED),
+                                 _list_changes(self._key_frame, deleted_positions, CHANGE_DELETED)],
+                                ignore_index=True)
+            changed_keys = pd.concat([key_frame.iloc[changed_positions].astype(str),
+                                      self._key_frame.iloc[deleted_positions].astype(str)])
+            changed_floors = frozenset(changed_keys['floor'])
+            changed_customers = frozenset(changed_keys['customer_name'])
+
+        self.last_delta = {
+            'from_fingerprint': self.data_fingerprint,
+            'to_fingerprint': data_fingerprint,
+            'full_rebuild': full_rebuild,
+            'inserted': len(inserted_positions),
+            'updated': len(updated_positions),
+            'deleted': len(deleted_positions),
+            'unchanged': int(unchanged.sum()),
+            'rejected': int((~valid_mask).sum()),
+            'reject_report': summarize_rejects(issues, len(changed_positions)),
+            'changes': changes,
+            'changed_floors': changed_floors,
+            'changed_customers': changed_customers,
+            'detected_at': time.time(),
+        }
+        self.df_base = df_base
+        self.data_fingerprint = data_fingerprint
+        self.status_message = status_message
+        self._columns = list(df_raw.columns)
+        self._key_index = key_index
+        self._row_hashes = row_hashes
+        self._key_frame = key_frame
+        self._base_positions = np.where(kept, np.cumsum(kept) - 1, -1)
+
+    def portfolio_metrics(self, df_priced, data_fingerprint, fx_rate):
+        """
+        Returns compute_portfolio_metrics(df_priced), updated from the metrics of the
+        previous snapshot at the same FX rate when the last delta allows it.
+
+        Args:
+            df_priced (pd.DataFrame): The frame of data_fingerprint repriced at fx_rate.
+            data_fingerprint (str): Fingerprint of the snapshot df_priced was built from.
+            fx_rate (float): The FX rate df_priced was priced at.
+        """
+        with self._lock:
+            metrics_key = (data_fingerprint, float(fx_rate))
+            if metrics_key in self._metrics:
+                return self._metrics[metrics_key]
+            delta = self.last_delta
+            previous_metrics = None
+            if delta is not None and delta['to_fingerprint'] == data_fingerprint and not delta['full_rebuild']:
+                previous_metrics = self._metrics.get((delta['from_fingerprint'], float(fx_rate)))
+            if previous_metrics is None:
+                metrics = compute_portfolio_metrics(df_priced)
+            else:
+                metrics = update_portfolio_metrics(previous_metrics, df_priced,
+                                                   delta['changed_floors'], delta['changed_customers'])
+            self._metrics[metrics_key] = metrics
+            while len(self._metrics) > self.max_metric_entries:
+                self._metrics.pop(next(iter(self._metrics)))
+            return metrics
+
+    def snapshot_version(self):
+        """Identifies what to_snapshot() would save: the data fingerprint and the FX rates with metrics."""
+        with self._lock:
+            rates = sorted(fx_rate for fingerprint, fx_rate in self._metrics if fingerprint == self.data_fingerprint)
+            return f"{self.data_fingerprint}:{','.join(f'{rate:g}' for rate in rates)}"
+
+    def to_snapshot(self):
+        """
+        Returns the state to persist as (frames, metadata) for SnapshotStore.save, or None
+        when there is no valid snapshot.
+
+        The frames are the cleaned frame ('base'), the per-row contract keys, content
+        hashes and base positions that the next delta is matched against ('rows') and
+        the portfolio metrics of the current snapshot at each FX rate ('metrics').
+        """
+        with self._lock:
+            if self.df_base is None:
+                return None
+            rows = pd.DataFrame({
+                'key': self._key_index.to_numpy(),
+                'row_hash': self._row_hashes,
+                'base_position': self._base_positions.astype(np.int64),
+            })
+            frames = {'base': self.df_base, 'rows': pd.concat([rows, self._key_frame], axis=1)}
+            metrics_frames = [portfolio_metrics_to_frame(metrics).assign(fx_rate=fx_rate)
+                              for (fingerprint, fx_rate), metrics in self._metrics.items()
+                              if fingerprint == self.data_fingerprint]
+            if metrics_frames:
+                frames['metrics'] = pd.concat(metrics_frames, ignore_index=True)
+            metadata = {
+                'data_fingerprint': self.data_fingerprint,
+                'change_token': self.change_token,
+                'status_message': self.status_message,
+                'columns': self._columns,
+            }
+            return frames, metadata
+
+    def restore_snapshot(self, frames, metadata):
+        """Restores to_snapshot() output; the source should be revalidated before trusting it."""
+        with self._lock:
+            rows = frames['rows']
+            # Ranks follow the layout configured now, which may differ from the one the snapshot was saved with
+            self.df_base = add_floor_ranks(frames['base'], self.floor_layout)
+            self.data_fingerprint = metadata['data_fingerprint']
+            self.change_token = metadata['change_token']
+            self.status_message = metadata['status_message']
+            self._columns = metadata['columns']
+            self._key_index = pd.Index(rows['key'].to_numpy())
+            self._row_hashes = rows['row_hash'].to_numpy()
+            self._base_positions = rows['base_position'].to_numpy().astype(np.intp)
+            self._key_frame = rows[CONTRACT_KEY_COLS].reset_index(drop=True)
+            self._metrics = {}
+            if 'metrics' in frames:
+                for fx_rate, metrics_frame in frames['metrics'].groupby('fx_rate', sort=False):
+                    self._metrics[(self.data_fingerprint, float(fx_rate))] = portfolio_metrics_from_frame(
+                        metrics_frame.drop(columns='fx_rate'))
+            self.last_delta = None
+            self.needs_revalidation = True
@@ -1,7 +1,12 @@
+import numpy as np
 import pandas as pd
-from st_aggrid import AgGrid, GridOptionsBuilder, JsCode, GridUpdateMode # Removed ColumnsAutoSizeMode as it's not explicitly used
+from utils.floor_layout import floor_ranks
+from utils.metrics_engine import compute_metrics_table
 
-number_formatter = JsCode("""
+# st_aggrid is imported inside the functions that build or render a grid, so headless
+# code (bulk export, benchmarks) can use the column mapping, paging and the group tree without it.
+# The JS snippets are kept as source and wrapped in JsCode at build time.
+number_formatter_js = """
     function formatNumberWithPoint(params) {
         if (params.value == null || isNaN(params.value)) { 
             return ""; 
@@ -10,8 +15,8 @@ number_formatter = JsCode("""
             minimumFractionDigits: 0,
             maximumFractionDigits: 0
         });
-    }""")
-decimal_formatter = JsCode("""
+    }"""
+decimal_formatter_js = """
     function formatNumberWithPoint(params) {
         if (params.value == null || isNaN(params.value)) { 
             return ""; 
@@ -20,129 +25,520 @@ decimal_formatter = JsCode("""
             minimumFractionDigits: 0,
             maximumFractionDigits: 2
         });
-    }""")
-def display_ag_grid_table(df_filtered_for_table, custom_floor_sort_order, st_object):
+    }"""
+
+# Columns shown in the detail table and their display names
+cols_for_aggrid = ['floor',
+                   'customer_name',
+                   'period',
+                   'sqr',
+                   'rental_usd',
+                   'service_usd',
+                   'total_usd',
+                   'rental_vnd',
+                   'service_vnd',
+                   'org_fx',
+                   'org_rental_usd',
+                   'org_service_usd',
+                   'org_total_usd'
+                   ]
+rename_map_aggrid = {
+    'customer_name': 'Tên Khách Hàng',
+    'floor': 'Tầng',
+    'sqr': 'Diện Tích (m²)',
+    'period': 'Kỳ Hạn',
+    'rental_usd': 'Giá Thuê (USD)',
+    'service_usd': 'Phí Dịch Vụ (USD)',
+    'total_usd': 'Tổng (USD)',
+    'rental_vnd': 'Giá Thuê (VND)',
+    'service_vnd': 'Phí Dịch Vụ (VND)',
+    'org_fx': 'Tỷ giá ký HĐ',
+    'org_rental_usd': 'Giá Thuê (USD) Ký HĐ',
+    'org_service_usd': 'Phí Dịch Vụ (USD) Ký HĐ',
+    'org_total_usd': 'Tổng (USD) Ký HĐ'
+}
+numeric_display_formatters = {
+    'Diện Tích (m²)': number_formatter_js,
+    'Giá Thuê (USD)': decimal_formatter_js,
+    'Phí Dịch Vụ (USD)': decimal_formatter_js,
+    'Tổng (USD)': decimal_formatter_js,
+    'Giá Thuê (VND)': number_formatter_js,
+    'Phí Dịch Vụ (VND)': number_formatter_js,
+    'Tỷ giá ký HĐ': number_formatter_js,
+    'Giá Thuê (USD) Ký HĐ': decimal_formatter_js,
+    'Phí Dịch Vụ (USD) Ký HĐ': decimal_formatter_js,
+    'Tổng (USD) Ký HĐ': decimal_formatter_js
+}
+group_row_style_js = """
+    function(params) {
+        if (params.data && params.data.__group_row) {
+            return {fontWeight: 'bold', backgroundColor: '#f0f2f6'};
+        }
+    }"""
+
+tree_label_formatter_js = """
+    function(params) {
+        if (params.value == null) {
+            return "";
+        }
+        const data = params.data || {};
+        const marker = data.__expandable ? (data.__expanded ? '\u25be ' : '\u25b8 ') : '';
+        return '\u00a0'.repeat(4 * (data.__level || 0)) + marker + params.value;
+    }"""
+
+DEFAULT_PAGE_SIZE = 20
+# Above this many rows the detail table is the group tree computed in pandas instead of AgGrid's client-side grouping
+TREE_ROW_THRESHOLD = 2000
+# Label column of the group tree grid (floor / customer rows)
+TREE_LABEL_COL = 'Nhóm'
+# Children listed under one expanded group of the group tree; the rest are counted in a note row
+TREE_MAX_CHILD_ROWS = 500
+
+
+def build_server_page(df_input, floor_layout, page_number=1, page_size=DEFAULT_PAGE_SIZE,
+                      sort_field=None, ascending=True, search_text=""):
+    """
+    Materializes one page of the detail table, grouped by floor, in pandas.
+
+    Rows are filtered by customer name, ordered by floor (the group) and then by
+    sort_field, and only the requested page is sliced out. Each floor present on the
+    page is preceded by a group header row holding the area sum of the whole floor
+    within the filtered set.
+
+    Args:
+        df_input (pd.DataFrame): The filtered frame (source column names).
+        floor_layout (FloorLayout): Floor order, used if df_input has no stored floor ranks.
+        page_number (int): 1-based page number; clamped to the valid range.
+        page_size (int): Number of contract rows per page.
+        sort_field (str, optional): Source column to sort by within each floor.
+        ascending (bool): Sort direction for sort_field.
+        search_text (str): Case-insensitive substring filter on 'customer_name'.
+
+    Returns:
+        tuple: (page_df, total_rows, total_pages, page_number); page_df uses the display names.
+    """
+    df_view = df_input
+    if search_text and 'customer_name' in df_view.columns:
+        customer_names = df_view['customer_name']
+        if isinstance(customer_names.dtype, pd.CategoricalDtype):
+            # Match against the (few) categories instead of every row
+            categories = customer_names.cat.categories
+            matched = categories[categories.astype(str).str.contains(search_text, case=False, regex=False)]
+            df_view = df_view[customer_names.isin(matched)]
+        else:
+            df_view = df_view[customer_names.astype(str).str.contains(search_text, case=False, regex=False)]
+
+    total_rows = len(df_view)
+    total_pages = max(1, -(-total_rows // page_size))
+    page_number = min(max(1, int(page_number)), total_pages)
+
+    row_floor_ranks = floor_ranks(df_view, floor_layout)
+    if sort_field and sort_field in df_view.columns:
+        sort_values = df_view[sort_field]
+        if isinstance(sort_values.dtype, pd.CategoricalDtype):
+            sort_values = sort_values.astype(str)
+        sort_keys = pd.Series(sort_values.to_numpy()).rank(method='first', ascending=ascending).to_numpy()
+        order = np.lexsort((sort_keys, row_floor_ranks))
+    else:
+        order = np.argsort(row_floor_ranks, kind='stable')
+
+    page_positions = order[(page_number - 1) * page_size:page_number * page_size]
+    display_cols = [col for col in cols_for_aggrid if col in df_view.columns]
+    page_rows = df_view.iloc[page_positions][display_cols]
+
+    # Group headers: per-floor area sums over the whole filtered set, for the floors on this page
+    page_rows = page_rows.assign(__group_row=False)
+    floor_keys = df_view['floor'].astype(str)
+    floor_area = df_view['sqr'].groupby(floor_keys.to_numpy(), sort=False).sum() if 'sqr' in df_view.columns else None
+    floor_count = floor_keys.value_counts(sort=False)
+    page_parts = []
+    for floor, floor_rows in page_rows.groupby(page_rows['floor'].astype(str).to_numpy(), sort=False):
+        header = {col: None for col in display_cols}
+        header['floor'] = floor
+        header['customer_name'] = f"Tầng {floor} ({floor_count[floor]} HĐ)"
+        if floor_area is not None:
+            header['sqr'] = floor_area[floor]
+        header['__group_row'] = True
+        page_parts.append(pd.DataFrame([header]))
+        page_parts.append(floor_rows.astype({col: str for col in ('floor', 'customer_name') if col in display_cols}))
+    page_df = pd.concat(page_parts, ignore_index=True) if page_parts else page_rows.reset_index(drop=True)
+
+    page_df.columns = [rename_map_aggrid.get(col, col) for col in page_df.columns]
+    return page_df, total_rows, total_pages, page_number
+
+
+def build_server_grid_options(page_df):
+    """Builds the AgGrid options for a page produced by build_server_page."""
+    from st_aggrid import GridOptionsBuilder, JsCode
+
+    gb = GridOptionsBuilder.from_dataframe(page_df)
+    gb.configure_default_column(resizable=True, sortable=False, filter=False, minWidth=120)
+    gb.configure_column(field='Tầng', pinned='left', width=90, minWidth=90)
+    gb.configure_column(field='Tên Khách Hàng', pinned='left', width=200)
+    gb.configure_column(field='Kỳ Hạn', width=200)
+    gb.configure_column(field='__group_row', hide=True)
+    for display_col, formatter in numeric_display_formatters.items():
+        if display_col in page_df.columns:
+            gb.configure_column(field=display_col, type=["numericColumn"], width=150, valueFormatter=JsCode(formatter))
+    gb.configure_grid_options(getRowStyle=JsCode(group_row_style_js))
+    return gb.build()
+
+
+def _display_server_side_grid(df_filtered_for_table, floor_layout, st_object, page_size):
+    """Renders the detail table with paging/sorting/filtering done server-side; returns the page sent."""
+    from st_aggrid import AgGrid, GridUpdateMode
+
+    sortable_cols = [col for col in cols_for_aggrid if col in df_filtered_for_table.columns and col != 'floor']
+    search_col, sort_col, direction_col, page_col = st_object.columns([3, 3, 2, 2])
+    search_text = search_col.text_input("Tìm khách hàng", key="price_detail_grid_search")
+    sort_field = sort_col.selectbox("Sắp xếp trong tầng theo", options=[None] + sortable_cols,
+                                    format_func=lambda col: "—" if col is None else rename_map_aggrid.get(col, col),
+                                    key="price_detail_grid_sort_field")
+    ascending = direction_col.selectbox("Thứ tự", options=[True, False],
+                                        format_func=lambda asc: "Tăng dần" if asc else "Giảm dần",
+                                        key="price_detail_grid_sort_asc")
+    page_number = page_col.number_input("Trang", min_value=1, value=1, step=1, key="price_detail_grid_page")
+
+    page_df, total_rows, total_pages, page_number = build_server_page(
+        df_filtered_for_table, floor_layout, page_number, page_size,
+        sort_field, ascending, search_text
+    )
+    st_object.caption(f"Trang {page_number}/{total_pages} — {total_rows:,} hợp đồng")
+
+    AgGrid(
+        page_df,
+        gridOptions=build_server_grid_options(page_df),
+        height=700,
+        allow_unsafe_jscode=True,
+        enable_enterprise_modules=False,
+        key='price_detail_grid_server',
+        update_mode=GridUpdateMode.MODEL_CHANGED
+    )
+    return page_df
+
+
+def _tree_node_metrics(df_input, node_codes):
+    """Contract count, area and area-weighted average prices per node code, via compute_metrics_table."""
+    node_frame = pd.DataFrame({col: df_input[col].to_numpy() for col in ('sqr', 'rental_usd', 'service_usd')})
+    node_frame['node'] = pd.Categorical(node_codes)
+    metrics = compute_metrics_table(node_frame, 'node', percentiles=False)
+    return metrics[['contracts', 'area', 'rental_avg', 'service_avg']].reset_index(drop=True)
+
+
+def _sorted_codes(values):
+    """Returns (codes, labels) with labels sorted as strings; categorical columns are not converted row by row."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories.astype(str).to_numpy()
+        category_order = np.argsort(categories, kind='stable')
+        code_rank = np.empty(len(categories) + 1, dtype=np.int64)
+        code_rank[category_order] = np.arange(len(categories))
+        # Missing values (code -1) sort after every label
+        code_rank[-1] = len(categories)
+        labels = np.append(categories[category_order], 'nan')
+        return code_rank[values.cat.codes.to_numpy()], labels
+    codes, labels = pd.factorize(values.astype(str).to_numpy(), sort=True)
+    return codes.astype(np.int64), np.asarray(labels)
+
+
+def build_group_tree(df_input, floor_layout):
+    """
+    Computes the floor -> customer -> contract tree of the detail table in pandas.
+
+    Contracts are ordered by floor rank, then customer name, then source order. Each
+    floor and floor x customer node gets its contract count, area and area-weighted
+    average prices from compute_metrics_table, i.e. the values calculate_metrics_values
+    gives for the node's rows. The tree only holds row positions; build_tree_rows
+    materializes the contracts of expanded nodes.
+
+    Args:
+        df_input (pd.DataFrame): The filtered frame (source column names, USD prices).
+        floor_layout (FloorLayout): Floor order, used if df_input has no stored floor ranks.
+
+    Returns:
+        dict: 'order' (row positions in tree order), 'floors' and 'customers' (one row
+              per node, with 'start' / 'stop' slicing 'order'; floor nodes also slice
+              'customers' with 'customer_start' / 'customer_stop').
+    """
+    ranks = floor_ranks(df_input, floor_layout).astype(np.int64)
+    customer_codes, customer_labels = _sorted_codes(df_input['customer_name'])
+    n_customers = max(len(customer_labels), 1)
+    node_codes = ranks * n_customers + customer_codes
+    order = np.argsort(node_codes, kind='stable')
+
+    sorted_codes = node_codes[order]
+    customer_starts = np.flatnonzero(np.diff(sorted_codes, prepend=-1))
+    customer_nodes = sorted_codes[customer_starts]
+    customers = _tree_node_metrics(df_input, node_codes)
+    customers['start'] = customer_starts
+    customers['stop'] = np.append(customer_starts[1:], len(order))
+    customers['customer_name'] = customer_labels[customer_nodes % n_customers]
+    customer_ranks = customer_nodes // n_customers
+
+    floor_nodes, customer_starts_per_floor = np.unique(customer_ranks, return_index=True)
+    floors = _tree_node_metrics(df_input, ranks)
+    floors['customer_start'] = customer_starts_per_floor
+    floors['customer_stop'] = np.append(customer_starts_per_floor[1:], len(customers))
+    floors['start'] = customers['start'].to_numpy()[customer_starts_per_floor]
+    floors['stop'] = np.append(floors['start'].to_numpy()[1:], len(order))
+
+    floor_labels = df_input['floor']
+    customers['floor'] = floor_labels.iloc[order[customer_starts]].astype(str).to_numpy()
+    floors['floor'] = customers['floor'].to_numpy()[customer_starts_per_floor]
+    return {'order': order, 'floors': floors, 'customers': customers}
+
+
+def _tree_group_row(display_cols, node_id, level, label, node, expanded, customer_name=None):
+    row = {col: None for col in display_cols}
+    row.update({'floor': node.floor, 'customer_name': customer_name,
+                'sqr': node.area, 'rental_usd': node.rental_avg, 'service_usd': node.service_avg})
+    row.update({TREE_LABEL_COL: f"{label} ({int(node.contracts):,} HĐ)", '__node': node_id, '__level': level,
+                '__expandable': True, '__expanded': expanded, '__group_row': True})
+    return row
+
+
+def build_tree_rows(group_tree, df_input, expanded=(), max_child_rows=TREE_MAX_CHILD_ROWS):
+    """
+    Flattens the visible part of a build_group_tree tree into grid rows.
+
+    Every floor node is listed; the customers of expanded floors and the contracts of
+    expanded customers follow their parent, so collapsed groups send no children.
+    At most max_child_rows children are listed per group, the rest are counted in a
+    note row.
+
+    Args:
+        group_tree (dict): build_group_tree output for df_input.
+        df_input (pd.DataFrame): The frame the tree was built from.
+        expanded (collection): Ids ('__node' values) of the expanded group rows.
+        max_child_rows (int): Customers / contracts listed under one expanded group.
+
+    Returns:
+        pd.DataFrame: The rows with the display names, the TREE_LABEL_COL label and the
+            hidden '__node', '__level', '__expandable', '__expanded' and '__group_row' columns.
+    """
+    display_cols = [col for col in cols_for_aggrid if col in df_input.columns]
+    meta_cols = ['__node', '__level', '__expandable', '__expanded', '__group_row']
+    parts, pending_rows = [], []
+
+    def flush_pending_rows():
+        if pending_rows:
+            parts.append(pd.DataFrame(pending_rows))
+            pending_rows.clear()
+
+    def add_note_row(hidden_children, noun, level):
+        if hidden_children > 0:
+            pending_rows.append({**{col: None for col in display_cols},
+                                 TREE_LABEL_COL: f"… và {hidden_children:,} {noun} khác", '__node': None,
+                                 '__level': level, '__expandable': False, '__expanded': False, '__group_row': False})
+
+    customers = group_tree['customers']
+    for floor_node in group_tree['floors'].itertuples(index=False):
+        floor_id = f"floor:{floor_node.floor}"
+        floor_expanded = floor_id in expanded
+        pending_rows.append(_tree_group_row(display_cols, floor_id, 0, f"Tầng {floor_node.floor}",
+                                            floor_node, floor_expanded))
+        if not floor_expanded:
+            continue
+        customer_stop = min(floor_node.customer_stop, floor_node.customer_start + max_child_rows)
+        for customer_node in customers.iloc[floor_node.customer_start:customer_stop].itertuples(index=False):
+            customer_id = f"customer:{customer_node.floor}/{customer_node.customer_name}"
+            customer_expanded = customer_id in expanded
+            pending_rows.append(_tree_group_row(display_cols, customer_id, 1, customer_node.customer_name,
+                                                customer_node, customer_expanded, customer_node.customer_name))
+            if not customer_expanded:
+                continue
+            stop = min(customer_node.stop, customer_node.start + max_child_rows)
+            contract_rows = df_input.iloc[group_tree['order'][customer_node.start:stop]][display_cols]
+            flush_pending_rows()
+            parts.append(contract_rows.astype({col: str for col in ('floor', 'customer_name') if col in display_cols})
+                         .assign(**{TREE_LABEL_COL: None, '__node': None, '__level': 2,
+                                    '__expandable': False, '__expanded': False, '__group_row': False}))
+            add_note_row(customer_node.stop - stop, 'HĐ', 2)
+        add_note_row(floor_node.customer_stop - customer_stop, 'khách hàng', 1)
+    flush_pending_rows()
+
+    tree_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=display_cols + meta_cols)
+    tree_df = tree_df[[TREE_LABEL_COL] + display_cols + meta_cols]
+    tree_df.columns = [rename_map_aggrid.get(col, col) for col in tree_df.columns]
+    return tree_df
+
+
+def build_tree_grid_options(tree_df):
+    """Builds the AgGrid options for rows produced by build_tree_rows; a click on a group row selects it."""
+    from st_aggrid import GridOptionsBuilder, JsCode
+
+    gb = GridOptionsBuilder.from_dataframe(tree_df)
+    gb.configure_default_column(resizable=True, sortable=False, filter=False, minWidth=120)
+    gb.configure_column(field=TREE_LABEL_COL, pinned='left', width=300, valueFormatter=JsCode(tree_label_formatter_js))
+    gb.configure_column(field='Kỳ Hạn', width=200)
+    for hidden_col in ('Tầng', 'Tên Khách Hàng', '__node', '__level', '__expandable', '__expanded', '__group_row'):
+        if hidden_col in tree_df.columns:
+            gb.configure_column(field=hidden_col, hide=True)
+    for display_col, formatter in numeric_display_formatters.items():
+        if display_col in tree_df.columns:
+            gb.configure_column(field=display_col, type=["numericColumn"], width=150, valueFormatter=JsCode(formatter))
+    gb.configure_selection('single')
+    gb.configure_grid_options(getRowStyle=JsCode(group_row_style_js))
+    return gb.build()
+
+
+def _display_tree_grid(df_filtered_for_table, floor_layout, st_object, group_tree=None):
+    """
+    Renders the detail table as the server-computed group tree; returns the rows sent.
+
+    Clicking a group row toggles it in st.session_state and reruns, and the grid is then
+    remounted under a new key so the click does not stay selected.
+    """
+    from st_aggrid import AgGrid, GridUpdateMode
+    from streamlit.errors import StreamlitAPIException
+
+    if group_tree is None:
+        group_tree = build_group_tree(df_filtered_for_table, floor_layout)
+    expanded = st_object.session_state.setdefault('price_detail_grid_expanded', set())
+    generation = st_object.session_state.setdefault('price_detail_grid_generation', 0)
+
+    tree_df = build_tree_rows(group_tree, df_filtered_for_table, expanded)
+    st_object.caption(f"{len(df_filtered_for_table):,} hợp đồng — bấm vào một dòng tầng / khách hàng để mở hoặc thu gọn. "
+                      "Dòng nhóm: tổng diện tích và giá bình quân theo diện tích.")
+    grid_response = AgGrid(
+        tree_df,
+        gridOptions=build_tree_grid_options(tree_df),
+        height=700,
+        allow_unsafe_jscode=True,
+        enable_enterprise_modules=False,
+        key=f'price_detail_grid_tree_{generation}',
+        update_mode=GridUpdateMode.SELECTION_CHANGED
+    )
+
+    selected_rows = grid_response['selected_rows']
+    if selected_rows is not None and len(selected_rows):
+        node_id = pd.DataFrame(selected_rows)['__node'].iloc[0]
+        if isinstance(node_id, str):
+            expanded.symmetric_difference_update({node_id})
+            st_object.session_state['price_detail_grid_generation'] = generation + 1
+            try:
+                st_object.rerun(scope='fragment')
+            except StreamlitAPIException:
+                # Not rendered inside a fragment
+                st_object.rerun()
+    return tree_df
+
+
+def build_client_grid_options(df_filtered_for_table, floor_layout, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Builds the display frame and AgGrid options for the client-side row model.
+
+    Rows are shipped in floor rank order (the stored ranks, or floor_layout's) and the
+    floor groups keep that order, so the grid needs no floor comparator.
+
+    Returns:
+        tuple: (aggrid_display_df, gridOptions), or (None, None) if no displayable column exists.
+    """
+    from st_aggrid import GridOptionsBuilder, JsCode
+
+    # Ensure only existing columns are selected to avoid KeyError
+    display_cols_aggrid = [col for col in cols_for_aggrid if col in df_filtered_for_table.columns]
+    
+    if not display_cols_aggrid:
+        return None, None
+
+    # Taking the rows in floor rank order yields a new frame, renaming it does not touch the caller's data
+    floor_order = np.argsort(floor_ranks(df_filtered_for_table, floor_layout), kind='stable')
+    aggrid_display_df = df_filtered_for_table[display_cols_aggrid].take(floor_order)
+
+    aggrid_display_df.columns = [rename_map_aggrid.get(col, col) for col in aggrid_display_df.columns]
+
+    number_formatter, decimal_formatter = JsCode(number_formatter_js), JsCode(decimal_formatter_js)
+    gb = GridOptionsBuilder.from_dataframe(aggrid_display_df, enableRowGroup=True, rowGroupPanelShow='always')
+    gb.configure_pagination(enabled=True, paginationAutoPageSize=False, paginationPageSize=page_size) 
+    
+    # Default column configurations
+    gb.configure_default_column(
+        resizable=True, 
+        groupable=True, # Allow grouping by any column
+        filter='agTextColumnFilter', # Default filter type
+        filterParams={"buttons": ['clear']}, # Default filter buttons
+        filterable=True, 
+        sortable=True, 
+        floatingFilter=True, # Enable floating filters for all columns
+        minWidth=120 # Default min width
+    )
+
+    # Specific column configurations
+    gb.configure_column(field='Tầng',
+                        sortable=False, # Floor groups keep the rank order the rows are shipped in
+                        rowGroup=True, # Enable row grouping by 'Tầng' by default
+                        minWidth=120# Specific width for Tầng
+                       )
+    gb.configure_column(field='Tên Khách Hàng', width=200,hide = True)
+    gb.configure_column(field='Diện Tích (m²)', type=["numericColumn", "numberColumnFilter"], aggFunc='sum', width=150,valueFormatter= number_formatter)
+    gb.configure_column(field='Giá Thuê (USD)', type=["numericColumn", "numberColumnFilter"],width=150,valueFormatter= decimal_formatter)
+    gb.configure_column(field='Phí Dịch Vụ (USD)', type=["numericColumn", "numberColumnFilter"],width=180,valueFormatter= decimal_formatter)
+    gb.configure_column(field='Tổng (USD)', type=["numericColumn", "numberColumnFilter"], width=150,valueFormatter= decimal_formatter)
+    gb.configure_column(field='Kỳ Hạn', width=200)
+    gb.configure_column(field='Giá Thuê (VND)', type=["numericColumn", "numberColumnFilter"], width=150,valueFormatter= number_formatter)
+    gb.configure_column(field='Phí Dịch Vụ (VND)', type=["numericColumn", "numberColumnFilter"], width=180,valueFormatter= number_formatter)
+    gb.configure_column(field='Tỷ giá ký HĐ', type=["numericColumn", "numberColumnFilter"], width=180,valueFormatter= number_formatter)
+    
+
+    # Configure how grouped rows are displayed
+    autoGroupColDef_dict = {
+        "headerName": "Khách hàng", # Name for the auto-group column
+        "field": 'Tên Khách Hàng', # The field being grouped (though AgGrid handles this internally)
+        "pinned": "left",
+        "cellRendererParams": {
+            "suppressCount": True, # Show count of items in group
+        },
+        "filter": 'agTextColumnFilter', # Allow filtering on the grouped column
+        "floatingFilter": True,
+        "minWidth": 200 # Width for the group column
+    }
+    gb.configure_grid_options(
+        groupDefaultExpanded=-1, # Expand all groups by default
+        autoGroupColumnDef=autoGroupColDef_dict,
+        # domLayout='autoHeight' # Adjusts grid height to content, use with caution for large datasets
+    )
+    
+    gridOptions = gb.build()
+
+    return aggrid_display_df, gridOptions
+
+
+def display_ag_grid_table(df_filtered_for_table, floor_layout, st_object,
+                          row_model='auto', page_size=DEFAULT_PAGE_SIZE, group_tree=None):
     """
     Displays the detailed price data using AgGrid.
 
     Args:
         df_filtered_for_table (pd.DataFrame): The DataFrame to display.
-        custom_floor_sort_order (list): The custom sort order for the 'Tầng' column.
+        floor_layout (FloorLayout): Floor order of the 'Tầng' column, used if the frame
+            has no stored floor ranks.
         st_object (streamlit): The Streamlit module instance for displaying messages.
+        row_model (str): 'tree' sends the floor -> customer -> contract tree computed in
+            pandas, with only the children of expanded groups; 'client' ships the whole
+            frame and lets AgGrid (enterprise) group, sort and page it; 'server' only
+            sends one page, sorted and searched in pandas, plus per-floor group headers.
+            'auto' picks 'tree' above TREE_ROW_THRESHOLD rows and 'client' otherwise.
+        page_size (int): Rows per page ('client' and 'server').
+        group_tree (dict, optional): build_group_tree output for the frame, e.g. cached
+            per data version and filter state; computed here if not given.
+
+    Returns:
+        pd.DataFrame: The rows actually sent to the grid, or None if nothing was shown.
     """
+    from st_aggrid import AgGrid, GridUpdateMode
+
     if df_filtered_for_table is not None and not df_filtered_for_table.empty:
-        # Define which columns to show and their display names
-        cols_for_aggrid = ['floor', 
-                           'customer_name', 
-                           'period', 
-                           'sqr', 
-                           'rental_usd', 
-                           'service_usd', 
-                           'total_usd', 
-                           'rental_vnd', 
-                           'service_vnd',
-                           'org_fx',
-                           'org_rental_usd',
-                           'org_service_usd',
-                           'org_total_usd'
-                           ]
-        # Ensure only existing columns are selected to avoid KeyError
-        display_cols_aggrid = [col for col in cols_for_aggrid if col in df_filtered_for_table.columns]
-        
-        if not display_cols_aggrid:
-            st_object.info("Không có cột dữ liệu nào phù hợp để hiển thị trong bảng chi tiết.")
-            return
-
-        aggrid_display_df = df_filtered_for_table[display_cols_aggrid].copy()
-        
-        rename_map_aggrid = {
-            'customer_name': 'Tên Khách Hàng',
-            'floor': 'Tầng',
-            'sqr': 'Diện Tích (m²)', 
-            'period': 'Kỳ Hạn', 
-            'rental_usd': 'Giá Thuê (USD)',
-            'service_usd': 'Phí Dịch Vụ (USD)',
-            'total_usd': 'Tổng (USD)',
-            'rental_vnd': 'Giá Thuê (VND)',
-            'service_vnd': 'Phí Dịch Vụ (VND)',
-            'org_fx': 'Tỷ giá ký HĐ',
-            'org_rental_usd': 'Giá Thuê (USD) Ký HĐ',
-            'org_service_usd': 'Phí Dịch Vụ (USD) Ký HĐ',
-            'org_total_usd': 'Tổng (USD) Ký HĐ'
-        }
-        aggrid_display_df.columns = [rename_map_aggrid.get(col, col) for col in aggrid_display_df.columns]
-
-        # --- Custom Sort JS for 'Tầng' Column ---
-        # Ensure the sort order list is correctly formatted for JS
-        js_sort_order_list = str(custom_floor_sort_order).replace("'", '"') # JS needs double quotes for strings in array
-
-        custom_floor_sort_js = f"""
-        function(valueA, valueB) {{
-            const sortOrder = {js_sort_order_list};
-            const map = {{}};
-            for (let i = 0; i < sortOrder.length; i++) {{
-                map[sortOrder[i]] = i;
-            }}
-            const indexA = map[valueA] !== undefined ? map[valueA] : sortOrder.length;
-            const indexB = map[valueB] !== undefined ? map[valueB] : sortOrder.length;
-
-            if (indexA === indexB) return 0;
-            return indexA < indexB ? -1 : 1;
-        }}
-        """
-        
-        gb = GridOptionsBuilder.from_dataframe(aggrid_display_df, enableRowGroup=True, rowGroupPanelShow='always')
-        gb.configure_pagination(enabled=True, paginationAutoPageSize=False, paginationPageSize=20) 
-        
-        # Default column configurations
-        gb.configure_default_column(
-            resizable=True, 
-            groupable=True, # Allow grouping by any column
-            filter='agTextColumnFilter', # Default filter type
-            filterParams={"buttons": ['clear']}, # Default filter buttons
-            filterable=True, 
-            sortable=True, 
-            floatingFilter=True, # Enable floating filters for all columns
-            minWidth=120 # Default min width
-        )
+        if row_model == 'auto':
+            row_model = 'tree' if len(df_filtered_for_table) > TREE_ROW_THRESHOLD else 'client'
+        if row_model == 'tree':
+            return _display_tree_grid(df_filtered_for_table, floor_layout, st_object, group_tree)
+        if row_model == 'server':
+            return _display_server_side_grid(df_filtered_for_table, floor_layout, st_object, page_size)
 
-        # Specific column configurations
-        gb.configure_column(field='Tầng',
-                            sort='asc', # Initial sort direction
-                            rowGroup=True, # Enable row grouping by 'Tầng' by default
-                            comparator=JsCode(custom_floor_sort_js),
-                            minWidth=120# Specific width for Tầng
-                           )
-        gb.configure_column(field='Tên Khách Hàng', width=200,hide = True)
-        gb.configure_column(field='Diện Tích (m²)', type=["numericColumn", "numberColumnFilter"], aggFunc='sum', width=150,valueFormatter= number_formatter)
-        gb.configure_column(field='Giá Thuê (USD)', type=["numericColumn", "numberColumnFilter"],width=150,valueFormatter= decimal_formatter)
-        gb.configure_column(field='Phí Dịch Vụ (USD)', type=["numericColumn", "numberColumnFilter"],width=180,valueFormatter= decimal_formatter)
-        gb.configure_column(field='Tổng (USD)', type=["numericColumn", "numberColumnFilter"], width=150,valueFormatter= decimal_formatter)
-        gb.configure_column(field='Kỳ Hạn', width=200)
-        gb.configure_column(field='Giá Thuê (VND)', type=["numericColumn", "numberColumnFilter"], width=150,valueFormatter= number_formatter)
-        gb.configure_column(field='Phí Dịch Vụ (VND)', type=["numericColumn", "numberColumnFilter"], width=180,valueFormatter= number_formatter)
-        gb.configure_column(field='Tỷ giá ký HĐ', type=["numericColumn", "numberColumnFilter"], width=180,valueFormatter= number_formatter)
-        
-
-        # Configure how grouped rows are displayed
-        autoGroupColDef_dict = {
-            "headerName": "Khách hàng", # Name for the auto-group column
-            "field": 'Tên Khách Hàng', # The field being grouped (though AgGrid handles this internally)
-            "pinned": "left",
-            "cellRendererParams": {
-                "suppressCount": True, # Show count of items in group
-            },
-            "filter": 'agTextColumnFilter', # Allow filtering on the grouped column
-            "floatingFilter": True,
-            "minWidth": 200 # Width for the group column
-        }
-        gb.configure_grid_options(
-            groupDefaultExpanded=-1, # Expand all groups by default
-            autoGroupColumnDef=autoGroupColDef_dict,
-            # domLayout='autoHeight' # Adjusts grid height to content, use with caution for large datasets
-        )
-        
-        gridOptions = gb.build()
+        aggrid_display_df, gridOptions = build_client_grid_options(df_filtered_for_table, floor_layout, page_size)
+        if aggrid_display_df is None:
+            st_object.info("Không có cột dữ liệu nào phù hợp để hiển thị trong bảng chi tiết.")
+            return None
 
         AgGrid(
             aggrid_display_df,
@@ -154,5 +550,7 @@ def display_ag_grid_table(df_filtered_for_table, custom_floor_sort_order, st_obj
             key='price_detail_grid', # Unique key for the AgGrid instance
             update_mode=GridUpdateMode.MODEL_CHANGED # How grid updates
         )
+        return aggrid_display_df
     else:
         st_object.info("Không có dữ liệu chi tiết để hiển thị dựa trên bộ lọc hiện tại hoặc chưa có file nào được tải lên.")
+        return None
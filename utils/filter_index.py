@@ -0,0 +1,70 @@
+import numpy as np
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT, floor_ranks
+
+
+def _build_inverted_index(categorical_series):
+    """Maps each category of a categorical series to the sorted row positions holding it."""
+    codes = categorical_series.cat.codes.to_numpy()
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(categorical_series.cat.categories))
+    # Missing values (code -1) sort first; skip them
+    start = int((codes < 0).sum())
+    inverted_index = {}
+    for category, count in zip(categorical_series.cat.categories, counts):
+        if count:
+            inverted_index[category] = order[start:start + count]
+        start += count
+    return inverted_index
+
+
+def build_filter_index(df_base, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """
+    Precomputes the filter options and an inverted index for the customer/floor filters.
+
+    Args:
+        df_base (pd.DataFrame): The cleaned frame with categorical 'customer_name' and
+            'floor' columns.
+        floor_layout (FloorLayout): Orders the floor options when df_base has no
+            stored floor ranks.
+
+    Returns:
+        dict: 'customer_options' and 'floor_options' (display-ready lists) plus
+              'customer_rows' and 'floor_rows' (value -> row positions).
+    """
+    customer_rows = _build_inverted_index(df_base['customer_name'])
+    floor_rows = _build_inverted_index(df_base['floor'])
+
+    # Every row of a floor has the same rank, so its first row gives the floor's rank
+    ranks = floor_ranks(df_base, floor_layout)
+    return {
+        'customer_options': sorted(customer_rows),
+        'floor_options': sorted(floor_rows, key=lambda floor: ranks[floor_rows[floor][0]]),
+        'customer_rows': customer_rows,
+        'floor_rows': floor_rows,
+    }
+
+
+def _selected_positions(inverted_index, selected_values):
+    positions = [inverted_index[value] for value in selected_values if value in inverted_index]
+    if not positions:
+        return np.empty(0, dtype=np.intp)
+    return np.unique(np.concatenate(positions))
+
+
+def filter_rows(df_input, filter_index, selected_customers=None, selected_floors=None):
+    """
+    Filters df_input by customer/floor selections using the prebuilt inverted index.
+
+    An empty or None selection means "all". When nothing is selected df_input itself
+    is returned; otherwise only the matching rows are taken, in their original order.
+    """
+    positions = None
+    if selected_customers:
+        positions = _selected_positions(filter_index['customer_rows'], selected_customers)
+    if selected_floors:
+        floor_positions = _selected_positions(filter_index['floor_rows'], selected_floors)
+        positions = floor_positions if positions is None else np.intersect1d(positions, floor_positions, assume_unique=True)
+
+    if positions is None:
+        return df_input
+    return df_input.iloc[positions]
@@ -0,0 +1,140 @@
+import json
+import re
+from collections.abc import Mapping
+import numpy as np
+import pandas as pd
+
+# Display order of the building's floors (top floor first)
+DEFAULT_FLOOR_ORDER = ["27", "26", "25", "24", "23", "22", "21", "20", "19", "18",
+                       "17", "16", "15", "14", "12", "11", "10", "09", "08", "07",
+                       "06", "05", "03", "02", "01", "G"]
+# Column of the cleaned frame holding each row's floor rank (position in the display order)
+FLOOR_RANK_COL = 'floor_rank'
+_NUMBERED_FLOOR = re.compile(r'^(\d+)([A-Z]*)$')
+_BASEMENT_FLOOR = re.compile(r'^(?:B|SB|P|H)(\d*)$')
+_GROUND_FLOORS = {'G': 0.0, 'GF': 0.0, 'L': 0.0, 'TRET': 0.0, 'TRỆT': 0.0, 'M': 0.5, 'LM': 0.5}
+
+
+def floor_level(label):
+    """
+    Guesses the physical level of a floor label, or None if it has no recognizable form.
+
+    '12' is 12, '12A' sits just above 12, 'G' / 'L' are 0, 'M' (mezzanine) is 0.5 and
+    basements 'B1', 'B2' ... are -1, -2 ...
+    """
+    label = str(label).strip().upper()
+    if label in _GROUND_FLOORS:
+        return _GROUND_FLOORS[label]
+    match = _NUMBERED_FLOOR.match(label)
+    if match:
+        return int(match.group(1)) + (0.5 if match.group(2) else 0.0)
+    match = _BASEMENT_FLOOR.match(label)
+    if match:
+        return -float(match.group(1) or 1)
+    return None
+
+
+class FloorLayout:
+    """
+    Display order of one building's floors, turned into integer ranks.
+
+    Floors missing from the configured order are not pushed to the end: they are
+    placed by their guessed level (see floor_level) among the configured floors, e.g.
+    '13A' between '14' and '12' and 'B1' below 'G'. Only labels without a
+    recognizable level sort last. Either way they are listed by unknown_floors, so
+    the layout can be completed.
+    """
+
+    def __init__(self, floor_order, name=None):
+        self.floor_order = [str(floor) for floor in floor_order]
+        self.name = name
+        self._positions = {floor: position for position, floor in enumerate(self.floor_order)}
+        known_levels = [(position, floor_level(floor)) for position, floor in enumerate(self.floor_order)]
+        self._known_levels = [(position, level) for position, level in known_levels if level is not None]
+        self._descending = (len(self._known_levels) < 2
+                            or self._known_levels[0][1] >= self._known_levels[-1][1])
+        self._sort_keys = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Loads a layout from a list of floors, or from a JSON file holding such a list
+        or {"name": ..., "floors": [...]}. None gives the default layout.
+        """
+        if config is None:
+            return DEFAULT_FLOOR_LAYOUT
+        if isinstance(config, str):
+            with open(config, encoding='utf-8') as layout_file:
+                config = json.load(layout_file)
+        if isinstance(config, Mapping):
+            return cls(config['floors'], name=config.get('name'))
+        return cls(config)
+
+    def _sort_key(self, floor):
+        """Sort key of a floor label: configured floors by position, the others slotted in by level."""
+        sort_key = self._sort_keys.get(floor)
+        if sort_key is not None:
+            return sort_key
+        position = self._positions.get(floor)
+        if position is not None:
+            sort_key = (position, 1, 0.0, floor)
+        else:
+            level = floor_level(floor)
+            if level is None:
+                sort_key = (len(self.floor_order) + 1, 0, 0.0, floor)
+            else:
+                # Before the first configured floor that comes after it in the display direction
+                before = next((known_position for known_position, known_level in self._known_levels
+                               if (known_level < level if self._descending else known_level > level)),
+                              len(self.floor_order))
+                sort_key = (before, 0, -level if self._descending else level, floor)
+        self._sort_keys[floor] = sort_key
+        return sort_key
+
+    def ordered(self, floors):
+        """Returns the distinct floor labels in display order."""
+        return sorted({str(floor) for floor in floors}, key=self._sort_key)
+
+    def unknown_floors(self, floors):
+        """Returns the floor labels that are not in the configured order, in display order."""
+        return [floor for floor in self.ordered(floors) if floor not in self._positions]
+
+    def rank(self, floor_series):
+        """
+        Returns an int16 rank per row (0 = first in display order); missing floors rank last.
+
+        Ranks are dense over the floors present, so they stay comparable only within one frame.
+        """
+        if isinstance(floor_series.dtype, pd.CategoricalDtype):
+            categories, codes = floor_series.cat.categories.astype(str), floor_series.cat.codes.to_numpy()
+        else:
+            codes, categories = pd.factorize(floor_series.astype(str).where(floor_series.notna()))
+            categories = categories.astype(str)
+        rank_of_label = {floor: rank for rank, floor in enumerate(self.ordered(categories))}
+        # Code -1 (missing) picks the trailing rank
+        category_ranks = np.array([rank_of_label[floor] for floor in categories] + [len(categories)], dtype=np.int16)
+        return category_ranks[codes]
+
+
+DEFAULT_FLOOR_LAYOUT = FloorLayout(DEFAULT_FLOOR_ORDER)
+
+
+def add_floor_ranks(df_input, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """Stores floor_layout's rank of every row of df_input in FLOOR_RANK_COL (in place) and returns df_input."""
+    df_input[FLOOR_RANK_COL] = floor_layout.rank(df_input['floor'])
+    return df_input
+
+
+def floor_ranks(df_input, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """Returns the rank of every row: the stored FLOOR_RANK_COL, or floor_layout's ranks if there is none."""
+    if FLOOR_RANK_COL in df_input.columns:
+        return df_input[FLOOR_RANK_COL].to_numpy()
+    return floor_layout.rank(df_input['floor'])
+
+
+def floors_in_rank_order(df_input, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """Returns the distinct floors of df_input in rank order (e.g. for a chart axis)."""
+    floors = df_input['floor'].astype(str).to_numpy()
+    ranks = floor_ranks(df_input, floor_layout)
+    rank_by_floor = pd.Series(ranks).groupby(floors, sort=False).min()
+    return rank_by_floor.sort_values(kind='stable').index.tolist()
@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import requests
+
+FX_FIELDS = ('buy', 'transfer', 'sell')
+DEFAULT_FX_CACHE_PATH = os.path.join(".cache", "fx_rates.json")
+DEFAULT_FX_URL = "https://portal.vietcombank.com.vn/Usercontrols/TVPortal.TyGia/pXML.aspx"
+# Wait after a failed fetch before the next automatic one; doubled after every further failure, up to the maximum
+FX_RETRY_BASE_SECONDS = 30
+FX_RETRY_MAX_SECONDS = 1800
+
+
+def _parse_rate_value(value):
+    """Parses a VCB rate string such as '25,450.00'; '-' or blanks become None."""
+    if value is None:
+        return None
+    value = value.strip().replace(',', '')
+    if not value or value == '-':
+        return None
+    return float(value)
+
+
+def parse_vcb_rates(xml_content):
+    """
+    Parses the Vietcombank rate XML into a currency table.
+
+    Args:
+        xml_content (bytes | str): The raw XML returned by the VCB endpoint.
+
+    Returns:
+        tuple: (rates, fx_time) where rates maps a currency code to a
+               (buy, transfer, sell) tuple and fx_time is formatted as dd/mm/YYYY.
+    """
+    root = ET.fromstring(xml_content)
+
+    datetime_element = root.find('DateTime')
+    fx_time_str = datetime_element.text if datetime_element is not None else ""
+    fx_time = datetime.strptime(fx_time_str.strip(), "%m/%d/%Y %I:%M:%S %p").strftime("%d/%m/%Y")
+
+    rates = {}
+    for exrate in root.findall('Exrate'):
+        currency_code = (exrate.get('CurrencyCode') or '').strip()
+        if currency_code:
+            rates[currency_code] = tuple(_parse_rate_value(exrate.get(field.capitalize())) for field in FX_FIELDS)
+    return rates, fx_time
+
+
+class FxRateProvider:
+    """
+    Stale-while-revalidate FX rate provider.
+
+    The last known rate table is served from memory (seeded from an on-disk cache on
+    first use) and refreshed in a background thread once it is older than
+    max_age_seconds, so callers never wait on the network. After a failed fetch no
+    automatic refresh starts for retry_base_seconds, doubling with every further
+    failure up to retry_max_seconds.
+    """
+
+    def __init__(self, fx_url, cache_path=DEFAULT_FX_CACHE_PATH, max_age_seconds=3600, timeout=10,
+                 retry_base_seconds=FX_RETRY_BASE_SECONDS, retry_max_seconds=FX_RETRY_MAX_SECONDS):
+        self.fx_url = fx_url
+        self.cache_path = cache_path
+        self.max_age_seconds = max_age_seconds
+        self.timeout = timeout
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.last_error = None
+        self.failures = 0
+        self.last_failed_at = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._snapshot = self._load_disk_cache()
+
+    def _load_disk_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as cache_file:
+                snapshot = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+        if snapshot.get('source') != self.fx_url or not snapshot.get('rates'):
+            return None
+        snapshot['rates'] = {code: tuple(values) for code, values in snapshot['rates'].items()}
+        return snapshot
+
+    def _write_disk_cache(self, snapshot):
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(snapshot, cache_file, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self):
+        """Fetches and parses the rate table synchronously; returns True on success."""
+        try:
+            response = requests.get(self.fx_url, timeout=self.timeout)
+            response.raise_for_status()
+            rates, fx_time = parse_vcb_rates(response.content)
+        except requests.exceptions.RequestException as e:
+            self._record_failure(f"Lỗi khi truy cập URL tỷ giá: {e}")
+            return False
+        except (ET.ParseError, ValueError, AttributeError) as e:
+            self._record_failure(f"Lỗi khi xử lý dữ liệu tỷ giá: {e}")
+            return False
+
+        snapshot = {'source': self.fx_url, 'fetched_at': time.time(), 'fx_time': fx_time, 'rates': rates}
+        with self._lock:
+            self._snapshot = snapshot
+            self.last_error = None
+            self.failures = 0
+            self.last_failed_at = None
+        try:
+            self._write_disk_cache(snapshot)
+        except OSError as e:
+            self.last_error = f"Không ghi được cache tỷ giá: {e}"
+        return True
+
+    def _record_failure(self, message):
+        with self._lock:
+            self.last_error = message
+            self.failures += 1
+            self.last_failed_at = time.time()
+
+    def retry_delay(self):
+        """Seconds to wait after the last failed fetch before refreshing again (0 when the last fetch succeeded)."""
+        if not self.failures:
+            return 0
+        return min(self.retry_base_seconds * 2 ** (self.failures - 1), self.retry_max_seconds)
+
+    def is_backing_off(self):
+        """Whether the last fetch failed less than retry_delay() seconds ago."""
+        last_failed_at = self.last_failed_at
+        return last_failed_at is not None and time.time() - last_failed_at < self.retry_delay()
+
+    def refresh_async(self):
+        """Starts a background refresh unless one is already running."""
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self.refresh, name="fx-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def wait_for_refresh(self, timeout):
+        """Waits up to timeout seconds for a running background refresh; returns True once none is running."""
+        refresh_thread = self._refresh_thread
+        if refresh_thread is not None:
+            refresh_thread.join(timeout)
+            return not refresh_thread.is_alive()
+        return True
+
+    def is_stale(self, margin_seconds=0):
+        """Whether the rates are missing or will be older than max_age_seconds within margin_seconds."""
+        snapshot = self._snapshot
+        return snapshot is None or time.time() - snapshot['fetched_at'] >= self.max_age_seconds - margin_seconds
+
+    def get_rate(self, currency_code='USD', field='sell'):
+        """
+        Returns the last known rate without blocking, triggering a refresh when stale
+        (unless a recent failure is still backing off).
+
+        Returns:
+            tuple: (fx_rate, fx_time, age_seconds); all None when no rate is known yet.
+        """
+        if self.is_stale() and not self.is_backing_off():
+            self.refresh_async()
+
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None, None, None
+        currency_rates = snapshot['rates'].get(currency_code)
+        fx_rate = currency_rates[FX_FIELDS.index(field)] if currency_rates else None
+        return fx_rate, snapshot['fx_time'], time.time() - snapshot['fetched_at']
+
+
+def format_fx_age(age_seconds):
+    """Formats a rate age for display, e.g. '5 phút trước'."""
+    if age_seconds is None:
+        return "N/A"
+    if age_seconds < 60:
+        return "vừa cập nhật"
+    if age_seconds < 3600:
+        return f"{int(age_seconds // 60)} phút trước"
+    if age_seconds < 86400:
+        return f"{int(age_seconds // 3600)} giờ trước"
+    return f"{int(age_seconds // 86400)} ngày trước"
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from utils.metrics_engine import TOTAL_GROUP_LABEL
+
+# Upper bound on rates x contracts cells materialized at once
+DEFAULT_CHUNK_ELEMENTS = 4_000_000
+
+
+def build_rate_grid(start_rate, stop_rate, step):
+    """Returns the rates from start_rate to stop_rate (inclusive) in increments of step."""
+    if step <= 0 or stop_rate < start_rate:
+        raise ValueError("Khoảng tỷ giá không hợp lệ.")
+    n_steps = int(np.floor((stop_rate - start_rate) / step + 1e-9))
+    return start_rate + step * np.arange(n_steps + 1, dtype=np.float64)
+
+
+def reprice_matrix(df_base, rates):
+    """
+    Reprices every contract at every rate in one broadcast.
+
+    Uses the same rounding as apply_fx_rate, so row r equals apply_fx_rate(df_base, rates[r]).
+
+    Returns:
+        tuple: (rental_usd, service_usd), each a (len(rates), len(df_base)) array.
+    """
+    rate_column = np.asarray(rates, dtype=np.float64)[:, None]
+    rental_usd = np.round(df_base['rental_vnd'].to_numpy(dtype=np.float64)[None, :] / rate_column, 2)
+    service_usd = np.round(df_base['service_vnd'].to_numpy(dtype=np.float64)[None, :] / rate_column, 2)
+    return rental_usd, service_usd
+
+
+def _group_sums(values, group_starts):
+    """Sums the columns of a (rates, contracts) array per contiguous group of contracts."""
+    return np.add.reduceat(values, group_starts, axis=1)
+
+
+def compute_fx_sensitivity(df_base, rates, group_col='floor', chunk_elements=DEFAULT_CHUNK_ELEMENTS):
+    """
+    Computes area-weighted USD prices per group and portfolio-wide for every rate.
+
+    Contracts are repriced with reprice_matrix in chunks of rates, so memory stays
+    bounded at hundreds of rates x tens of thousands of contracts. As in the metrics
+    engine, rent and service averages only weight strictly positive prices.
+
+    Args:
+        df_base (pd.DataFrame): Cleaned, FX-independent frame.
+        rates (array-like): VND per USD rates to evaluate.
+        group_col (str): Column to break the results down by.
+        chunk_elements (int): Maximum rates x contracts cells per chunk.
+
+    Returns:
+        pd.DataFrame: One row per (rate, group) plus the portfolio rows labeled
+            TOTAL_GROUP_LABEL, with 'rental_avg', 'service_avg', 'total_avg',
+            'org_total_avg' (at the signed rates), 'total_vs_org_pct',
+            'area_share_below_org' (share of area now paying less USD than signed)
+            and 'rate_vs_org_fx_pct'.
+    """
+    rates = np.asarray(rates, dtype=np.float64)
+    group_values = df_base[group_col]
+    if isinstance(group_values.dtype, pd.CategoricalDtype):
+        group_keys = group_values.array.remove_unused_categories()
+    else:
+        group_keys = pd.Categorical(group_values.astype(str))
+    group_codes = np.asarray(group_keys.codes)
+    group_labels = list(group_keys.categories)
+
+    # Sort contracts by group once so every per-group sum is a contiguous reduceat
+    order = np.argsort(group_codes, kind='stable')
+    df_sorted = df_base.iloc[order]
+    sorted_codes = group_codes[order]
+    group_starts = np.searchsorted(sorted_codes, np.arange(len(group_labels)))
+
+    sqr = df_sorted['sqr'].to_numpy(dtype=np.float64)
+    org_total_usd = df_sorted['org_total_usd'].to_numpy(dtype=np.float64)
+    org_fx = df_sorted['org_fx'].to_numpy(dtype=np.float64)
+
+    # Rate-independent sums, per group then portfolio-wide (last column)
+    def with_total(group_sums):
+        return np.concatenate([group_sums, group_sums.sum(axis=-1, keepdims=True)], axis=-1)
+
+    area = with_total(np.add.reduceat(sqr, group_starts))
+    org_total_area_sum = with_total(np.add.reduceat(sqr * org_total_usd, group_starts))
+    org_fx_area_sum = with_total(np.add.reduceat(sqr * org_fx, group_starts))
+
+    sums = {name: np.empty((len(rates), len(group_labels) + 1))
+            for name in ('rental_num', 'rental_den', 'service_num', 'service_den', 'total_num', 'below_org_area')}
+    chunk_rates = max(1, int(chunk_elements // max(len(df_sorted), 1)))
+    for chunk_start in range(0, len(rates), chunk_rates):
+        chunk = slice(chunk_start, chunk_start + chunk_rates)
+        rental_usd, service_usd = reprice_matrix(df_sorted, rates[chunk])
+        rental_weight = np.where(rental_usd > 0, sqr, 0.0)
+        service_weight = np.where(service_usd > 0, sqr, 0.0)
+        total_usd = rental_usd + service_usd
+        sums['rental_num'][chunk] = with_total(_group_sums(rental_usd * rental_weight, group_starts))
+        sums['rental_den'][chunk] = with_total(_group_sums(rental_weight, group_starts))
+        sums['service_num'][chunk] = with_total(_group_sums(service_usd * service_weight, group_starts))
+        sums['service_den'][chunk] = with_total(_group_sums(service_weight, group_starts))
+        sums['total_num'][chunk] = with_total(_group_sums(total_usd * sqr, group_starts))
+        sums['below_org_area'][chunk] = with_total(_group_sums(np.where(total_usd < org_total_usd, sqr, 0.0), group_starts))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rental_avg = np.nan_to_num(sums['rental_num'] / sums['rental_den'])
+        service_avg = np.nan_to_num(sums['service_num'] / sums['service_den'])
+        total_avg = sums['total_num'] / area
+        org_total_avg = org_total_area_sum / area
+        org_fx_avg = org_fx_area_sum / area
+        result = {
+            'rental_avg': rental_avg,
+            'service_avg': service_avg,
+            'total_avg': total_avg,
+            'org_total_avg': np.broadcast_to(org_total_avg, total_avg.shape),
+            'total_vs_org_pct': total_avg / org_total_avg - 1,
+            'area_share_below_org': sums['below_org_area'] / area,
+            'rate_vs_org_fx_pct': rates[:, None] / org_fx_avg - 1,
+        }
+
+    n_columns = len(group_labels) + 1
+    df_sensitivity = pd.DataFrame({
+        'rate': np.repeat(rates, n_columns),
+        group_col: np.tile(np.array(group_labels + [TOTAL_GROUP_LABEL], dtype=object), len(rates)),
+        **{name: values.reshape(-1) for name, values in result.items()},
+    })
+    return df_sensitivity
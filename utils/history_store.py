@@ -0,0 +1,344 @@
+"""
+Append-only history of the rent roll: one dated snapshot per day in a partitioned
+Parquet store, plus precomputed per-snapshot and monthly metrics for trend charts.
+
+Layout under the store directory (partitions are hive-style 'month=YYYY-MM'):
+
+    rows/month=2026-10/2026-10-16.parquet   per-contract rows of one snapshot
+    metrics/month=2026-10/metrics.parquet   compute_portfolio_metrics of the month's snapshots
+    monthly.parquet                         metrics of each month's last snapshot
+
+Headless usage (e.g. a daily cron job, or backfilling old exports with --date):
+
+    python -m utils.history_store --source parquet --path rent_roll.parquet --history-dir .cache/history
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from utils.metrics_engine import compute_portfolio_metrics, portfolio_metrics_to_frame
+
+DEFAULT_HISTORY_DIR = os.path.join(".cache", "history")
+# Per-contract columns kept in every snapshot, with their stored type; numbers are stored
+# as float64 so files written from float32 and float64 frames share one schema
+HISTORY_ROW_SCHEMA = pa.schema([
+    ('snapshot_date', pa.timestamp('ms')),
+    ('customer_name', pa.string()),
+    ('floor', pa.string()),
+    ('period', pa.string()),
+    ('sqr', pa.float64()),
+    ('rental_vnd', pa.float64()),
+    ('service_vnd', pa.float64()),
+    ('org_fx', pa.float64()),
+    ('org_rental_usd', pa.float64()),
+    ('org_service_usd', pa.float64()),
+    ('rental_usd', pa.float64()),
+    ('service_usd', pa.float64()),
+    ('fx_rate', pa.float64()),
+])
+# Rows are sorted by these before writing, so row-group statistics can skip floors
+ROW_SORT_COLUMNS = ['floor', 'customer_name']
+ROW_GROUP_SIZE = 32_768
+# Group keys of the stored metrics ('total' has the single group TOTAL_GROUP_LABEL)
+METRIC_SCOPES = ('total', 'by_floor', 'by_customer')
+_PARTITIONING = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+# Parquet key-value metadata entry of a month's metrics file: {snapshot date: version written}
+_VERSIONS_METADATA_KEY = b'history_versions'
+
+
+def _month_of(timestamp):
+    return f"{timestamp:%Y-%m}"
+
+
+def _time_filter(start, end, months_only=False):
+    """
+    Filter on a time range (both ends inclusive, None for open). The 'month' condition
+    prunes whole partitions / rollup row groups before any snapshot_date is compared.
+    """
+    expression = None
+    if start is not None:
+        start = pd.Timestamp(start).normalize()
+        expression = ds.field('month') >= _month_of(start)
+        if not months_only:
+            expression &= ds.field('snapshot_date') >= pa.scalar(start.to_pydatetime(), pa.timestamp('ms'))
+    if end is not None:
+        end = pd.Timestamp(end).normalize()
+        condition = ds.field('month') <= _month_of(end)
+        if not months_only:
+            condition &= ds.field('snapshot_date') <= pa.scalar(end.to_pydatetime(), pa.timestamp('ms'))
+        expression = _combine(expression, condition)
+    return expression
+
+
+def _combine(expression, condition):
+    return condition if expression is None else expression & condition
+
+
+class HistoryStore:
+    """
+    Daily rent roll snapshots and their metrics, queried with partition pruning,
+    predicate pushdown and column pruning.
+
+    Past days are never rewritten: append_snapshot only replaces the snapshot of the
+    day being appended, so the stored day is that day's last refresh. Every file is
+    written under a temporary name and moved in place with os.replace.
+    """
+
+    def __init__(self, directory=DEFAULT_HISTORY_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # snapshot date -> version last written by this process, to skip unchanged refreshes
+        self._written_versions = {}
+
+    def _rows_path(self, snapshot_date):
+        return os.path.join(self.directory, 'rows', f"month={_month_of(snapshot_date)}", f"{snapshot_date:%Y-%m-%d}.parquet")
+
+    def _metrics_path(self, month):
+        return os.path.join(self.directory, 'metrics', f"month={month}", 'metrics.parquet')
+
+    @property
+    def _monthly_path(self):
+        return os.path.join(self.directory, 'monthly.parquet')
+
+    def _write_table(self, table, path, metadata=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if metadata:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+        # Dot-prefixed, so dataset scans skip files that are still being written
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.tmp")
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+
+    def _read_month_metrics(self, month):
+        """Returns (metrics of the month's snapshots, {date string: version}), or (None, {})."""
+        try:
+            table = pq.read_table(self._metrics_path(month))
+        except FileNotFoundError:
+            return None, {}
+        versions = json.loads((table.schema.metadata or {}).get(_VERSIONS_METADATA_KEY, b'{}'))
+        return table.to_pandas(), versions
+
+    def _stored_version(self, snapshot_date):
+        """Version the snapshot of snapshot_date was written from ('' if none was given), or None."""
+        try:
+            metadata = pq.read_schema(self._metrics_path(_month_of(snapshot_date))).metadata or {}
+        except FileNotFoundError:
+            return None
+        return json.loads(metadata.get(_VERSIONS_METADATA_KEY, b'{}')).get(f"{snapshot_date:%Y-%m-%d}")
+
+    def append_snapshot(self, df_priced, fx_rate, snapshot_date=None, portfolio_metrics=None, version=None):
+        """
+        Stores df_priced as the snapshot of snapshot_date (default: today).
+
+        Args:
+            df_priced (pd.DataFrame): apply_fx_rate output.
+            fx_rate (float): The rate df_priced was priced at.
+            snapshot_date (optional): Date of the snapshot.
+            portfolio_metrics (dict, optional): compute_portfolio_metrics(df_priced),
+                if already computed.
+            version (str, optional): Identifies the content (e.g. the data version);
+                a snapshot of the same date and version is not written again.
+
+        Returns:
+            bool: False if the date already holds this version, else True.
+        """
+        snapshot_date = pd.Timestamp(snapshot_date if snapshot_date is not None else pd.Timestamp.now()).normalize()
+        month = _month_of(snapshot_date)
+        with self._lock:
+            if version is not None and self._written_versions.get(snapshot_date) == str(version):
+                return False
+            if version is not None and self._stored_version(snapshot_date) == str(version):
+                self._written_versions[snapshot_date] = str(version)
+                return False
+
+            rows = {'snapshot_date': pd.Series(snapshot_date, index=df_priced.index), 'fx_rate': float(fx_rate)}
+            for field in HISTORY_ROW_SCHEMA:
+                if field.name in rows:
+                    continue
+                # Columns the source does not have are stored as nulls, so every file shares the schema
+                values = df_priced[field.name] if field.name in df_priced.columns else pd.Series(None, index=df_priced.index)
+                rows[field.name] = values.astype(str) if pa.types.is_string(field.type) else values.astype('float64')
+            df_rows = pd.DataFrame(rows).sort_values(ROW_SORT_COLUMNS, kind='stable')
+            self._write_table(pa.Table.from_pandas(df_rows, schema=HISTORY_ROW_SCHEMA, preserve_index=False),
+                              self._rows_path(snapshot_date))
+
+            if portfolio_metrics is None:
+                portfolio_metrics = compute_portfolio_metrics(df_priced)
+            df_metrics = portfolio_metrics_to_frame(portfolio_metrics)
+            metric_cols = [col for col in df_metrics.columns if col not in ('scope', 'group')]
+            df_metrics[metric_cols] = df_metrics[metric_cols].astype('float64')
+            df_metrics.insert(0, 'snapshot_date', snapshot_date)
+            df_metrics['fx_rate'] = float(fx_rate)
+
+            # The metrics of a month's snapshots share one file, so a trend over years opens
+            # one small file per month; only the appended month's file is rewritten
+            month_metrics, versions = self._read_month_metrics(month)
+            if month_metrics is not None:
+                df_metrics = pd.concat([month_metrics[month_metrics['snapshot_date'] != snapshot_date], df_metrics],
+                                       ignore_index=True)
+            df_metrics = df_metrics.sort_values(['snapshot_date', 'scope', 'group'], kind='stable')
+            versions[f"{snapshot_date:%Y-%m-%d}"] = '' if version is None else str(version)
+            self._write_table(pa.Table.from_pandas(df_metrics, preserve_index=False), self._metrics_path(month),
+                              metadata={_VERSIONS_METADATA_KEY: json.dumps(versions).encode('utf-8')})
+            self._update_monthly_rollup(month, df_metrics)
+            if version is not None:
+                self._written_versions[snapshot_date] = str(version)
+        return True
+
+    @staticmethod
+    def _month_rollup(month, month_metrics):
+        """The metrics of the month's last snapshot, with a 'month' column."""
+        last_date = month_metrics['snapshot_date'].max()
+        return month_metrics[month_metrics['snapshot_date'] == last_date].assign(month=month)
+
+    def _update_monthly_rollup(self, month, month_metrics):
+        """Replaces the rollup rows of one month; the other months are copied unchanged."""
+        try:
+            monthly = pq.read_table(self._monthly_path).to_pandas()
+            monthly = monthly[monthly['month'] != month]
+        except FileNotFoundError:
+            monthly = None
+        parts = [part for part in (monthly, self._month_rollup(month, month_metrics)) if part is not None and len(part)]
+        self._write_monthly(pd.concat(parts, ignore_index=True))
+
+    def _write_monthly(self, monthly):
+        monthly = monthly.sort_values(['month', 'scope', 'group'], kind='stable')
+        self._write_table(pa.Table.from_pandas(monthly, preserve_index=False), self._monthly_path)
+
+    def rebuild_monthly_rollups(self):
+        """Recomputes monthly.parquet from the stored snapshot metrics (e.g. after copying in old months)."""
+        with self._lock:
+            parts = []
+            for month in self.months():
+                month_metrics = self._read_month_metrics(month)[0]
+                if month_metrics is not None and len(month_metrics):
+                    parts.append(self._month_rollup(month, month_metrics))
+            if parts:
+                self._write_monthly(pd.concat(parts, ignore_index=True))
+
+    def months(self):
+        """Months ('YYYY-MM') that hold at least one snapshot, oldest first."""
+        try:
+            partitions = os.listdir(os.path.join(self.directory, 'rows'))
+        except FileNotFoundError:
+            return []
+        return sorted(name.split('=', 1)[1] for name in partitions if name.startswith('month='))
+
+    def snapshot_dates(self):
+        """Dates of the stored snapshots, oldest first."""
+        dates = []
+        for month in self.months():
+            partition = os.path.join(self.directory, 'rows', f"month={month}")
+            dates.extend(pd.Timestamp(name[:-len('.parquet')]) for name in sorted(os.listdir(partition))
+                         if name.endswith('.parquet') and not name.startswith('.'))
+        return dates
+
+    def version(self):
+        """Changes whenever a snapshot is written (usable as a cache key); None for an empty store."""
+        try:
+            return os.stat(self._monthly_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _scan(self, kind, expression, columns):
+        path = os.path.join(self.directory, kind)
+        if not os.path.isdir(path):
+            return None
+        dataset = ds.dataset(path, format='parquet', partitioning=_PARTITIONING)
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def query_rows(self, start=None, end=None, floors=None, customers=None, columns=None):
+        """
+        Per-contract rows of the snapshots between start and end (inclusive).
+
+        Only the partitions of the requested months are opened, floor/customer
+        conditions are pushed down to the Parquet reader and only `columns` are read
+        ('snapshot_date', 'floor' and 'customer_name' are always included).
+
+        Returns:
+            pd.DataFrame: Rows in HISTORY_ROW_SCHEMA columns; empty if none match.
+        """
+        expression = _time_filter(start, end)
+        if floors is not None:
+            expression = _combine(expression, ds.field('floor').isin([str(floor) for floor in floors]))
+        if customers is not None:
+            expression = _combine(expression, ds.field('customer_name').isin([str(name) for name in customers]))
+        if columns is not None:
+            columns = list(dict.fromkeys(['snapshot_date', 'floor', 'customer_name', *columns]))
+        rows = self._scan('rows', expression, columns)
+        if rows is None:
+            return pd.DataFrame(columns=columns or HISTORY_ROW_SCHEMA.names)
+        return rows.sort_values(['snapshot_date', *ROW_SORT_COLUMNS], kind='stable', ignore_index=True)
+
+    def query_metrics(self, scope='total', groups=None, start=None, end=None, columns=None, frequency='daily'):
+        """
+        Metrics of each snapshot (frequency='daily') or of each month's last snapshot
+        (frequency='monthly'), for one scope of compute_portfolio_metrics.
+
+        Args:
+            scope (str): One of METRIC_SCOPES.
+            groups (list, optional): Floors / customers to keep; None keeps all.
+            start, end (optional): Inclusive date range of the snapshots.
+            columns (list, optional): Metric columns to read ('snapshot_date',
+                'group' and 'fx_rate' are always included).
+            frequency (str): 'daily' or 'monthly'.
+
+        Returns:
+            pd.DataFrame: One row per snapshot and group, sorted by date.
+        """
+        if scope not in METRIC_SCOPES:
+            raise ValueError(f"Unknown metric scope: {scope}")
+        if frequency not in ('daily', 'monthly'):
+            raise ValueError(f"Unknown frequency: {frequency}")
+        expression = _combine(_time_filter(start, end, months_only=frequency == 'monthly'), ds.field('scope') == scope)
+        if groups is not None:
+            expression = expression & ds.field('group').isin([str(group) for group in groups])
+        if columns is not None:
+            columns = list(dict.fromkeys(['snapshot_date', 'group', 'fx_rate', *columns]))
+
+        if frequency == 'daily':
+            metrics = self._scan('metrics', expression, columns)
+        elif os.path.exists(self._monthly_path):
+            monthly = ds.dataset(self._monthly_path, format='parquet')
+            metrics = monthly.to_table(columns=columns and ['month', *columns], filter=expression).to_pandas()
+        else:
+            metrics = None
+        if metrics is None:
+            return pd.DataFrame(columns=columns or ['snapshot_date', 'group', 'fx_rate'])
+        return metrics.sort_values(['snapshot_date', 'group'], kind='stable', ignore_index=True)
+
+
+def org_fx_divergence(rows):
+    """
+    Adds 'fx_vs_org_pct' to query_rows output: how far the snapshot's market rate was
+    above (positive) or below the contract's signed rate (org_fx).
+    """
+    org_fx = rows['org_fx'].where(rows['org_fx'] > 0)
+    return rows.assign(fx_vs_org_pct=rows['fx_rate'] / org_fx - 1)
+
+
+def main(argv=None):
+    from utils.pipeline import add_source_arguments, load_from_arguments
+
+    parser = argparse.ArgumentParser(description="Append a dated rent roll snapshot to the history store.")
+    add_source_arguments(parser)
+    parser.add_argument('--history-dir', default=DEFAULT_HISTORY_DIR)
+    parser.add_argument('--date', help="Snapshot date, YYYY-MM-DD (default: today).")
+    args = parser.parse_args(argv)
+
+    df_priced, fx_rate = load_from_arguments(args)
+    history_store = HistoryStore(args.history_dir)
+    history_store.append_snapshot(df_priced, fx_rate, snapshot_date=args.date)
+    print(f"{len(df_priced):,} contracts at {fx_rate:,.0f} VND/USD -> {args.history_dir} "
+          f"({len(history_store.snapshot_dates())} snapshot(s))", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
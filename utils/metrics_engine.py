@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+
+# Area-weighted percentiles reported for rent and service prices
+METRIC_PERCENTILES = (0.25, 0.5, 0.75)
+PRICE_METRIC_COLS = {'rental': 'rental_usd', 'service': 'service_usd'}
+TOTAL_GROUP_LABEL = 'Tổng'
+# Display names of the metric table columns (dashboard breakdown and exported summaries)
+METRIC_COLUMN_LABELS = {
+    'contracts': 'Số HĐ',
+    'area': 'Diện tích (m²)',
+    'rental_min': 'Giá thuê thấp nhất',
+    'rental_avg': 'Giá thuê TB',
+    'rental_p50': 'Giá thuê trung vị',
+    'rental_max': 'Giá thuê cao nhất',
+    'service_min': 'Phí DV thấp nhất',
+    'service_avg': 'Phí DV TB',
+    'service_p50': 'Phí DV trung vị',
+    'service_max': 'Phí DV cao nhất',
+}
+
+
+def _prepare_metric_inputs(df_input):
+    """
+    Builds the per-row inputs of every metric in one pass.
+
+    As in the original headline metrics, maxima use every row while minima and
+    weighted averages only use strictly positive prices.
+    """
+    sqr = df_input['sqr'].to_numpy(dtype='float64')
+    inputs = {'area': sqr, 'contracts': np.ones(len(df_input))}
+    for metric, col in PRICE_METRIC_COLS.items():
+        price = df_input[col].to_numpy(dtype='float64')
+        positive_price = np.where(price > 0, price, np.nan)
+        weight = np.where(np.isnan(positive_price) | np.isnan(sqr), np.nan, sqr)
+        inputs[f'{metric}_max'] = price
+        inputs[f'{metric}_min'] = positive_price
+        inputs[f'{metric}_wsum'] = positive_price * weight
+        inputs[f'{metric}_wden'] = weight
+    return pd.DataFrame(inputs, index=df_input.index)
+
+
+def _weighted_percentiles(values, weights, group_codes, n_groups):
+    """Area-weighted percentiles per group, vectorized over all groups at once."""
+    valid = ~(np.isnan(values) | np.isnan(weights))
+    values, weights, group_codes = values[valid], weights[valid], group_codes[valid]
+    result = np.full((n_groups, len(METRIC_PERCENTILES)), np.nan)
+    if not len(values):
+        return result
+
+    order = np.lexsort((values, group_codes))
+    values, weights, group_codes = values[order], weights[order], group_codes[order]
+    cum_weights = np.cumsum(weights)
+    group_starts = np.searchsorted(group_codes, np.arange(n_groups), side='left')
+    group_ends = np.searchsorted(group_codes, np.arange(n_groups), side='right')
+    has_rows = group_ends > group_starts
+    weight_before = np.where(group_starts > 0, cum_weights[np.maximum(group_starts - 1, 0)], 0.0)
+    group_totals = np.where(has_rows, cum_weights[np.maximum(group_ends - 1, 0)] - weight_before, 0.0)
+
+    for q_idx, q in enumerate(METRIC_PERCENTILES):
+        # First row of each group whose cumulative weight share reaches q
+        targets = weight_before + q * group_totals
+        positions = np.searchsorted(cum_weights, targets, side='left')
+        positions = np.clip(positions, group_starts, np.maximum(group_ends - 1, group_starts))
+        ok = has_rows & (group_totals > 0)
+        result[ok, q_idx] = values[positions[ok]]
+    return result
+
+
+def compute_metrics_table(df_input, group_col=None, percentiles=True):
+    """
+    Computes the price metrics for each group of df_input in a single grouped aggregation.
+
+    Args:
+        df_input (pd.DataFrame): Frame with 'sqr', 'rental_usd' and 'service_usd'.
+        group_col (str, optional): Column to group by; None gives a single total row.
+        percentiles (bool): False skips the percentile columns (the costliest part).
+
+    Returns:
+        pd.DataFrame: One row per group with 'contracts', 'area' and, for rental and
+            service, '<metric>_max', '<metric>_min', '<metric>_avg' (area-weighted)
+            '<metric>_p25' / '_p50' / '_p75' (area-weighted percentiles) and
+            '<metric>_weight' (the area the average is weighted over).
+    """
+    metric_inputs = _prepare_metric_inputs(df_input)
+    if group_col is None:
+        group_keys = pd.Categorical(np.zeros(len(df_input), dtype='int8'), categories=[0])
+        group_labels = pd.Index([TOTAL_GROUP_LABEL])
+    else:
+        group_values = df_input[group_col]
+        if isinstance(group_values.dtype, pd.CategoricalDtype):
+            group_keys = group_values.array.remove_unused_categories()
+        else:
+            group_keys = pd.Categorical(group_values.astype(str))
+        group_labels = pd.Index(group_keys.categories, name=group_col)
+    group_codes = np.asarray(group_keys.codes)
+
+    aggregations = {'contracts': 'sum', 'area': 'sum'}
+    for metric in PRICE_METRIC_COLS:
+        aggregations.update({f'{metric}_max': 'max', f'{metric}_min': 'min',
+                             f'{metric}_wsum': 'sum', f'{metric}_wden': 'sum'})
+    grouped = metric_inputs.groupby(group_codes, sort=True).agg(aggregations)
+    grouped = grouped.reindex(np.arange(len(group_labels)))
+    grouped.index = group_labels
+
+    for metric in PRICE_METRIC_COLS:
+        weight_den = grouped.pop(f'{metric}_wden')
+        weight_sum = grouped.pop(f'{metric}_wsum')
+        grouped[f'{metric}_avg'] = (weight_sum / weight_den.replace(0, np.nan)).fillna(0)
+        grouped[f'{metric}_weight'] = weight_den.fillna(0)
+        if not percentiles:
+            continue
+        metric_percentiles = _weighted_percentiles(metric_inputs[f'{metric}_min'].to_numpy(),
+                                                   metric_inputs[f'{metric}_wden'].to_numpy(),
+                                                   group_codes, len(group_labels))
+        for q_idx, q in enumerate(METRIC_PERCENTILES):
+            grouped[f'{metric}_p{int(q * 100)}'] = metric_percentiles[:, q_idx]
+    grouped[['contracts', 'area']] = grouped[['contracts', 'area']].fillna(0)
+    return grouped
+
+
+def compute_portfolio_metrics(df_input):
+    """
+    Computes the total, per-floor and per-customer metrics of a priced frame.
+
+    Returns:
+        dict: 'total' (pd.Series), 'by_floor' and 'by_customer' (pd.DataFrame).
+    """
+    return {
+        'total': compute_metrics_table(df_input).iloc[0],
+        'by_floor': compute_metrics_table(df_input, 'floor') if 'floor' in df_input.columns else None,
+        'by_customer': compute_metrics_table(df_input, 'customer_name') if 'customer_name' in df_input.columns else None,
+    }
+
+
+def _update_group_metrics(previous_table, df_input, group_col, changed_groups):
+    """Recomputes the rows of changed_groups only; groups that no longer have rows are dropped."""
+    changed_groups = list(changed_groups)
+    if not changed_groups:
+        return previous_table
+    changed_rows = df_input[group_col].isin(changed_groups).to_numpy()
+    recomputed = compute_metrics_table(df_input[changed_rows], group_col)
+    kept = previous_table.drop(index=changed_groups, errors='ignore')
+    parts = [part for part in (kept, recomputed) if len(part)]
+    if not parts:
+        return recomputed
+    return pd.concat(parts).sort_index()
+
+
+def _total_from_groups(by_group, df_input):
+    """
+    Folds per-group metrics into the total row: sums add up, minima/maxima are the
+    extremes of the group values and averages are re-weighted by '<metric>_weight'.
+    Percentiles cannot be merged that way and are computed over all rows.
+    """
+    total = {'contracts': by_group['contracts'].sum(), 'area': by_group['area'].sum()}
+    sqr = df_input['sqr'].to_numpy(dtype='float64')
+    for metric, col in PRICE_METRIC_COLS.items():
+        weight = by_group[f'{metric}_weight'].sum()
+        total[f'{metric}_max'] = by_group[f'{metric}_max'].max()
+        total[f'{metric}_min'] = by_group[f'{metric}_min'].min()
+        total[f'{metric}_avg'] = (by_group[f'{metric}_avg'] * by_group[f'{metric}_weight']).sum() / weight if weight else 0
+        total[f'{metric}_weight'] = weight
+        price = df_input[col].to_numpy(dtype='float64')
+        positive_price = np.where(price > 0, price, np.nan)
+        percentiles = _weighted_percentiles(positive_price, sqr, np.zeros(len(price), dtype=np.intp), 1)
+        for q_idx, q in enumerate(METRIC_PERCENTILES):
+            total[f'{metric}_p{int(q * 100)}'] = percentiles[0, q_idx]
+    return pd.Series(total, name=TOTAL_GROUP_LABEL).reindex(by_group.columns)
+
+
+def update_portfolio_metrics(previous_metrics, df_input, changed_floors, changed_customers):
+    """
+    Updates compute_portfolio_metrics output after a few rows of the frame changed.
+
+    Only the floors and customers that had a row inserted, updated or deleted are
+    recomputed; the other rows of the breakdowns are reused and the total is folded
+    from the per-floor rows. The result equals compute_portfolio_metrics(df_input).
+
+    Args:
+        previous_metrics (dict): compute_portfolio_metrics output of the previous frame.
+        df_input (pd.DataFrame): The new priced frame.
+        changed_floors (iterable): Floors with a changed row (old or new value).
+        changed_customers (iterable): Customers with a changed row (old or new value).
+    """
+    if previous_metrics.get('by_floor') is None or previous_metrics.get('by_customer') is None:
+        return compute_portfolio_metrics(df_input)
+    by_floor = _update_group_metrics(previous_metrics['by_floor'], df_input, 'floor', changed_floors)
+    by_customer = _update_group_metrics(previous_metrics['by_customer'], df_input, 'customer_name', changed_customers)
+    return {
+        'total': _total_from_groups(by_floor, df_input),
+        'by_floor': by_floor,
+        'by_customer': by_customer,
+    }
+
+
+def portfolio_metrics_to_frame(metrics):
+    """Flattens compute_portfolio_metrics output into one frame with 'scope' and 'group' columns."""
+    parts = [metrics['total'].to_frame().T.assign(scope='total')]
+    for scope in ('by_floor', 'by_customer'):
+        if metrics[scope] is not None:
+            parts.append(metrics[scope].assign(scope=scope))
+    frame = pd.concat([part.rename_axis('group').reset_index() for part in parts], ignore_index=True)
+    frame['group'] = frame['group'].astype(str)
+    return frame
+
+
+def portfolio_metrics_from_frame(frame):
+    """Rebuilds compute_portfolio_metrics output from portfolio_metrics_to_frame output."""
+    metric_cols = [col for col in frame.columns if col not in ('scope', 'group')]
+    tables = {}
+    for scope, index_name in (('by_floor', 'floor'), ('by_customer', 'customer_name')):
+        rows = frame[frame['scope'] == scope]
+        tables[scope] = rows.set_index(pd.Index(rows['group'].to_numpy(), name=index_name))[metric_cols] if len(rows) else None
+    total = frame.loc[frame['scope'] == 'total', metric_cols].iloc[0].astype('float64').rename(TOTAL_GROUP_LABEL)
+    return {'total': total, **tables}
+
+
+def headline_metrics(metrics_row):
+    """
+    Returns the six headline card values from a metrics row, in the order of
+    calculate_metrics_values; missing values (e.g. no positive price) become 0.
+    """
+    values = (metrics_row['rental_max'], metrics_row['service_max'], metrics_row['rental_avg'],
+              metrics_row['rental_min'], metrics_row['service_min'], metrics_row['service_avg'])
+    return tuple(0 if pd.isna(value) else value for value in values)
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class PerfTrace:
+    """
+    Collects per-stage timings for one dashboard rerun.
+
+    scope tells a full app run ('app') from a fragment-only rerun ('fragment:<name>').
+
+    Each stage records its wall time plus any attributes the caller sets on the
+    yielded record (row counts, payload sizes, cache_hit). When disabled, stage()
+    does no timing or bookkeeping, so the instrumentation can stay in place.
+    """
+
+    def __init__(self, enabled=False, log_path=None, session_id=None, scope='app'):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.session_id = session_id
+        self.scope = scope
+        self.run_id = uuid.uuid4().hex[:12] if enabled else None
+        self.records = []
+        self.total_ms = None
+        self._stack = []
+        self._started_at = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, cached=False, **attrs):
+        """
+        Times the enclosed block as stage `name`.
+
+        Args:
+            name (str): Stage name; nested stages are recorded as 'outer/inner'.
+            cached (bool): Whether the stage is served from a cache. It is recorded as a
+                hit unless note_cache_miss() is called while the stage is running.
+            **attrs: Extra attributes to record.
+        """
+        if not self.enabled:
+            yield {}
+            return
+        stage_path = f"{self._stack[-1]['stage']}/{name}" if self._stack else name
+        record = {'stage': stage_path, **attrs}
+        if cached:
+            record['cache_hit'] = True
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+            self._stack.pop()
+            self.records.append(record)
+
+    def note_cache_miss(self):
+        """Marks the innermost cached stage as a cache miss."""
+        for record in reversed(self._stack):
+            if 'cache_hit' in record:
+                record['cache_hit'] = False
+                return
+
+    def finish(self):
+        """Closes the trace and appends it as one JSON line to log_path, if set."""
+        if not self.enabled:
+            return
+        self.total_ms = round((time.perf_counter() - self._started_at) * 1000, 3)
+        if not self.log_path:
+            return
+        line = json.dumps({
+            'ts': time.time(),
+            'run_id': self.run_id,
+            'session_id': self.session_id,
+            'scope': self.scope,
+            'total_ms': self.total_ms,
+            'stages': self.records,
+        }, ensure_ascii=False, default=str)
+        log_dir = os.path.dirname(self.log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        with _log_lock, open(self.log_path, 'a', encoding='utf-8') as log_file:
+            log_file.write(line + "\n")
+
+
+_DISABLED_TRACE = PerfTrace(enabled=False)
+
+
+def activate_trace(trace):
+    """Makes trace the current trace of this thread (one Streamlit script run); None clears it."""
+    _local.trace = trace
+    return trace
+
+
+def is_trace_active():
+    """Whether a script run on this thread has activated a trace that is still open."""
+    return getattr(_local, 'trace', None) is not None
+
+
+def current_trace():
+    """Returns the current thread's trace, or a disabled one."""
+    return getattr(_local, 'trace', None) or _DISABLED_TRACE
+
+
+def note_cache_miss():
+    """Called from inside cached functions so the running stage is recorded as a miss."""
+    trace = current_trace()
+    if trace.enabled:
+        trace.note_cache_miss()
@@ -0,0 +1,128 @@
+"""
+UI-free dashboard pipeline: source -> cleaned base frame -> FX repricing -> metrics.
+
+Nothing here imports Streamlit, Altair or AgGrid, so batch jobs, tests and worker
+processes can use it without secrets or a running server. Headless usage:
+
+    python -m utils.pipeline --source parquet --path rent_roll.parquet --fx-rate 25450
+"""
+import argparse
+import json
+import sys
+import time
+
+from utils.data_loader import apply_fx_rate, clean_base_data
+from utils.data_sources import create_data_source
+from utils.floor_layout import DEFAULT_FLOOR_LAYOUT, FloorLayout
+from utils.fx_provider import DEFAULT_FX_URL, FxRateProvider
+from utils.metrics_engine import compute_metrics_table, headline_metrics
+
+# Used when the VCB rate cannot be fetched
+FALLBACK_FX_RATE = 25450.0
+# Labels of headline_metrics values, in its order
+HEADLINE_METRIC_LABELS = ('rental_max', 'service_max', 'rental_avg', 'rental_min', 'service_min', 'service_avg')
+
+
+def make_data_version(data_fingerprint, fx_rate):
+    """Cache key for a (sheet content, FX rate) pair; the part before '@' is the content fingerprint."""
+    return f"{data_fingerprint}@{float(fx_rate):g}"
+
+
+def validate_fx_rate(fx_rate):
+    """Returns an error message if fx_rate cannot be applied, else None."""
+    if fx_rate is None or fx_rate <= 0:
+        return "Lỗi: Tỷ giá không hợp lệ. Vui lòng cung cấp một tỷ giá dương."
+    return None
+
+
+def resolve_fx_rate(fx_provider, wait_seconds=0, currency_code='USD', field='sell'):
+    """
+    Returns the provider's last known rate without waiting on the network.
+
+    Only when no rate was ever fetched (cold start) does it wait up to wait_seconds
+    for the background refresh; it does not wait again after a failed fetch.
+
+    Returns:
+        tuple: (fx_rate, fx_time, fx_age_seconds, error); the first three are None
+               when no rate is known, error is the provider's last error message.
+    """
+    fx_rate, fx_time, fx_age_seconds = fx_provider.get_rate(currency_code, field)
+    if fx_rate is None and wait_seconds and not fx_provider.last_error and fx_provider.wait_for_refresh(wait_seconds):
+        fx_rate, fx_time, fx_age_seconds = fx_provider.get_rate(currency_code, field)
+    return fx_rate, fx_time, fx_age_seconds, fx_provider.last_error if fx_rate is None else None
+
+
+def load_priced_data(data_source, fx_rate, floor_layout=DEFAULT_FLOOR_LAYOUT):
+    """
+    Reads, cleans and reprices a data source in one go (no caching).
+
+    Returns:
+        tuple: (df_priced, message); df_priced is None on error.
+    """
+    fx_error = validate_fx_rate(fx_rate)
+    if fx_error:
+        return None, fx_error
+    df_base, status_message = clean_base_data(data_source.read(), floor_layout)
+    if df_base is None:
+        return None, status_message
+    return apply_fx_rate(df_base, float(fx_rate)), status_message
+
+
+def add_source_arguments(parser):
+    """Adds the data source and FX rate options shared by the headless commands."""
+    parser.add_argument('--source', default='parquet', choices=['parquet', 'sqlite'], help="Data source type.")
+    parser.add_argument('--path', required=True, help="Parquet file or SQLite database.")
+    parser.add_argument('--table', help="SQLite table (default: rent_roll).")
+    parser.add_argument('--fx-rate', type=float, help="VND per USD; defaults to the current VCB sell rate.")
+    parser.add_argument('--fx-url', default=DEFAULT_FX_URL, help="VCB rate endpoint used when --fx-rate is not given.")
+    parser.add_argument('--floor-layout', help="JSON file with the building's floor order (default: DEFAULT_FLOOR_ORDER).")
+
+
+def load_from_arguments(args):
+    """
+    Resolves the FX rate and loads the priced frame for parsed add_source_arguments options.
+
+    Exits with the error message if the rate or the data cannot be loaded.
+
+    Returns:
+        tuple: (df_priced, fx_rate).
+    """
+    fx_rate = args.fx_rate
+    if fx_rate is None:
+        fx_provider = FxRateProvider(args.fx_url)
+        if not fx_provider.refresh():
+            sys.exit(fx_provider.last_error)
+        fx_rate = fx_provider.get_rate('USD', 'sell')[0]
+
+    df_priced, status_message = load_priced_data(create_data_source(args.source, args.path, table_name=args.table),
+                                                 fx_rate, FloorLayout.from_config(args.floor_layout))
+    if df_priced is None:
+        sys.exit(status_message)
+    return df_priced, fx_rate
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the dashboard's headline price metrics for a rate.")
+    add_source_arguments(parser)
+    parser.add_argument('--json', action='store_true', help="Print the metrics as one JSON object.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    df_priced, fx_rate = load_from_arguments(args)
+    total = compute_metrics_table(df_priced).iloc[0]
+    headline = dict(zip(HEADLINE_METRIC_LABELS, map(float, headline_metrics(total))))
+    report = {'fx_rate': float(fx_rate), 'contracts': int(total['contracts']), 'area': float(total['area']), **headline}
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"Tỷ giá: {fx_rate:,.0f} VND/USD — {report['contracts']:,} HĐ, {report['area']:,.0f} m²")
+        print(f"Giá thuê (USD): cao nhất ${headline['rental_max']:,.2f}, TB ${headline['rental_avg']:,.2f}, "
+              f"thấp nhất ${headline['rental_min']:,.2f}")
+        print(f"Phí DV (USD): cao nhất ${headline['service_max']:,.2f}, TB ${headline['service_avg']:,.2f}, "
+              f"thấp nhất ${headline['service_min']:,.2f}")
+    print(f"{time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,33 +1,233 @@
+import threading
+from collections import OrderedDict
 import pandas as pd
-import altair as alt
 import numpy as np
+from utils.data_loader import compute_data_fingerprint
+from utils.floor_layout import floors_in_rank_order
+from utils.metrics_engine import TOTAL_GROUP_LABEL, compute_metrics_table, headline_metrics
+# Altair is imported inside the chart builders, so the data preparation and metric
+# helpers here can be used headless without loading it
 def calculate_metrics_values(df_input):
-    """Calculates key metrics from the dataframe."""
-    if df_input.empty:
-        return 0, 0, 0, 0
-
-    highest_rental_price = df_input['rental_usd'].max() if 'rental_usd' in df_input.columns else 0
-    lowest_rental_price = df_input[df_input['rental_usd'] > 0]['rental_usd'].min() if 'rental_usd' in df_input.columns else 0
-    highest_service_price = df_input['service_usd'].max() if 'service_usd' in df_input.columns else 0
-    lowest_service_price = df_input[df_input['service_usd'] > 0]['service_usd'].min() if 'service_usd' in df_input.columns else 0
-
-    # Weighted average price: sumproduct(sqr*rental_usd)/sum(sqr)
-    avg_rental = 0
-    if 'sqr' in df_input.columns and 'rental_usd' in df_input.columns:
-        temp_df_for_avg = df_input.dropna(subset=['sqr', 'rental_usd'])
-        temp_df_for_avg = temp_df_for_avg[temp_df_for_avg['rental_usd'] > 0] 
-        if not temp_df_for_avg.empty and temp_df_for_avg['sqr'].sum() != 0:
-            avg_rental = (temp_df_for_avg['sqr'] * temp_df_for_avg['rental_usd']).sum() / temp_df_for_avg['sqr'].sum()
-
-    avg_service = 0
-    if 'sqr' in df_input.columns and 'service_usd' in df_input.columns:
-        temp_df_for_avg = df_input.dropna(subset=['sqr', 'service_usd'])
-        temp_df_for_avg = temp_df_for_avg[temp_df_for_avg['service_usd'] > 0]
-        if not temp_df_for_avg.empty and temp_df_for_avg['sqr'].sum() != 0:
-            avg_service = (temp_df_for_avg['sqr'] * temp_df_for_avg['service_usd']).sum() / temp_df_for_avg['sqr'].sum()
-            
-
-    return highest_rental_price,highest_service_price, avg_rental, lowest_rental_price,lowest_service_price, avg_service
+    """
+    Calculates the six headline metrics from the dataframe.
+
+    Returns:
+        tuple: (highest rental, highest service, weighted avg rental,
+                lowest rental, lowest service, weighted avg service) in USD.
+    """
+    if df_input.empty or not all(col in df_input.columns for col in ['sqr', 'rental_usd', 'service_usd']):
+        return 0, 0, 0, 0, 0, 0
+    return headline_metrics(compute_metrics_table(df_input).iloc[0])
+
+
+_BASE_CHART_CACHE = OrderedDict()
+_BASE_CHART_CACHE_MAX_ENTRIES = 8
+_BASE_CHART_CACHE_LOCK = threading.Lock()
+_HIGHLIGHT_PARAM_NAME = "highlight"
+_TOOLTIP_SEPARATOR = '__________________'
+_OFFSET_DECIMALS = 5
+# Fields shipped per contract in the detailed chart, with the decimals they are rounded to
+_DETAIL_CHART_FIELDS = {
+    'sqr': 2,
+    'rental_usd': 2,
+    'service_usd': 2,
+    'total_usd': 2,
+    'org_rental_usd': 2,
+    'org_service_usd': 2,
+    'org_fx': 0,
+}
+# Above this many contracts the chart ships one bar per floor x rent band instead of per contract
+CHART_AGGREGATE_ROW_THRESHOLD = 5000
+PRICE_BAND_WIDTH_USD = 5
+
+
+def _stack_offsets(chart_data):
+    """
+    Adds 'x_start'/'x_end': each row's stacked span of its floor's total area, in [0, 1].
+
+    Rows are stacked by descending rent within the floor, like Vega-Lite's default stack
+    order for the rent color field, so the browser does not have to stack the bars.
+    """
+    chart_data = chart_data.sort_values(['floor_display', 'rental_usd'], ascending=[True, False], kind='stable')
+    floor_totals = chart_data.groupby('floor_display', sort=False)['sqr'].transform('sum').replace(0, np.nan)
+    floor_shares = (chart_data['sqr'] / floor_totals).fillna(0)
+    x_end = floor_shares.groupby(chart_data['floor_display'], sort=False).cumsum()
+    chart_data['x_start'] = (x_end - floor_shares).round(_OFFSET_DECIMALS)
+    chart_data['x_end'] = x_end.round(_OFFSET_DECIMALS)
+    return chart_data.reset_index(drop=True)
+
+
+def _prepare_chart_data(df_input):
+    """
+    Builds the per-contract chart frame with only the encoded and tooltip fields.
+
+    Values are rounded to the decimals they are stored with, so float32 columns do not
+    serialize as long float64 reprs.
+    """
+    chart_data = pd.DataFrame({
+        'customer_name': df_input['customer_name'].astype(str),
+        'floor_display': df_input['floor'].astype(str),
+        **{col: df_input[col].to_numpy(dtype=np.float64).round(decimals) for col, decimals in _DETAIL_CHART_FIELDS.items()},
+    })
+    return _stack_offsets(chart_data)
+
+
+def _prepare_aggregated_chart_data(df_input, selected_mask):
+    """
+    Aggregates contracts into one bar per floor x rent band x (selected or not).
+
+    Bands are PRICE_BAND_WIDTH_USD wide; prices are area-weighted averages of the band.
+    """
+    rental_usd = df_input['rental_usd'].to_numpy(dtype=np.float64)
+    sqr = df_input['sqr'].to_numpy(dtype=np.float64)
+    grouped_input = pd.DataFrame({
+        'floor_display': df_input['floor'].astype(str).to_numpy(),
+        'band_start': np.floor(rental_usd / PRICE_BAND_WIDTH_USD) * PRICE_BAND_WIDTH_USD,
+        'selected': selected_mask,
+        'sqr': sqr,
+        'rental_area': rental_usd * sqr,
+        'service_area': df_input['service_usd'].to_numpy(dtype=np.float64) * sqr,
+        'total_area': df_input['total_usd'].to_numpy(dtype=np.float64) * sqr,
+    })
+    chart_data = grouped_input.groupby(['floor_display', 'band_start', 'selected'], sort=False).agg(
+        contracts=('sqr', 'size'), sqr=('sqr', 'sum'), rental_area=('rental_area', 'sum'),
+        service_area=('service_area', 'sum'), total_area=('total_area', 'sum')).reset_index()
+
+    area = chart_data['sqr'].replace(0, np.nan)
+    for price_col in ('rental', 'service', 'total'):
+        chart_data[f'{price_col}_usd'] = (chart_data.pop(f'{price_col}_area') / area).fillna(0).round(2)
+    chart_data['sqr'] = chart_data['sqr'].round(2)
+    chart_data['band'] = [f"${start:,.0f} – ${start + PRICE_BAND_WIDTH_USD:,.0f}" for start in chart_data['band_start']]
+    chart_data = chart_data.sort_values('selected', ascending=False, kind='stable')
+    return _stack_offsets(chart_data.drop(columns='band_start'))
+
+
+def _build_color_condition(chart_data):
+    """Builds the rental price color scale from the min/avg/max positive rents."""
+    import altair as alt
+
+    positive_rents = pd.to_numeric(chart_data['rental_usd'], errors='coerce')
+    positive_rents = positive_rents[positive_rents > 0]
+    if positive_rents.empty:
+        return alt.value('lightgray')
+
+    min_rent = positive_rents.min()
+    avg_rent = positive_rents.mean()
+    max_rent = positive_rents.max()
+
+    color_domain = [0, min_rent, avg_rent, max_rent]
+    color_domain = sorted(list(set(round(val, 2) for val in color_domain if pd.notna(val))))
+    if len(color_domain) < 2:
+        color_domain = [0, max_rent if pd.notna(max_rent) and max_rent > 0 else 1]
+
+    return alt.Color('rental_usd:Q',
+                     scale=alt.Scale(
+                         domain=color_domain,
+                         range=['#0a0a0a', '#3399ff', '#ffff00', '#00ff00'][:len(color_domain)]
+                     ),
+                     legend=alt.Legend(title='Giá Thuê (USD)', orient='right', format='$,.2f'))
+
+
+def _build_base_chart(df_input, floor_layout):
+    """Builds the filter-independent part of the chart: data, position, color and tooltips."""
+    import altair as alt
+
+    chart_data = _prepare_chart_data(df_input)
+    highlight_selection = alt.selection_point(name=_HIGHLIGHT_PARAM_NAME, on="pointerover", empty=False)
+
+    return alt.Chart(chart_data).transform_calculate(
+        # The tooltip separator lives once in the spec instead of on every row
+        **{'-': repr(_TOOLTIP_SEPARATOR)}
+    ).mark_bar(stroke='black', cursor="pointer").encode(
+        x=alt.X('x_start:Q', axis=None, scale=alt.Scale(domain=[0, 1])),
+        x2='x_end:Q',
+        y=alt.Y("floor_display:N", sort=floors_in_rank_order(df_input, floor_layout), title="Tầng", axis=alt.Axis(labelFontSize=12)),
+        color=_build_color_condition(chart_data),
+        tooltip=[
+            alt.Tooltip("customer_name:N", title="Khách thuê"),
+            alt.Tooltip("floor_display:O", title="Tầng"),
+            alt.Tooltip("sqr:Q", title="Diện tích (m²)", format=',.0f'),
+            alt.Tooltip("rental_usd:Q", title="Giá thuê (USD)", format='$,.2f'),
+            alt.Tooltip("service_usd:Q", title="Phí dịch vụ (USD)", format='$,.2f'),
+            alt.Tooltip("total_usd:Q", title="Tổng Cộng (USD)", format='$,.2f'),
+            alt.Tooltip("-:N", title=None),
+            alt.Tooltip("org_rental_usd:Q", title="Giá thuê (USD) ký HĐ", format='$,.2f'),
+            alt.Tooltip("org_service_usd:Q", title="Phí dịch vụ (USD) ký HĐ", format='$,.2f'),
+            alt.Tooltip("org_fx:Q", title="Tỷ giá ký HĐ", format=',.0f'),
+            # alt.Tooltip("period:O", title="Kỳ hạn")
+        ],
+        strokeOpacity=alt.value(1)
+    ).properties(
+        title='Phân Bổ Diện Tích Thuê theo Tầng (Chi Tiết)',
+        width=alt.Step(40),
+        height=700
+    ).add_params(highlight_selection)
+
+
+def _build_aggregated_chart(df_input, selected_mask, floor_layout):
+    """Builds the floor x rent band chart; the selection is baked into the 'selected' field."""
+    import altair as alt
+
+    chart_data = _prepare_aggregated_chart_data(df_input, selected_mask)
+    highlight_selection = alt.selection_point(name=_HIGHLIGHT_PARAM_NAME, on="pointerover", empty=False)
+
+    return alt.Chart(chart_data).mark_bar(stroke='black', cursor="pointer").encode(
+        x=alt.X('x_start:Q', axis=None, scale=alt.Scale(domain=[0, 1])),
+        x2='x_end:Q',
+        y=alt.Y("floor_display:N", sort=floors_in_rank_order(df_input, floor_layout), title="Tầng", axis=alt.Axis(labelFontSize=12)),
+        # Color scale from the per-contract rents, so both modes share the same colors
+        color=_build_color_condition(df_input),
+        tooltip=[
+            alt.Tooltip("floor_display:O", title="Tầng"),
+            alt.Tooltip("band:N", title="Khoảng giá thuê"),
+            alt.Tooltip("contracts:Q", title="Số HĐ", format=',.0f'),
+            alt.Tooltip("sqr:Q", title="Diện tích (m²)", format=',.0f'),
+            alt.Tooltip("rental_usd:Q", title="Giá thuê TB (USD)", format='$,.2f'),
+            alt.Tooltip("service_usd:Q", title="Phí dịch vụ TB (USD)", format='$,.2f'),
+            alt.Tooltip("total_usd:Q", title="Tổng Cộng TB (USD)", format='$,.2f'),
+        ],
+        strokeOpacity=alt.value(1)
+    ).properties(
+        title='Phân Bổ Diện Tích Thuê theo Tầng (Gộp theo khoảng giá)',
+        width=alt.Step(40),
+        height=700
+    ).add_params(highlight_selection)
+
+
+def _get_base_chart(df_input, floor_layout, data_version):
+    """Returns the memoized base chart for a data version, building it on a miss."""
+    if data_version is None:
+        data_version = compute_data_fingerprint(df_input)
+    cache_key = (data_version, tuple(floor_layout.floor_order))
+
+    with _BASE_CHART_CACHE_LOCK:
+        base_chart = _BASE_CHART_CACHE.get(cache_key)
+        if base_chart is not None:
+            _BASE_CHART_CACHE.move_to_end(cache_key)
+            return base_chart
+
+    base_chart = _build_base_chart(df_input, floor_layout)
+    with _BASE_CHART_CACHE_LOCK:
+        _BASE_CHART_CACHE[cache_key] = base_chart
+        while len(_BASE_CHART_CACHE) > _BASE_CHART_CACHE_MAX_ENTRIES:
+            _BASE_CHART_CACHE.popitem(last=False)
+    return base_chart
+
+
+def resolve_chart_mode(df_input, chart_mode='auto'):
+    """Resolves 'auto' to 'aggregated' above CHART_AGGREGATE_ROW_THRESHOLD contracts, else 'detail'."""
+    if chart_mode == 'auto':
+        return 'aggregated' if len(df_input) > CHART_AGGREGATE_ROW_THRESHOLD else 'detail'
+    return chart_mode
+
+
+def _selection_mask(df_input, customers_to_match, floors_to_match, is_all_customers, is_all_floors):
+    selected_mask = np.ones(len(df_input), dtype=bool)
+    if not is_all_customers:
+        selected_mask &= df_input['customer_name'].isin(customers_to_match).to_numpy()
+    if not is_all_floors:
+        selected_mask &= df_input['floor'].astype(str).isin(floors_to_match).to_numpy()
+    return selected_mask
 
 
 # Function to create the new Altair chart
@@ -36,9 +236,23 @@ def create_advanced_price_chart(df_input,
                                 floors_to_match_in_predicate, 
                                 is_all_customers_filter_view, 
                                 is_all_floors_filter_view,
-                                CUSTOM_FLOOR_SORT_ORDER
+                                floor_layout,
+                                data_version=None,
+                                chart_mode='auto'
                                 ):
-    """Creates an advanced Altair chart for rental prices by floor with refined interactivity."""
+    """
+    Creates an advanced Altair chart for rental prices by floor with refined interactivity.
+
+    The spec only carries the encoded and tooltip fields, with the stacked x-offsets
+    computed here. In 'detail' mode there is one bar per contract; the filter-independent
+    base chart is memoized per data_version (a content fingerprint is computed when it
+    is not given) and filter changes only re-encode the opacity and stroke channels.
+    In 'aggregated' mode there is one bar per floor x rent band, split by whether it
+    matches the filters. 'auto' picks the mode with resolve_chart_mode(). The floor
+    axis follows floor_layout's ranks (the stored floor_rank column when present).
+    """
+    import altair as alt
+
     if df_input.empty or not all(col in df_input.columns for col in ['customer_name', 'floor', 'sqr', 'rental_usd', 'service_usd','total_usd']):
         # Return an empty chart with labels if no data or required columns missing
         empty_chart_df = pd.DataFrame({'floor_display': [], 'normalized_sqr': [], 'customer_name': []})
@@ -47,110 +261,145 @@ def create_advanced_price_chart(df_input,
             x=alt.X('sum(normalized_sqr):Q', title='Diện tích chuẩn hóa')
         ).properties(title='Phân Bổ Diện Tích Thuê theo Tầng (Chi Tiết)')
 
-    chart_data = df_input.copy()
-    chart_data['floor_display'] = chart_data['floor'].astype(str)
-    chart_data['sqr_display'] = chart_data['sqr'] 
-    
-    # Calculate normalized_sqr
-    floor_totals = chart_data.groupby('floor_display')['sqr'].sum().replace(0, np.nan) 
-    chart_data['normalized_sqr'] = chart_data.apply(
-        lambda x: (x['sqr'] / floor_totals[x['floor_display']]) if pd.notna(floor_totals[x['floor_display']]) else 0,
-        axis=1
-    ).fillna(0)
-
     # --- Define selections and predicates ---
-    highlight_selection = alt.selection_point(name="highlight", on="pointerover", empty=False)
-    
-    # Predicates for filtering based on sidebar selections
-    customer_select_predicate = alt.FieldOneOfPredicate(field='customer_name', oneOf=customers_to_match_in_predicate)
-    floor_select_predicate = alt.FieldOneOfPredicate(field='floor_display', oneOf=floors_to_match_in_predicate)
-
-    # --- Logic for opacity and highlighting based on filters ---
-    dim_opacity_value = alt.value(0.2)
-    full_opacity_value = alt.value(1.0)
+    highlight_selection = alt.selection_point(name=_HIGHLIGHT_PARAM_NAME, on="pointerover", empty=False)
 
     # Determine which specific filters are active
     specific_customer_filter_active = not is_all_customers_filter_view
     specific_floor_filter_active = not is_all_floors_filter_view
 
-    # Build the combined predicate for matching rows if specific filters are active
-    combined_filter_predicate = None
-    if specific_customer_filter_active and specific_floor_filter_active:
-        combined_filter_predicate = customer_select_predicate & floor_select_predicate
-    elif specific_customer_filter_active:
-        combined_filter_predicate = customer_select_predicate
-    elif specific_floor_filter_active:
-        combined_filter_predicate = floor_select_predicate
+    if resolve_chart_mode(df_input, chart_mode) == 'aggregated':
+        selected_mask = _selection_mask(df_input, customers_to_match_in_predicate, floors_to_match_in_predicate,
+                                        is_all_customers_filter_view, is_all_floors_filter_view)
+        base_chart = _build_aggregated_chart(df_input, selected_mask, floor_layout)
+        combined_filter_predicate = None
+        if specific_customer_filter_active or specific_floor_filter_active:
+            combined_filter_predicate = alt.FieldEqualPredicate(field='selected', equal=True)
+    else:
+        base_chart = _get_base_chart(df_input, floor_layout, data_version)
+
+        # Predicates for filtering based on sidebar selections
+        customer_select_predicate = alt.FieldOneOfPredicate(field='customer_name', oneOf=customers_to_match_in_predicate)
+        floor_select_predicate = alt.FieldOneOfPredicate(field='floor_display', oneOf=floors_to_match_in_predicate)
+
+        # Build the combined predicate for matching rows if specific filters are active
+        combined_filter_predicate = None
+        if specific_customer_filter_active and specific_floor_filter_active:
+            combined_filter_predicate = customer_select_predicate & floor_select_predicate
+        elif specific_customer_filter_active:
+            combined_filter_predicate = customer_select_predicate
+        elif specific_floor_filter_active:
+            combined_filter_predicate = floor_select_predicate
+
+    # --- Logic for opacity and highlighting based on filters ---
+    dim_opacity_value = alt.value(0.2)
+    full_opacity_value = alt.value(1.0)
 
     if combined_filter_predicate is None: # No specific filters active (all customers AND all floors)
         op_condition = full_opacity_value
         stroke_color_non_hover = alt.value("#696969") 
         stroke_width_non_hover = alt.value(0)       
     else: # At least one specific filter is active
-        # --- CORRECTED op_condition definition ---
         op_condition = alt.when(combined_filter_predicate).then(full_opacity_value).otherwise(dim_opacity_value)
-        # --- END OF CORRECTION ---
         stroke_color_non_hover = alt.when(combined_filter_predicate).then(alt.value('#000000')).otherwise(alt.value('#BBBBBB'))
         stroke_width_non_hover = alt.when(combined_filter_predicate).then(alt.value(1)).otherwise(alt.value(0.5))
 
     # Layer hover effect on top
     stroke_color_condition = alt.when(highlight_selection).then(alt.value('#FF0000')).otherwise(stroke_color_non_hover)
     stroke_width_condition = alt.when(highlight_selection).then(alt.value(3)).otherwise(stroke_width_non_hover)
-        
-    # Define color condition based on 'rental_usd'
-    df_metrics = chart_data[chart_data['rental_usd'] > 0].copy() 
-    if not df_metrics.empty:
-        df_metrics['rental_usd_numeric'] = pd.to_numeric(df_metrics['rental_usd'], errors='coerce')
-        df_metrics.dropna(subset=['rental_usd_numeric'], inplace=True)
-
-        if not df_metrics.empty:
-            min_rent = df_metrics['rental_usd_numeric'].min()
-            avg_rent = df_metrics['rental_usd_numeric'].mean()
-            max_rent = df_metrics['rental_usd_numeric'].max()
-            
-            color_domain = [0, min_rent, avg_rent, max_rent]
-            color_domain = sorted(list(set(round(val, 2) for val in color_domain if pd.notna(val))))
-            if len(color_domain) < 2: 
-                color_domain = [0, max_rent if pd.notna(max_rent) and max_rent > 0 else 1]
-
-            color_fill_condition = alt.Color('rental_usd:Q',
-                                        scale=alt.Scale(
-                                            domain=color_domain,
-                                            range=['#0a0a0a', '#3399ff', '#ffff00', '#00ff00'][:len(color_domain)] 
-                                        ),
-                                        legend=alt.Legend(title='Giá Thuê (USD)', orient='right', format='$,.2f'))
-        else: 
-            color_fill_condition = alt.value('lightgray') 
-    else: 
-        color_fill_condition = alt.value('lightgray')
-
-    # Create Altair bar chart
-    chart_data['-'] = '__________________'
-    chart = alt.Chart(chart_data).mark_bar(stroke='black', cursor="pointer").encode(
-        x=alt.X('normalized_sqr:Q', stack=True, axis=None, scale=alt.Scale(domain=[0, 1])),
-        y=alt.Y("floor_display:N", sort=CUSTOM_FLOOR_SORT_ORDER, title="Tầng", axis=alt.Axis(labelFontSize=12)),
-        color=color_fill_condition,
+
+    # encode() copies only the encoding, so the cached data and base encodings are shared
+    return base_chart.encode(
+        fillOpacity=op_condition,
+        stroke=stroke_color_condition,
+        strokeWidth=stroke_width_condition
+    )
+
+
+def chart_spec_size(chart):
+    """Returns the size in bytes of the chart's serialized Vega-Lite spec (data included)."""
+    import altair as alt
+
+    with alt.data_transformers.enable('default', max_rows=None):
+        return len(chart.to_json().encode('utf-8'))
+
+
+def unpruned_chart_spec_size(df_input):
+    """
+    Returns the spec size in bytes of a bare chart of df_input with every column, which
+    is what the price chart embedded before its data was pruned to the encoded columns.
+    """
+    import altair as alt
+
+    with alt.data_transformers.enable('default', max_rows=None):
+        return len(alt.Chart(df_input).mark_bar().to_json().encode('utf-8'))
+
+
+def create_fx_sensitivity_chart(df_sensitivity, current_rate=None, group_label=None, group_col='floor'):
+    """
+    Line chart of area-weighted USD prices across FX rates, from compute_fx_sensitivity.
+
+    Args:
+        df_sensitivity (pd.DataFrame): Output of compute_fx_sensitivity.
+        current_rate (float, optional): Rate in use on the dashboard, drawn as a rule.
+        group_label (str, optional): Group to plot; defaults to the portfolio total rows.
+        group_col (str): The group_col compute_fx_sensitivity broke the results down by.
+    """
+    import altair as alt
+
+    if group_label is None:
+        group_label = TOTAL_GROUP_LABEL
+    chart_data = df_sensitivity.loc[df_sensitivity[group_col] == group_label,
+                                    ['rate', 'rental_avg', 'service_avg', 'total_avg', 'org_total_avg']]
+    chart_data = chart_data.rename(columns={
+        'rental_avg': 'Giá thuê TB',
+        'service_avg': 'Phí dịch vụ TB',
+        'total_avg': 'Tổng cộng TB',
+        'org_total_avg': 'Tổng cộng TB ký HĐ',
+    }).melt('rate', var_name='metric', value_name='usd')
+
+    lines = alt.Chart(chart_data).mark_line().encode(
+        x=alt.X('rate:Q', title='Tỷ giá (VND/USD)', axis=alt.Axis(format=',.0f'), scale=alt.Scale(zero=False)),
+        y=alt.Y('usd:Q', title='USD/m²', axis=alt.Axis(format='$,.2f')),
+        color=alt.Color('metric:N', title=None, legend=alt.Legend(orient='bottom')),
+        strokeDash=alt.condition(alt.datum.metric == 'Tổng cộng TB ký HĐ', alt.value([4, 4]), alt.value([1, 0])),
         tooltip=[
-            alt.Tooltip("customer_name:N", title="Khách thuê"),
-            alt.Tooltip("floor_display:O", title="Tầng"),
-            alt.Tooltip("sqr_display:Q", title="Diện tích (m²)", format=',.0f'),
-            alt.Tooltip("rental_usd:Q", title="Giá thuê (USD)", format='$,.2f'),
-            alt.Tooltip("service_usd:Q", title="Phí dịch vụ (USD)", format='$,.2f'),
-            alt.Tooltip("total_usd:Q", title="Tổng Cộng (USD)", format='$,.2f'),
-            alt.Tooltip("-:N", title=None),
-            alt.Tooltip("org_rental_usd:Q", title="Giá thuê (USD) ký HĐ", format='$,.2f'),
-            alt.Tooltip("org_service_usd:Q", title="Phí dịch vụ (USD) ký HĐ", format='$,.2f'),
-            alt.Tooltip("org_fx:Q", title="Tỷ giá ký HĐ", format=',.0f'),
-            # alt.Tooltip("period:O", title="Kỳ hạn")
+            alt.Tooltip('rate:Q', title='Tỷ giá', format=',.0f'),
+            alt.Tooltip('metric:N', title='Chỉ số'),
+            alt.Tooltip('usd:Q', title='USD/m²', format='$,.2f'),
         ],
-        fillOpacity=op_condition, 
-        strokeOpacity=alt.value(1), 
-        stroke=stroke_color_condition, 
-        strokeWidth=stroke_width_condition 
-    ).properties(
-        title='Phân Bổ Diện Tích Thuê theo Tầng (Chi Tiết)',
-        width=alt.Step(40), 
-        height=700      
-    ).add_params(highlight_selection)
+    )
+    chart = lines
+    if current_rate:
+        rule = alt.Chart(pd.DataFrame({'rate': [current_rate]})).mark_rule(color='#FF0000', strokeDash=[2, 2]).encode(
+            x='rate:Q',
+            tooltip=[alt.Tooltip('rate:Q', title='Tỷ giá hiện tại', format=',.0f')],
+        )
+        chart = lines + rule
+    return chart.properties(title=f'Độ Nhạy Giá USD theo Tỷ Giá ({group_label})', height=350)
+
+
+def create_trend_chart(df_trend, metric, metric_label, group_label='Nhóm'):
+    """
+    Line chart of one metric over time per group, from HistoryStore.query_metrics.
 
-    return chart
+    Args:
+        df_trend (pd.DataFrame): Rows with 'snapshot_date', 'group' and the metric column.
+        metric (str): Column to plot (e.g. 'rental_avg').
+        metric_label (str): Axis and tooltip title of the metric.
+        group_label (str): Legend title of the groups (floor / customer).
+    """
+    import altair as alt
+
+    chart_data = df_trend[['snapshot_date', 'group', metric, 'fx_rate']]
+    return alt.Chart(chart_data).mark_line(point=len(chart_data) <= 500).encode(
+        x=alt.X('snapshot_date:T', title='Ngày', axis=alt.Axis(format='%m/%Y')),
+        y=alt.Y(f'{metric}:Q', title=metric_label, scale=alt.Scale(zero=False)),
+        color=alt.Color('group:N', title=group_label, legend=alt.Legend(orient='bottom')),
+        tooltip=[
+            alt.Tooltip('snapshot_date:T', title='Ngày', format='%d/%m/%Y'),
+            alt.Tooltip('group:N', title=group_label),
+            alt.Tooltip(f'{metric}:Q', title=metric_label, format=',.2f'),
+            alt.Tooltip('fx_rate:Q', title='Tỷ giá', format=',.0f'),
+        ],
+    ).properties(title=f'{metric_label} theo thời gian', height=350)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import pandas as pd
+
+# Bump when the layout of the stored frames changes; older snapshots are then ignored
+SNAPSHOT_SCHEMA_VERSION = 1
+DEFAULT_SNAPSHOT_DIR = os.path.join(".cache", "snapshots")
+# Unreferenced data files younger than this are kept, a replica may be about to open them
+ORPHAN_GRACE_SECONDS = 300
+
+
+def _source_key(source_id):
+    return hashlib.sha1(source_id.encode("utf-8")).hexdigest()[:16]
+
+
+class SnapshotStore:
+    """
+    On-disk snapshots of processed frames, one per data source, shared by app replicas.
+
+    A snapshot is a set of Parquet files plus a JSON sidecar with the metadata and the
+    file names. Data files are written under unique names and never modified; the
+    sidecar is then swapped in with os.replace, so a reader sees either the old or the
+    new snapshot, never a mix, even with several writers on one volume. Frames are
+    read with memory mapping. Superseded files are removed once they are older than
+    ORPHAN_GRACE_SECONDS.
+    """
+
+    def __init__(self, directory=DEFAULT_SNAPSHOT_DIR):
+        self.directory = directory
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def _sidecar_path(self, source_id):
+        return os.path.join(self.directory, f"{_source_key(source_id)}.json")
+
+    def read_metadata(self, source_id):
+        """Returns the sidecar of the source's current snapshot, or None if there is no usable one."""
+        try:
+            with open(self._sidecar_path(source_id), encoding="utf-8") as sidecar_file:
+                sidecar = json.load(sidecar_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.last_error = f"Không đọc được snapshot: {e}"
+            return None
+        if sidecar.get('schema_version') != SNAPSHOT_SCHEMA_VERSION or sidecar.get('source_id') != source_id:
+            return None
+        return sidecar
+
+    def load(self, source_id):
+        """
+        Loads the source's current snapshot.
+
+        Returns:
+            tuple: (frames, metadata) as given to save(), or None if there is no
+                   usable snapshot (missing, other schema version or unreadable).
+        """
+        # A concurrent save may remove the files between reading the sidecar and opening them; retry once
+        for _ in range(2):
+            sidecar = self.read_metadata(source_id)
+            if sidecar is None:
+                return None
+            try:
+                frames = {name: pd.read_parquet(os.path.join(self.directory, file_name), memory_map=True)
+                          for name, file_name in sidecar['files'].items()}
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                self.last_error = f"Không đọc được snapshot: {e}"
+                return None
+            return frames, sidecar['metadata']
+        return None
+
+    def save(self, source_id, frames, metadata):
+        """
+        Writes frames ({name: DataFrame}) and metadata (JSON-serializable dict) as the
+        source's current snapshot.
+
+        Returns:
+            str: Path of the sidecar.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot_id = f"{_source_key(source_id)}-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        files = {}
+        for name, frame in frames.items():
+            file_name = f"{snapshot_id}-{name}.parquet"
+            tmp_path = os.path.join(self.directory, f".{file_name}.tmp")
+            frame.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(self.directory, file_name))
+            files[name] = file_name
+
+        sidecar = {
+            'schema_version': SNAPSHOT_SCHEMA_VERSION,
+            'source_id': source_id,
+            'saved_at': time.time(),
+            'files': files,
+            'metadata': metadata,
+        }
+        sidecar_path = self._sidecar_path(source_id)
+        tmp_path = f"{sidecar_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as sidecar_file:
+            json.dump(sidecar, sidecar_file, ensure_ascii=False)
+        os.replace(tmp_path, sidecar_path)
+        self._remove_orphans(source_id)
+        return sidecar_path
+
+    def _remove_orphans(self, source_id):
+        """Removes this source's data files that the sidecar on disk (possibly another replica's) no longer references."""
+        key = _source_key(source_id)
+        sidecar = self.read_metadata(source_id)
+        current_files = set(sidecar['files'].values()) if sidecar else set()
+        with self._lock:
+            now = time.time()
+            for file_name in os.listdir(self.directory):
+                # Leftover .tmp files of interrupted saves are cleaned up too
+                if not file_name.lstrip('.').startswith(f"{key}-") or file_name in current_files:
+                    continue
+                path = os.path.join(self.directory, file_name)
+                try:
+                    if now - os.path.getmtime(path) >= ORPHAN_GRACE_SECONDS:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass